@@ -0,0 +1,91 @@
+"""
+Import time regression check of the compute-only path of the features package (athlete profile, training load
+and data loading), the path used by scripts and workers that do not plot or write reports.
+
+The imports are timed with 'python -X importtime' in fresh interpreters (best of 'repeat' runs). The check fails,
+with a non-zero exit status, when the cumulative import time exceeds the budget or when one of the plotting,
+report or notebook-only dependencies is imported: these must only be imported by the functions that use them.
+
+Run from the repository root:
+    python -m benchmarks.bench_import_time [--budget-ms 1500] [--repeat 3]
+"""
+import os
+import sys
+import argparse
+import subprocess
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# modules of the compute-only path
+COMPUTE_MODULES = ['features.utils', 'features.athlete_profile']
+
+# dependencies only needed to plot, write the PDF report or in the notebooks
+DEFERRED_MODULES = ['matplotlib', 'seaborn', 'plotly', 'reportlab', 'kaleido', 'ipyleaflet', 'benedict', 'sklearn',
+                    'scipy.signal', 'scipy.optimize']
+
+
+def import_times(modules=COMPUTE_MODULES):
+    """
+    Import 'modules' in a fresh interpreter with -X importtime.
+
+    Returns:
+        dict: cumulative import time in microseconds of every imported module, keyed on the module name.
+    """
+    process = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import ' + ', '.join(modules)],
+                             cwd=REPO_ROOT, capture_output=True, text=True)
+    if process.returncode != 0:
+        raise RuntimeError(process.stderr.strip().splitlines()[-1])
+
+    times = {}
+    for line in process.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        if not line.startswith('import time:') or 'imported package' in line:
+            continue
+        _, cumulative, name = line.split('|')
+        times[name.strip()] = int(cumulative)
+    return times
+
+
+def check(budget_ms=1500, repeat=3, modules=COMPUTE_MODULES, deferred=DEFERRED_MODULES):
+    """
+    Time the import of 'modules' and list the deferred dependencies it pulls in.
+
+    Returns:
+        tuple: (best total import time in ms, list of the deferred modules imported, list of failure messages)
+    """
+    runs = [import_times(modules) for _ in range(repeat)]
+    # the modules are imported one after the other, the top level ones sum to the total
+    best = min(sum(times.get(module, 0) for module in modules) for times in runs) / 1000
+    imported = [name for name in deferred
+                if any(module == name or module.startswith(name + '.') for module in runs[0])]
+
+    failures = []
+    if best > budget_ms:
+        failures.append(f"import of {', '.join(modules)} took {best:.0f} ms, over the {budget_ms:.0f} ms budget")
+    if imported:
+        failures.append(f"deferred dependencies imported: {', '.join(imported)}")
+    return best, imported, failures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--budget-ms', type=float, default=1500, help="maximum import time of the compute-only path")
+    parser.add_argument('--repeat', type=int, default=3, help="fresh interpreters timed, the best one is kept")
+    args = parser.parse_args(argv)
+
+    best, imported, failures = check(args.budget_ms, args.repeat)
+    print(f"import {', '.join(COMPUTE_MODULES)}: {best:.0f} ms (budget {args.budget_ms:.0f} ms)")
+
+    # heaviest modules of the last run, the first ones to look at after a regression
+    times = import_times()
+    top = sorted(((t, name) for name, t in times.items() if '.' not in name), reverse=True)[:8]
+    for t, name in top:
+        print(f"{t / 1000:>10.1f} ms  {name}")
+
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
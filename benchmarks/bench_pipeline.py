@@ -0,0 +1,207 @@
+"""
+Benchmark of the analytics pipeline stages on synthetic activity histories of increasing size.
+
+Every stage is timed (best wall time over 'repeat' runs) and its peak memory measured with tracemalloc, the results
+are written to a JSON file recording the git commit so that two commits can be compared.
+
+Run from the repository root:
+    python -m benchmarks.bench_pipeline [--sizes 100 1000 10000] [--output results.json] [--baseline old.json]
+    python -m benchmarks.bench_pipeline --compare old.json new.json
+"""
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import datetime
+import tempfile
+import tracemalloc
+import subprocess
+
+import pandas as pd
+
+from features.utils import loadData, create_sub_df
+from features import athlete_profile, utils
+from features.athlete_profile import (calculate_hr_zones_RE, calculate_time_in_zones_RE, intensity_score,
+                                      calculate_new_relative_effort, training_load_measure, HRR, trimp, HRSS,
+                                      calculate_fitness, calculate_fatigue, calculate_form)
+from features.generate_pdf import generate_activity_pdf
+from features.synthetic import generate_corpus
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def git_commit():
+    """
+    Commit hash of the repository and whether the working tree has uncommitted changes.
+    """
+    def git(*args):
+        return subprocess.run(['git', *args], cwd=REPO_ROOT, capture_output=True, text=True).stdout.strip()
+    return git('rev-parse', 'HEAD') or None, bool(git('status', '--porcelain', '--untracked-files=no'))
+
+
+def _clear_caches():
+    """
+    Drop the in-process caches of the pipeline, so every run measures a computation without memoized results.
+    The on-disk cache of loadData is kept: it is what repeated report and notebook runs use.
+    """
+    for module, cache in [(athlete_profile, '_PMC_CACHE'), (utils, '_ride_data_memo')]:
+        if hasattr(module, cache):
+            getattr(module, cache).clear()
+
+
+def _pdf(_, context):
+    # inputs read by activity_dive_in_dataset
+    context['zone_data'].to_csv('data/zone_data_6.csv')
+    context['form'].to_csv('data/athlete_profile_dataset.csv')
+    date = str(pd.to_datetime(context['form']['Date']).iloc[-1].date())
+    generate_activity_pdf(date, saving_name=os.path.join('visuals', 'activity_metrics.pdf'))
+
+
+# (stage, input stage, function) run in order, each stage gets a copy of the output of its input stage
+STAGES = [
+    ('loadData', None, lambda _, context: loadData()),
+    ('create_sub_df', 'loadData', lambda df, context: create_sub_df(df)),
+    ('calculate_time_in_zones_RE', 'create_sub_df', lambda df, context: calculate_time_in_zones_RE(df, calculate_hr_zones_RE(190))),
+    ('calculate_new_relative_effort', 'calculate_time_in_zones_RE',
+     lambda df, context: calculate_new_relative_effort(intensity_score(df, 'Puissance moyenne pondérée', 405))),
+    ('HRSS', 'calculate_new_relative_effort', lambda df, context: HRSS(trimp(HRR(training_load_measure(df, 405), 65, 190)))),
+    ('calculate_fitness', 'HRSS', lambda df, context: calculate_fitness(df)[0]),
+    ('calculate_fatigue', 'calculate_fitness', lambda df, context: calculate_fatigue(df)[0]),
+    ('calculate_form', 'calculate_fatigue', lambda df, context: calculate_form(df)),
+    ('generate_activity_pdf', 'calculate_form', _pdf),
+]
+
+# names under which the outputs needed by later stages are kept
+KEEP = {'calculate_time_in_zones_RE': 'zone_data', 'calculate_form': 'form'}
+
+
+def measure(function, df, context, repeat):
+    """
+    Best wall time over 'repeat' runs, then peak traced memory of one more run, of a stage.
+
+    Returns:
+        tuple: (output of the last run, best wall time in seconds, peak memory in MB)
+    """
+    best = float('inf')
+    for _ in range(repeat):
+        _clear_caches()
+        data = None if df is None else df.copy()
+        start = time.perf_counter()
+        function(data, context)
+        best = min(best, time.perf_counter() - start)
+
+    _clear_caches()
+    data = None if df is None else df.copy()
+    tracemalloc.start()
+    try:
+        output = function(data, context)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return output, best, peak / 2 ** 20
+
+
+def corpus_directory(workdir, size, seed, min_hours, max_hours, n_workers):
+    """
+    Directory laid out as the repository root (data/, visuals/, logo) holding a synthetic corpus, generated once.
+    """
+    root = os.path.join(workdir, f"corpus_{size}_{seed}_{min_hours}-{max_hours}h")
+    if not os.path.exists(os.path.join(root, 'data', 'activities.csv')):
+        start = time.perf_counter()
+        generate_corpus(os.path.join(root, 'data'), n_activities=size, formats=('csv',), seed=seed,
+                        min_hours=min_hours, max_hours=max_hours, n_workers=n_workers)
+        print(f"generated {size} activities in {time.perf_counter() - start:.1f} s")
+    os.makedirs(os.path.join(root, 'visuals'), exist_ok=True)
+    if not os.path.exists(os.path.join(root, 'th.jpeg')):
+        os.symlink(os.path.join(REPO_ROOT, 'th.jpeg'), os.path.join(root, 'th.jpeg'))
+    return root
+
+
+def run(sizes, repeat=1, seed=0, min_hours=1, max_hours=6, workdir=None, n_workers=None):
+    """
+    Run every stage on a corpus of each size.
+
+    Returns:
+        dict: Benchmark metadata and one result per size and stage, with its wall time, peak memory and status.
+    """
+    workdir = workdir or tempfile.mkdtemp(prefix='bench_pipeline_')
+    commit, dirty = git_commit()
+    report = {'commit': commit, 'dirty': dirty, 'created': datetime.datetime.now().isoformat(timespec='seconds'),
+              'python': platform.python_version(), 'repeat': repeat, 'seed': seed,
+              'ride_hours': [min_hours, max_hours], 'results': []}
+
+    cwd = os.getcwd()
+    for size in sizes:
+        root = corpus_directory(workdir, size, seed, min_hours, max_hours, n_workers)
+        os.chdir(root)
+        try:
+            outputs, context = {}, {}
+            for stage, input_stage, function in STAGES:
+                result = {'size': size, 'stage': stage, 'wall_s': None, 'peak_mb': None, 'status': 'ok', 'error': None}
+                if input_stage is not None and input_stage not in outputs:
+                    result['status'] = 'skipped'
+                else:
+                    try:
+                        output, wall, peak = measure(function, outputs.get(input_stage), context, repeat)
+                        outputs[stage] = output
+                        if stage in KEEP:
+                            context[KEEP[stage]] = output
+                        result.update(wall_s=round(wall, 6), peak_mb=round(peak, 3))
+                    except Exception as error:
+                        result.update(status='error', error=f"{type(error).__name__}: {error}")
+                report['results'].append(result)
+                print(f"{size:>6} {stage:<32} {result['status']:<8}"
+                      + (f"{result['wall_s']:>10.3f} s {result['peak_mb']:>10.1f} MB" if result['status'] == 'ok' else ''))
+        finally:
+            os.chdir(cwd)
+    return report
+
+
+def compare(baseline, report):
+    """
+    Print the wall time and peak memory of each stage against a baseline report.
+    """
+    old = {(r['size'], r['stage']): r for r in baseline['results']}
+    print(f"baseline {baseline['commit']} -> {report['commit']}")
+    print(f"{'size':>6} {'stage':<32} {'wall before':>12} {'wall after':>12} {'speedup':>8} {'peak before':>12} {'peak after':>12}")
+    for r in report['results']:
+        b = old.get((r['size'], r['stage']))
+        if b is None or r['status'] != 'ok' or b['status'] != 'ok':
+            continue
+        speedup = b['wall_s'] / r['wall_s'] if r['wall_s'] else float('inf')
+        print(f"{r['size']:>6} {r['stage']:<32} {b['wall_s']:>10.3f} s {r['wall_s']:>10.3f} s {speedup:>7.1f}x "
+              f"{b['peak_mb']:>9.1f} MB {r['peak_mb']:>9.1f} MB")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100, 1000, 10000], help="number of activities of each corpus")
+    parser.add_argument('--repeat', type=int, default=1, help="timed runs of each stage, the best one is kept")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--min-hours', type=float, default=1)
+    parser.add_argument('--max-hours', type=float, default=6)
+    parser.add_argument('--workdir', help="directory keeping the generated corpora between runs (default: a new temporary one)")
+    parser.add_argument('--n-workers', type=int, default=None, help="processes generating the corpora (default: one per CPU)")
+    parser.add_argument('--output', default='bench_pipeline.json', help="JSON file of the results")
+    parser.add_argument('--baseline', help="JSON results of another commit to compare with")
+    parser.add_argument('--compare', nargs=2, metavar=('BASELINE', 'RESULTS'), help="only compare two JSON results")
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        with open(args.compare[0]) as f, open(args.compare[1]) as g:
+            compare(json.load(f), json.load(g))
+        return
+
+    report = run(args.sizes, args.repeat, args.seed, args.min_hours, args.max_hours, args.workdir, args.n_workers)
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=1)
+    print(f"results written to {args.output}")
+    if args.baseline:
+        with open(args.baseline) as f:
+            compare(json.load(f), report)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
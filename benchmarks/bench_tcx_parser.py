@@ -0,0 +1,70 @@
+"""
+Benchmark of the streaming TCX reader of features/create_csv.py against the former TCXReader path.
+
+Run from the repository root:
+    python -m benchmarks.bench_tcx_parser [tcx_directory] [repeat]
+"""
+import os
+import sys
+import time
+
+import pandas as pd
+from tcxreader.tcxreader import TCXReader
+
+from features.create_csv import _tcx_to_dataframe
+
+
+def tcxreader_to_dataframe(file_location):
+    """
+    Former TCX path: TCXReader materialises every trackpoint then one list comprehension runs per column.
+    """
+    tcx_reader = TCXReader()
+    data = tcx_reader.read(file_location)
+
+    return pd.DataFrame({
+        "time": [tp.time for tp in data.trackpoints],
+        "latitude": [tp.latitude for tp in data.trackpoints],
+        "longitude": [tp.longitude for tp in data.trackpoints],
+        "altitude_meters": [tp.elevation for tp in data.trackpoints],
+        "distance_meters": [tp.distance for tp in data.trackpoints],
+        "heart_rate_bpm": [tp.hr_value for tp in data.trackpoints],
+        "cadence_rpm": [tp.cadence for tp in data.trackpoints],
+        "speed_mps": [tp.tpx_ext.get('Speed', None) for tp in data.trackpoints]
+    })
+
+
+def time_reader(reader, files, repeat):
+    """
+    Best wall time, over 'repeat' runs, to read all the files with 'reader'.
+    """
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for file in files:
+            reader(file)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main(directory="tcx_files_generated/", repeat=5):
+    files = sorted(os.path.join(directory, f) for f in os.listdir(directory) if f.endswith('.tcx'))
+
+    # both readers must return the same trackpoints, except for the files without GPS that TCXReader empties
+    for file in files:
+        expected = tcxreader_to_dataframe(file)
+        result = _tcx_to_dataframe(file)
+        if expected.empty:
+            continue
+        assert len(expected) == len(result), file
+        assert (pd.to_datetime(expected['time']).to_numpy() == result['time'].to_numpy()).all(), file
+        assert (expected['heart_rate_bpm'].fillna(-1).to_numpy() == result['heart_rate_bpm'].fillna(-1).to_numpy()).all(), file
+
+    legacy = time_reader(tcxreader_to_dataframe, files, repeat)
+    streaming = time_reader(_tcx_to_dataframe, files, repeat)
+    print(f"{len(files)} files from {directory}")
+    print(f"TCXReader + list comprehensions: {legacy * 1000:.1f} ms")
+    print(f"streaming reader:                {streaming * 1000:.1f} ms ({legacy / streaming:.1f}x)")
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:2], *[int(arg) for arg in sys.argv[2:3]])
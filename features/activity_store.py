@@ -0,0 +1,140 @@
+import os
+import importlib.util
+
+import pandas as pd
+
+# pyarrow is optional: without it the activities are only stored and read as .csv files
+HAS_PYARROW = importlib.util.find_spec("pyarrow") is not None
+
+# Timestamp columns written by the FIT, GPX and TCX converters
+TIME_COLUMNS = ['timestamp', 'time']
+
+
+################################################################### COLUMNAR ACTIVITY STORE ##################################################################
+def columnar_path(activity_file):
+    """
+    Path of the columnar (.parquet) copy of an activity .csv file, stored next to it.
+
+    Args:
+        activity_file (str): Path to the activity .csv file, e.g. 'data/activities_csv/1234.csv'.
+
+    Returns:
+        str: Path to the .parquet file, e.g. 'data/activities_csv/1234.parquet'.
+    """
+    return os.path.splitext(activity_file)[0] + '.parquet'
+
+
+def _typed_trackpoints(df):
+    """
+    Give the trackpoint columns their real types before they are stored: datetimes for the timestamps,
+    numbers for the numeric columns read as text and the smallest integer type for the integer channels.
+
+    Args:
+        df (pandas.DataFrame): Trackpoints of one activity.
+
+    Returns:
+        pandas.DataFrame: Typed copy of the trackpoints.
+    """
+    df = df.copy()
+    for col in df.columns:
+        if col in TIME_COLUMNS:
+            df[col] = pd.to_datetime(df[col], utc=True, errors='coerce')
+        elif df[col].dtype == object:
+            numeric = pd.to_numeric(df[col], errors='coerce')
+            if numeric.notna().sum() == df[col].notna().sum():
+                df[col] = numeric
+            else:
+                df[col] = df[col].astype('string')
+        if pd.api.types.is_integer_dtype(df[col]):
+            df[col] = pd.to_numeric(df[col], downcast='integer')
+    return df
+
+
+def write_activity_columnar(df, activity_file, compression='zstd'):
+    """
+    Write the compressed columnar copy of an activity next to its .csv file.
+
+    Args:
+        df (pandas.DataFrame): Trackpoints of one activity.
+        activity_file (str): Path to the activity .csv file.
+        compression (str): Parquet compression codec. Default is 'zstd'.
+
+    Returns:
+        str: Path of the written .parquet file, or None when pyarrow is not installed or the columns
+             could not be converted (the activity is then only available as .csv).
+    """
+    if not HAS_PYARROW:
+        return None
+    import pyarrow
+
+    parquet_file = columnar_path(activity_file)
+    try:
+        _typed_trackpoints(df).to_parquet(parquet_file, index=False, compression=compression)
+    except (pyarrow.ArrowException, ValueError, TypeError):
+        if os.path.exists(parquet_file):
+            os.remove(parquet_file)
+        return None
+    return parquet_file
+
+
+def columnar_is_current(activity_file):
+    """
+    Whether the columnar copy of an activity exists and is not older than its .csv file, so that a .csv file
+    rewritten by another writer (a new export, the synthetic corpus generator) is not hidden by a stale copy.
+
+    Args:
+        activity_file (str): Path to the activity .csv file.
+
+    Returns:
+        bool: True when the .parquet file can be read instead of the .csv file.
+    """
+    parquet_file = columnar_path(activity_file)
+    if not os.path.exists(parquet_file):
+        return False
+    return not os.path.exists(activity_file) or os.path.getmtime(parquet_file) >= os.path.getmtime(activity_file)
+
+
+def load_activity(activity_file, columns=None):
+    """
+    Load the trackpoints of an activity, from its .parquet copy when it is up to date (see columnar_is_current) and
+    from the .csv file otherwise.
+
+    Args:
+        activity_file (str): Path to the activity .csv file, e.g. 'data/activities_csv/1234.csv'.
+        columns (list): Columns to read, e.g. ['timestamp', 'heart_rate']. Requested columns missing from the file
+                        are ignored so alternative names can be asked for at once. Default is None (all columns).
+
+    Returns:
+        pandas.DataFrame: Trackpoints of the activity.
+    """
+    parquet_file = columnar_path(activity_file)
+    if HAS_PYARROW and columnar_is_current(activity_file):
+        if columns is not None:
+            import pyarrow.parquet as pq
+            available = pq.read_schema(parquet_file).names
+            columns = [col for col in columns if col in available]
+        return pd.read_parquet(parquet_file, columns=columns)
+
+    usecols = None if columns is None else (lambda col: col in columns)
+    return pd.read_csv(activity_file, usecols=usecols)
+
+
+def build_columnar_store(csv_directory="data/activities_csv/"):
+    """
+    Write the columnar copy of every activity .csv file of a directory that does not have an up to date one yet.
+
+    Args:
+        csv_directory (str): Directory containing the activity .csv files. Default is 'data/activities_csv/'.
+
+    Returns:
+        int: Number of .parquet files written.
+    """
+    written = 0
+    for file in os.listdir(csv_directory):
+        if file.endswith('.csv'):
+            activity_file = os.path.join(csv_directory, file)
+            if columnar_is_current(activity_file):
+                continue
+            if write_activity_columnar(pd.read_csv(activity_file), activity_file) is not None:
+                written += 1
+    return written
@@ -1,6 +1,14 @@
+import os
+import json
+import hashlib
 import pandas as pd
 import numpy as np
 import math 
+from collections import Counter, OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+from features.activity_store import load_activity
+from features.utils import _atomic_write_json
 
 
 ######################################### HEART RATE ZONES ##########################################################
@@ -112,237 +120,272 @@ def intensity_score(df, power_col, ftp):
 
 ############################################# TIME IN HEART RATE ZONES ###############################################
 
-def calculate_time_in_zones(df, hr_data):
+def sample_weights(timestamps, max_gap=10):
+    """
+    Weight each sample of an activity by the time elapsed until the next sample, so that zone shares follow the time
+    and not the number of rows of auto-paused or smart-recording files. Gaps longer than max_gap (pauses) are capped.
+    Missing timestamps between two valid ones are interpolated, the samples before the first or after the last valid
+    timestamp get no weight.
+
+    Args:
+    - timestamps (array-like): Sample timestamps, as datetimes, date strings or seconds.
+    - max_gap (float): Maximum weight of a sample in seconds. Default is 10.
+
+    Returns:
+    - numpy.ndarray: Weight of each sample in seconds. The last timed sample gets the median weight of the others.
+      Every sample counts 1 when fewer than two timestamps are valid.
+    """
+    timestamps = pd.Series(timestamps)
+    if pd.api.types.is_numeric_dtype(timestamps):
+        seconds = timestamps.to_numpy(dtype=float)
+    else:
+        seconds = pd.to_datetime(timestamps).to_numpy(dtype='datetime64[ns]').astype('int64') / 1e9
+        seconds[timestamps.isna().to_numpy()] = np.nan
+    timed = np.flatnonzero(~np.isnan(seconds))
+    if len(timed) < 2:
+        return np.ones(len(seconds))
+
+    # Interpolate the missing timestamps between the first and the last valid ones
+    first, last = timed[0], timed[-1]
+    seconds = np.interp(np.arange(first, last + 1), timed, seconds[timed])
+
+    weights = np.zeros(len(timestamps))
+    weights[first:last] = np.clip(np.diff(seconds), 0, max_gap)
+    weights[last] = np.median(weights[first:last])
+    return weights
+
+def time_in_hr_zones(heart_rate, hr_data, weights=None):
+    """
+    Bin a whole heart rate array into the zones of a zone table at once and compute the share of time and the
+    average heart rate of each zone. A sample lying exactly on a zone boundary counts in the upper zone, samples
+    below the first boundary count in the first zone and samples above the last one in the last zone.
+
+    Args:
+    - heart_rate (array-like): Heart rate samples of an activity, NaN samples are in no zone.
+    - hr_data (pandas.DataFrame): Zone table from calculate_hr_zones_hrmax, calculate_hr_zones_RE or
+      calculate_hr_zones_elevate, with any number of zones.
+    - weights (array-like): Weight of each sample, e.g. from sample_weights. Default is None (every sample counts 1).
+
+    Returns:
+    - pandas.DataFrame: One row per zone with the 'Zone', 'Count' (sum of the weights), 'perc' (share of the total
+      weight, rounded to 2 decimals) and 'avg_HR' (weighted, 0 for an empty zone) columns.
+    """
+    heart_rate = np.asarray(heart_rate, dtype=float)
+    weights = np.ones(len(heart_rate)) if weights is None else np.asarray(weights, dtype=float)
+    n_zones = len(hr_data)
+
+    # Boundaries between consecutive zones
+    edges = hr_data["Upper Bound"].to_numpy(dtype=float)[:-1]
+    valid = ~np.isnan(heart_rate)
+    zones = np.searchsorted(edges, heart_rate[valid], side='right')
+
+    counts = np.bincount(zones, weights=weights[valid], minlength=n_zones)
+    hr_sums = np.bincount(zones, weights=heart_rate[valid] * weights[valid], minlength=n_zones)
+    total = weights.sum()
+    perc = np.round(counts / total, 2) if total > 0 else np.zeros(n_zones)
+    avg_hr = np.divide(hr_sums, counts, out=np.zeros(n_zones), where=counts > 0)
+
+    return pd.DataFrame({'Zone': hr_data["Zone"].to_numpy(), 'Count': counts, 'perc': perc, 'avg_HR': avg_hr})
+
+def _activity_hr_data(row):
+    """
+    Load the timestamp and heart rate samples of the activity of a row of the activities DataFrame.
+
+    Args:
+    - row (pandas.Series): Activity row, with a "Nom du fichier" column for the Strava export activities or a 'nom'
+      column for the Strava API test activities.
+
+    Returns:
+    - pandas.DataFrame: Samples with the 'timestamp' and 'heart_rate' columns.
+    """
+    # Extract activity id from the file name column
+    if "Nom du fichier" in row:
+        activity_num = str(row["Nom du fichier"]).split("/")[-1].split(".")[0]
+        # Load the activity data
+        activity_file = f"data/activities_csv/{activity_num}.csv"
+    else:
+        activity_num = row['nom']
+        activity_file = f"data/strava_test_csv/{activity_num}.csv"
+        
+    csv_data = load_activity(activity_file, columns=['timestamp', 'heart_rate', 'time', 'heart_rate_bpm'])
+    # Check if the original column names exist
+    if 'timestamp' in csv_data.columns and 'heart_rate' in csv_data.columns:
+        csv_data = csv_data[['timestamp', 'heart_rate']]
+    else:
+        # Use alternative column names
+        csv_data = csv_data[['time', 'heart_rate_bpm']]
+        csv_data = csv_data.rename(columns={'time': 'timestamp', 'heart_rate_bpm': 'heart_rate'})
+
+    return csv_data
+
+def _activity_time_in_zones(task):
+    """
+    Zone shares and average heart rates of one activity, as one flat row: the time_z* then the avgHR_z* values.
+    Module level so that it can run in worker processes.
+    """
+    row, hr_data, weighting, max_gap = task
+    csv_data = _activity_hr_data(row)
+    weights = sample_weights(csv_data["timestamp"], max_gap) if weighting == 'time' else None
+    zones = time_in_hr_zones(csv_data["heart_rate"], hr_data, weights)
+    return np.concatenate([zones["perc"].to_numpy(), zones["avg_HR"].to_numpy()])
+
+def calculate_time_in_zones_batch(df, hr_data, n_workers=1, weighting='samples', max_gap=10):
+    """
+    Calculate the time spent in each heart rate zone for every activity of the history, loading and binning the
+    activities in worker processes, and add the results as columns in a single assignment.
+
+    Args:
+    - df (pandas.DataFrame): A DataFrame containing information about each activity.
+    - hr_data (pandas.DataFrame): A DataFrame containing the heart rate zones and corresponding upper and lower bounds.
+    - n_workers (int): Number of worker processes. 1 (default) computes in the current process, None uses one worker
+      per CPU.
+    - weighting (str): 'samples' (default) counts every sample once, 'time' weights each sample by the time elapsed
+      until the next one (see sample_weights).
+    - max_gap (float): Maximum weight of a sample in seconds with the 'time' weighting. Default is 10.
+
+    Returns:
+    - df (pandas.DataFrame): The original DataFrame with the time_z* and avgHR_z* columns of every zone.
+    """
+    # Only the column locating the activity file is sent to the workers
+    file_col = "Nom du fichier" if "Nom du fichier" in df.columns else 'nom'
+    tasks = [({file_col: name}, hr_data, weighting, max_gap) for name in df[file_col]]
+
+    if n_workers == 1:
+        rows = [_activity_time_in_zones(task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=n_workers) as executor:
+            rows = list(executor.map(_activity_time_in_zones, tasks, chunksize=8))
+
+    zones = list(hr_data["Zone"])
+    matrix = np.vstack(rows) if rows else np.empty((0, 2 * len(zones)))
+    time_cols = [f"time_z{zone}" for zone in zones]
+    avg_cols = [f"avgHR_z{zone}" for zone in zones]
+
+    # Same column order as the former per row writes: time_z1, avgHR_z1, time_z2, ...
+    results = pd.DataFrame(matrix, index=df.index, columns=time_cols + avg_cols)
+    ordered = [col for pair in zip(time_cols, avg_cols) for col in pair]
+    df[ordered] = results[ordered]
+
+    return df
+
+def calculate_time_in_zones(df, hr_data, weighting='samples', max_gap=10, n_workers=1):
     """
     Calculate the time spent in each heart rate zone for each activity and add the results as columns.
     
     Args:
     - df (pandas.DataFrame): A DataFrame containing information about each activity.
     - hr_data (pandas.DataFrame): A DataFrame containing the heart rate zones and corresponding upper and lower bounds.
+    - weighting (str): 'samples' (default) counts every sample once, 'time' weights each sample by the time elapsed
+      until the next one (see sample_weights).
+    - max_gap (float): Maximum weight of a sample in seconds with the 'time' weighting. Default is 10.
+    - n_workers (int): Number of worker processes, see calculate_time_in_zones_batch. Default is 1.
     
     Returns:
     - df (pandas.DataFrame): The original DataFrame with new columns for the time spent in each heart rate zone.
     """
-        
-    # Loop through the rows in df and calculate time spent in each zone for the corresponding activity
-    for index, row in df.iterrows():    
-    # Extract activity id from the file name column
-        if "Nom du fichier" in row:
-            activity_num = str(row["Nom du fichier"]).split("/")[-1].split(".")[0]
-            # Load the activity data
-            activity_file = f"data/activities_csv/{activity_num}.csv"
-        else:
-            activity_num = row['nom']
-            activity_file = f"data/strava_test_csv/{activity_num}.csv"
-            
-        csv_data = pd.read_csv(activity_file)
-        # Check if the original column names exist
-        if 'timestamp' in csv_data.columns and 'heart_rate' in csv_data.columns:
-            csv_data = csv_data[['timestamp', 'heart_rate']]
-        else:
-            # Use alternative column names
-            csv_data = csv_data[['time', 'heart_rate_bpm']]
-            csv_data = csv_data.rename(columns={'time': 'timestamp', 'heart_rate_bpm': 'heart_rate'})
-
-        # Calculate the time spent in each zone
-        for index_2, row_2 in csv_data.iterrows():
-            if row_2["heart_rate"] < hr_data["Upper Bound"].iloc[0]:
-                csv_data.loc[index_2, "Zone"] = hr_data["Zone"].iloc[0]
-            elif hr_data["Lower Bound"].iloc[1] < row_2["heart_rate"] < hr_data["Upper Bound"].iloc[1]:
-                csv_data.loc[index_2, "Zone"] = hr_data["Zone"].iloc[1]
-            elif hr_data["Lower Bound"].iloc[2] < row_2["heart_rate"] < hr_data["Upper Bound"].iloc[2]:
-                csv_data.loc[index_2, "Zone"] = hr_data["Zone"].iloc[2]
-            elif hr_data["Lower Bound"].iloc[3] < row_2["heart_rate"] < hr_data["Upper Bound"].iloc[3]:
-                csv_data.loc[index_2, "Zone"] = hr_data["Zone"].iloc[3]
-            elif row_2["heart_rate"] > hr_data["Lower Bound"].iloc[4]:
-                csv_data.loc[index_2, "Zone"] = hr_data["Zone"].iloc[4]
-
-        # Group by zone and calculate the percentage of time spent in each zone
-        csv_grouped = csv_grouped = csv_data.groupby("Zone").agg({'timestamp':'count', 'heart_rate':'mean'}).rename(columns={"timestamp": "Count", "heart_rate": 'avg_HR'}).reset_index()
-        csv_grouped['perc'] = round(csv_grouped['Count'] / len(csv_data), 2)
-        
-
-        # Add new columns with time spent in each zone to df
-        try:
-            df.loc[index, "time_z1"] = csv_grouped[csv_grouped["Zone"] == 1]["perc"].values[0]
-            df.loc[index, "avgHR_z1"] = csv_grouped[csv_grouped["Zone"] == 1]["avg_HR"].values[0]
-        except IndexError:
-            df.loc[index, "time_z1"] = 0
-            df.loc[index, "avgHR_z1"] = 0
-        try:
-            df.loc[index, "time_z2"] = csv_grouped[csv_grouped["Zone"] == 2]["perc"].values[0]
-            df.loc[index, "avgHR_z2"] = csv_grouped[csv_grouped["Zone"] == 2]["avg_HR"].values[0]
-        except IndexError:
-            df.loc[index, "time_z2"] = 0
-            df.loc[index, "avgHR_z2"] = 0
-        try:
-            df.loc[index, "time_z3"] = csv_grouped[csv_grouped["Zone"] == 3]["perc"].values[0]
-            df.loc[index, "avgHR_z3"] = csv_grouped[csv_grouped["Zone"] == 3]["avg_HR"].values[0]
-        except IndexError:
-            df.loc[index, "time_z3"] = 0
-            df.loc[index, "avgHR_z3"] = 0
-        try:
-            df.loc[index, "time_z4"] = csv_grouped[csv_grouped["Zone"] == 4]["perc"].values[0]
-            df.loc[index, "avgHR_z4"] = csv_grouped[csv_grouped["Zone"] == 4]["avg_HR"].values[0]
-        except IndexError:
-            df.loc[index, "time_z4"] = 0
-            df.loc[index, "avgHR_z4"] = 0
-        try:
-            df.loc[index, "time_z5"] = csv_grouped[csv_grouped["Zone"] == 5]["perc"].values[0]
-            df.loc[index, "avgHR_z5"] = csv_grouped[csv_grouped["Zone"] == 5]["avg_HR"].values[0]
-        except IndexError:
-            df.loc[index, "time_z5"] = 0
-            df.loc[index, "avgHR_z5"] = 0
-    
-    return df
+    return calculate_time_in_zones_batch(df, hr_data, n_workers, weighting, max_gap)
 
-def calculate_time_in_zones_RE(df, hr_data):
+def calculate_time_in_zones_RE(df, hr_data, weighting='samples', max_gap=10, n_workers=1):
     """
     Calculate the time spent in each heart rate zone for each activity and add the results as columns, useful for Coggan Model
     
     Args:
     - df (pandas.DataFrame): A DataFrame containing information about each activity.
     - hr_data (pandas.DataFrame): A DataFrame containing the heart rate zones and corresponding upper and lower bounds.
+    - weighting (str): 'samples' (default) counts every sample once, 'time' weights each sample by the time elapsed
+      until the next one (see sample_weights).
+    - max_gap (float): Maximum weight of a sample in seconds with the 'time' weighting. Default is 10.
+    - n_workers (int): Number of worker processes, see calculate_time_in_zones_batch. Default is 1.
     
     Returns:
     - df (pandas.DataFrame): The original DataFrame with new columns for the time spent in each heart rate zone.
     """
-        
-    # Loop through the rows in df and calculate time spent in each zone for the corresponding activity
-    for index, row in df.iterrows():    
-    # Extract activity id from the file name column
-        if "Nom du fichier" in row:
-            activity_num = str(row["Nom du fichier"]).split("/")[-1].split(".")[0]
-            # Load the activity data
-            activity_file = f"data/activities_csv/{activity_num}.csv"
-        else:
-            activity_num = row['nom']
-            activity_file = f"data/strava_test_csv/{activity_num}.csv"
-            
-        csv_data = pd.read_csv(activity_file)
-        # Check if the original column names exist
-        if 'timestamp' in csv_data.columns and 'heart_rate' in csv_data.columns:
-            csv_data = csv_data[['timestamp', 'heart_rate']]
-        else:
-            # Use alternative column names
-            csv_data = csv_data[['time', 'heart_rate_bpm']]
-            csv_data = csv_data.rename(columns={'time': 'timestamp', 'heart_rate_bpm': 'heart_rate'})
-
-        # Calculate the time spent in each zone
-        for index_2, row_2 in csv_data.iterrows():
-            if row_2["heart_rate"] < hr_data["Upper Bound"].iloc[0]:
-                csv_data.loc[index_2, "Zone"] = hr_data["Zone"].iloc[0]
-            elif hr_data["Lower Bound"].iloc[1] < row_2["heart_rate"] < hr_data["Upper Bound"].iloc[1]:
-                csv_data.loc[index_2, "Zone"] = hr_data["Zone"].iloc[1]
-            elif hr_data["Lower Bound"].iloc[2] < row_2["heart_rate"] < hr_data["Upper Bound"].iloc[2]:
-                csv_data.loc[index_2, "Zone"] = hr_data["Zone"].iloc[2]
-            elif hr_data["Lower Bound"].iloc[3] < row_2["heart_rate"] < hr_data["Upper Bound"].iloc[3]:
-                csv_data.loc[index_2, "Zone"] = hr_data["Zone"].iloc[3]
-            elif hr_data["Lower Bound"].iloc[4] < row_2["heart_rate"] < hr_data["Upper Bound"].iloc[4]:
-                csv_data.loc[index_2, "Zone"] = hr_data["Zone"].iloc[4]
-            elif hr_data["Lower Bound"].iloc[5] < row_2["heart_rate"] < hr_data["Upper Bound"].iloc[5]:
-                csv_data.loc[index_2, "Zone"] = hr_data["Zone"].iloc[5]
-            elif row_2["heart_rate"] > hr_data["Lower Bound"].iloc[6]:
-                csv_data.loc[index_2, "Zone"] = hr_data["Zone"].iloc[6]
-
-        # Group by zone and calculate the percentage of time spent in each zone
-        csv_grouped = csv_grouped = csv_data.groupby("Zone").agg({'timestamp':'count', 'heart_rate':'mean'}).rename(columns={"timestamp": "Count", "heart_rate": 'avg_HR'}).reset_index()
-        csv_grouped['perc'] = round(csv_grouped['Count'] / len(csv_data), 2)
-        
-
-        # Add new columns with time spent in each zone to df
-        try:
-            df.loc[index, "time_z1"] = csv_grouped[csv_grouped["Zone"] == 1]["perc"].values[0]
-            df.loc[index, "avgHR_z1"] = csv_grouped[csv_grouped["Zone"] == 1]["avg_HR"].values[0]
-        except IndexError:
-            df.loc[index, "time_z1"] = 0
-            df.loc[index, "avgHR_z1"] = 0
-        try:
-            df.loc[index, "time_z2"] = csv_grouped[csv_grouped["Zone"] == 2]["perc"].values[0]
-            df.loc[index, "avgHR_z2"] = csv_grouped[csv_grouped["Zone"] == 2]["avg_HR"].values[0]
-        except IndexError:
-            df.loc[index, "time_z2"] = 0
-            df.loc[index, "avgHR_z2"] = 0
-        try:
-            df.loc[index, "time_z3"] = csv_grouped[csv_grouped["Zone"] == 3]["perc"].values[0]
-            df.loc[index, "avgHR_z3"] = csv_grouped[csv_grouped["Zone"] == 3]["avg_HR"].values[0]
-        except IndexError:
-            df.loc[index, "time_z3"] = 0
-            df.loc[index, "avgHR_z3"] = 0
-        try:
-            df.loc[index, "time_z4"] = csv_grouped[csv_grouped["Zone"] == 4]["perc"].values[0]
-            df.loc[index, "avgHR_z4"] = csv_grouped[csv_grouped["Zone"] == 4]["avg_HR"].values[0]
-        except IndexError:
-            df.loc[index, "time_z4"] = 0
-            df.loc[index, "avgHR_z4"] = 0
-        try:
-            df.loc[index, "time_z5"] = csv_grouped[csv_grouped["Zone"] == 5]["perc"].values[0]
-            df.loc[index, "avgHR_z5"] = csv_grouped[csv_grouped["Zone"] == 5]["avg_HR"].values[0]
-        except IndexError:
-            df.loc[index, "time_z5"] = 0
-            df.loc[index, "avgHR_z5"] = 0
-        try:
-            df.loc[index, "time_z6"] = csv_grouped[csv_grouped["Zone"] == 6]["perc"].values[0]
-            df.loc[index, "avgHR_z6"] = csv_grouped[csv_grouped["Zone"] == 6]["avg_HR"].values[0]
-        except IndexError:
-            df.loc[index, "time_z6"] = 0
-            df.loc[index, "avgHR_z6"] = 0
-        try:
-            df.loc[index, "time_z7"] = csv_grouped[csv_grouped["Zone"] == 7]["perc"].values[0]
-            df.loc[index, "avgHR_z7"] = csv_grouped[csv_grouped["Zone"] == 7]["avg_HR"].values[0]
-        except IndexError:
-            df.loc[index, "time_z7"] = 0
-            df.loc[index, "avgHR_z7"] = 0
-    
-    return df
+    return calculate_time_in_zones_batch(df, hr_data, n_workers, weighting, max_gap)
 
 ############################################## RELATIVE EFFORT ############################################################
 
+# Relative effort coefficient of each heart rate zone, fitted in relative_effort.ipynb
+RELATIVE_EFFORT_COEFFICIENTS = [0.15431269224351535, 0.027420732193484548, 0.38565644853265013, 0.5323576919121238,
+                                0.6270385873082338, 1.0517240453307226, 1.0598455728195533]
+
+def relative_effort_features(time_matrix, hr_matrix, duration, max_hr=190):
+    """
+    TRIMP-like weighted duration of each zone of each activity: duration in the zone x relative HR x 0.64 exp(1.92 relative HR).
+
+    Args:
+    - time_matrix (numpy.ndarray): (activities x zones) share of the activity time spent in each zone.
+    - hr_matrix (numpy.ndarray): (activities x zones) average heart rate in each zone.
+    - duration (numpy.ndarray): moving time of each activity.
+    - max_hr (float): heart rate normalising the zone averages. Default is 190.
+
+    Returns:
+    - numpy.ndarray: (activities x zones) weighted durations.
+    """
+    relative_hr = np.asarray(hr_matrix, dtype=float) / max_hr
+    zone_duration = np.asarray(duration, dtype=float)[:, None] * np.asarray(time_matrix, dtype=float)
+    return zone_duration * relative_hr * 0.64 * np.exp(1.92 * relative_hr)
+
+def relative_effort(time_matrix, hr_matrix, duration, coefficients=RELATIVE_EFFORT_COEFFICIENTS, max_hr=190):
+    """
+    Relative effort of every activity at once, for a zone model with any number of zones.
+
+    Args:
+    - time_matrix (numpy.ndarray): (activities x zones) share of the activity time spent in each zone.
+    - hr_matrix (numpy.ndarray): (activities x zones) average heart rate in each zone.
+    - duration (numpy.ndarray): moving time of each activity.
+    - coefficients (array-like): one coefficient per zone. Default is RELATIVE_EFFORT_COEFFICIENTS (7 zones).
+    - max_hr (float): heart rate normalising the zone averages. Default is 190.
+
+    Returns:
+    - numpy.ndarray: relative effort of each activity, unrounded.
+    """
+    return relative_effort_features(time_matrix, hr_matrix, duration, max_hr) @ np.asarray(coefficients, dtype=float)
+
 def calculate_new_relative_effort(df, a=0.15431269224351535,
                                   b=0.027420732193484548,
                                   c=0.38565644853265013,
                                   d=0.5323576919121238,
                                   e=0.6270385873082338,
                                   f=1.0517240453307226,
-                                  g=1.0598455728195533):
-    # define the weighting factor function
-    weighting_factor = lambda x: 0.64*np.exp(1.92*x/190)
-
-    # create a list of tuples, where each tuple contains the zone time and heart rate columns
-    zone_columns = [('time_z1', 'avgHR_z1'), ('time_z2', 'avgHR_z2'), ('time_z3', 'avgHR_z3'), ('time_z4', 'avgHR_z4'), ('time_z5', 'avgHR_z5'), ('time_z6', 'avgHR_z6'), ('time_z7', 'avgHR_z7')]
-
-    # iterate over the list of tuples and create a new column for each zone
-    for i, (zone_time_col, zone_hr_col) in enumerate(zone_columns):
-        # create a new column name for the duration
-        duration_col_name = f'duration_HR{i+1}'
-        # create a new column for the duration
-        df[duration_col_name] = df['Durée de déplacement'] * df[zone_time_col]
-        
-        # create a new column name for the weighting factor
-        wfactor_col_name = f'wfactor{i+1}'
-        # apply the calculation using lambda function to create the new column
-        df[wfactor_col_name] = weighting_factor(df[zone_hr_col])
-
-        # create a new column name for the weighted duration
-        weighted_duration_col_name = f'weighted_duration_HR{i+1}'
-        # calculate the weighted duration
-        df[weighted_duration_col_name] = df[duration_col_name] * df[zone_hr_col] / 190 * df[wfactor_col_name]
-    
-    # calculate the new_relative_effort column
-    df['new_relative_effort'] = round((df['weighted_duration_HR1'] * a
-                                 + df['weighted_duration_HR2'] * b
-                                 + df['weighted_duration_HR3'] * c
-                                 + df['weighted_duration_HR4'] * d
-                                 + df['weighted_duration_HR5'] * e
-                                 + df['weighted_duration_HR6'] * f
-                                 + df['weighted_duration_HR7'] * g),0)
+                                  g=1.0598455728195533,
+                                  coefficients=None, max_hr=190, athlete=None,
+                                  coefficients_path="data/relative_effort_coefficients.json"):
+    """
+    Add the new_relative_effort column, computed from the time_z* and avgHR_z* columns of every zone.
+
+    Args:
+    - df (pandas.DataFrame): activities with the 'Durée de déplacement' and the time_z*/avgHR_z* columns.
+    - a, b, c, d, e, f, g (float): coefficients of the 7 zones model.
+    - coefficients (array-like): one coefficient per zone, replacing a to g for a model with any number of zones.
+      Default is None.
+    - max_hr (float): heart rate normalising the zone averages. Default is 190.
+    - athlete (str): athlete whose fitted coefficients (see features.relative_effort_fit) are used instead of
+      a to g. Default is None.
+    - coefficients_path (str): path to the fitted coefficients file. Default is 'data/relative_effort_coefficients.json'.
+
+    Returns:
+    - pandas.DataFrame: activities with the main columns and new_relative_effort.
+    """
+    if coefficients is None and athlete is not None:
+        # imported here as the fitting module depends on this one
+        from features.relative_effort_fit import load_coefficients
+        coefficients = load_coefficients(athlete, coefficients_path)
+        if coefficients is None:
+            print(f"No fitted coefficients for {athlete} in {coefficients_path}, the default ones are used.")
+    if coefficients is None:
+        coefficients = [a, b, c, d, e, f, g]
+    zones = range(1, len(coefficients) + 1)
+    time_matrix = df[[f'time_z{zone}' for zone in zones]].to_numpy(dtype=float)
+    hr_matrix = df[[f'avgHR_z{zone}' for zone in zones]].to_numpy(dtype=float)
+
+    df['new_relative_effort'] = np.round(relative_effort(time_matrix, hr_matrix, df['Durée de déplacement'].to_numpy(dtype=float),
+                                                         coefficients, max_hr), 0)
     df = df[['Date', 'Time', 'Nom du fichier', 'Durée de déplacement', 'Distance',
        'Fréquence cardiaque moyenne', 'Fréquence cardiaque maximum',
        'Vitesse moyenne', 'Cadence moyenne', 'Puissance moyenne',
        "Poids de l'athlète",'Puissance moyenne pondérée', "intensity_score", "Mesure d'effort", "new_relative_effort"]]
-    
-    return df
 
+    return df
 
 ############################################## TRAINING LOAD (TSS) #######################################################
 
@@ -431,14 +474,52 @@ def HRSS(df, lthr=172, HRrest=65, HHRmax=190, trimp='trimp'):
 
     return df
 
-######################################################## FITNESS ########################################
+################################################## PERFORMANCE MANAGEMENT CHART ########################################
 
-import pandas as pd
-import math
+# Time constants (days) of the Fitness (chronic) and Fatigue (acute) training loads
+FITNESS_DAYS = 42
+FATIGUE_DAYS = 7
 
-def calculate_fitness(df, hrss='HRSS', date='Date'):
+# Number of times each PMC stage really ran (cache hits are not counted), e.g. to check that a refresh runs each once
+PMC_STAGE_CALLS = Counter()
+
+# Daily charts of the last input frames, keyed on the content of their date and HRSS columns
+_PMC_CACHE = OrderedDict()
+_PMC_CACHE_SIZE = 8
+
+def exponential_load(load, days, initial=0.0):
     """
-    Add the Fitness column to a new daily dataframe based on the date and HRSS (stress score).
+    Exponentially weighted training load of a daily load series: load_t = load_t-1 + (x_t - load_t-1) * (1 - exp(-1/days)),
+    run as one linear filter instead of a Python loop over the days.
+
+    Args:
+        load: daily load values (e.g. HRSS), 0 on rest days. A 2D array holds one series per row.
+        days: time constant in days, 42 for Fitness and 7 for Fatigue.
+        initial: load of the day before the first value, one per row for a 2D array. Default is 0.
+
+    Returns:
+        numpy.ndarray: training load of each day.
+    """
+    from scipy.signal import lfilter
+
+    k = 1 - math.exp(-1/days)
+    load = np.asarray(load, dtype=float)
+    if load.shape[-1] == 0:
+        return load
+    zi = (1 - k) * np.broadcast_to(np.asarray(initial, dtype=float), load.shape[:-1])[..., None]
+    return lfilter([k], [1, -(1 - k)], load, axis=-1, zi=zi)[0]
+
+def _pmc_key(dates, load, hrss, date):
+    """
+    Content key of the date and HRSS columns of an activities frame, so that copies and merged frames share it.
+    """
+    content = pd.util.hash_pandas_object(pd.DataFrame({'date': dates, 'load': load}), index=False)
+    return (hrss, date, hashlib.sha256(content.to_numpy().tobytes()).hexdigest())
+
+def daily_load(df, hrss='HRSS', date='Date'):
+    """
+    Daily HRSS series between the first and last activity, the input shared by all the PMC stages. The HRSS of
+    the activities of a same day add up.
 
     Args:
         df: input dataframe.
@@ -446,99 +527,232 @@ def calculate_fitness(df, hrss='HRSS', date='Date'):
         date: date column.
 
     Returns:
-        pandas.DataFrame: new df with Date and Fitness columns.
+        pandas.DataFrame: one row per day (at midnight) with the date and the 'load' columns, 0 on the days without
+                          activity.
     """
+    PMC_STAGE_CALLS['daily_load'] += 1
+    days = pd.to_datetime(df[date]).dt.normalize()
 
-    df[date] =  pd.to_datetime(df[date])
+    # Sum of the HRSS of each day, on the sorted index of the days with activities
+    day_hrss = df[hrss].groupby(days.to_numpy()).sum()
 
-    # Get min and max dates from the input dataframe
-    min_date = pd.to_datetime(df[date]).min()
-    max_date = pd.to_datetime(df[date]).max()
+    # Create a new dataframe with daily dates between min and max dates, 0 on the days without activity
+    daily_df = pd.DataFrame(pd.date_range(day_hrss.index[0], day_hrss.index[-1]), columns=[date])
+    daily_df['load'] = day_hrss.reindex(daily_df[date], fill_value=0).to_numpy(dtype=float)
 
-    # Create a new dataframe with daily dates between min and max dates
-    daily_df = pd.DataFrame(pd.date_range(min_date, max_date), columns=[date])
+    return daily_df
 
-    # Initialize the fitness column with NaN values
-    daily_df['Fitness'] = pd.Series([float('nan')]*len(daily_df))
+def join_daily(df, daily_df, date='Date'):
+    """
+    Join daily values back onto the activities: each activity gets the values of its day, looked up on the date
+    index of the daily dataframe. Columns of df with the same names are replaced.
 
-    # Initialize previous_fitness as 0
-    previous_fitness = 0
+    Args:
+        df: input dataframe.
+        daily_df: daily dataframe with one row per day, e.g. from performance_management_chart.
+        date: date column of both dataframes.
 
-    # Loop through each row in the daily dataframe
-    for i, row in daily_df.iterrows():
-        # Get the date and HRSS for this row
-        row_date = pd.to_datetime(row[date]).date()
-        if row_date in pd.to_datetime(df[date]).dt.date.values:
-            row_hrss = df.loc[pd.to_datetime(df[date]).dt.date == row_date, hrss].values[0]
-        else:
-            row_hrss = 0
+    Returns:
+        pandas.DataFrame: df, with its index and row order, and the daily columns.
+    """
+    daily = daily_df.drop(columns=date).set_index(daily_df[date].dt.normalize())
+    values = daily.reindex(pd.to_datetime(df[date]).dt.normalize())
+    values.index = df.index
 
-        # Calculate the fitness score for this row based on the previous fitness and HRSS
-        fitness = previous_fitness + (row_hrss - previous_fitness) * (1 - math.exp(-1/42))
+    return pd.concat([df.drop(columns=values.columns, errors='ignore'), values], axis=1)
 
-        # Update the fitness column for this row
-        daily_df.loc[i, 'Fitness'] = round(fitness, 1)
-        daily_df.loc[i, 'Fitness Diff'] = round(fitness - previous_fitness, 1)
+def performance_management_chart(df, hrss='HRSS', date='Date'):
+    """
+    Daily Fitness, Fatigue and Form of the whole history in a single pass: the HRSS of each day is summed once,
+    then both exponential loads are computed as vectorized filters. The chart is memoized on the content of the
+    date and HRSS columns, so the Fitness, Fatigue and Form wrappers called in a row compute it once.
 
-        # Update previous_fitness for the next row
-        previous_fitness = fitness
+    Args:
+        df: input dataframe.
+        hrss: HRSS column.
+        date: date column.
 
-    # Merge the daily_df with the original df based on the date column
-    df_merged = pd.merge(df, daily_df, on=date, how='left')
+    Returns:
+        pandas.DataFrame: one row per day (at midnight) between the first and last activity with the Date, Fitness, Fitness Diff,
+                          Fatigue, Fatigue Diff and Form columns. Fitness, Fatigue and their diffs are rounded to 1
+                          decimal, Form is the previous day's Fitness minus Fatigue.
+    """
+    key = _pmc_key(pd.to_datetime(df[date]), df[hrss], hrss, date)
+    if key in _PMC_CACHE:
+        _PMC_CACHE.move_to_end(key)
+        return _PMC_CACHE[key].copy()
 
-    return df_merged, daily_df
+    daily_df = daily_load(df, hrss, date)
+    load = daily_df.pop('load').to_numpy()
 
+    for name, n_days in [('Fitness', FITNESS_DAYS), ('Fatigue', FATIGUE_DAYS)]:
+        PMC_STAGE_CALLS[name.lower()] += 1
+        values = exponential_load(load, n_days)
+        daily_df[name] = np.round(values, 1)
+        daily_df[f'{name} Diff'] = np.round(np.diff(values, prepend=0.0), 1)
 
-########################################################## FATIGUE ##############################################
+    PMC_STAGE_CALLS['form'] += 1
+    daily_df['Form'] = daily_df['Fitness'].shift(1) - daily_df['Fatigue'].shift(1)
 
-def calculate_fatigue(df, hrss='HRSS', date='Date'):
+    _PMC_CACHE[key] = daily_df
+    if len(_PMC_CACHE) > _PMC_CACHE_SIZE:
+        _PMC_CACHE.popitem(last=False)
+
+    return daily_df.copy()
+
+
+############################################################ PMC STATE #####################################
+
+# Last day of Fitness and Fatigue, so that new activities update them without replaying the history
+PMC_STATE_PATH = "data/pmc_state.json"
+
+def pmc_history_hash(df, last_date, date='Date'):
     """
-    Add the Fatigue column to an existing df based on the HRSS (stress score).
+    Content hash of the activities before the last day of a PMC state, the part of the history the state is built
+    on, so that a state whose history was edited since can be detected and rebuilt.
+
+    Args:
+        df: input dataframe, all its columns are hashed.
+        last_date: last day of the state, as an ISO date string or a timestamp.
+        date: date column.
+
+    Returns:
+        str: SHA-256 hex digest of the rows dated before last_date.
+    """
+    before = df[pd.to_datetime(df[date]).dt.normalize() < pd.Timestamp(last_date)]
+    content = pd.util.hash_pandas_object(before, index=False)
+    return hashlib.sha256(content.to_numpy().tobytes()).hexdigest()
+
+def _pmc_state(days, load, base_fitness=0.0, base_fatigue=0.0):
+    """
+    PMC state at the last of consecutive days, from their daily load and the Fitness and Fatigue of the day before
+    the first one. The Fitness and Fatigue of the day before the last one are kept to apply the last day again.
+    """
+    fitness = exponential_load(load, FITNESS_DAYS, base_fitness)
+    fatigue = exponential_load(load, FATIGUE_DAYS, base_fatigue)
+    return {'last_date': days[-1].date().isoformat(),
+            'fitness': float(fitness[-1]),
+            'fatigue': float(fatigue[-1]),
+            'base_fitness': float(fitness[-2]) if len(days) > 1 else float(base_fitness),
+            'base_fatigue': float(fatigue[-2]) if len(days) > 1 else float(base_fatigue)}
+
+def pmc_state_from_history(df, hrss='HRSS', date='Date'):
+    """
+    PMC state at the last day of an activity history.
 
     Args:
         df: input dataframe.
-        hrss: (int) HRSS column.
+        hrss: HRSS column.
         date: date column.
 
     Returns:
-        pandas.DataFrame: new df with Fatigue column.
+        dict: 'last_date' (ISO date string), 'fitness' and 'fatigue' (unrounded) of the last day, and 'base_fitness'
+              and 'base_fatigue' of the day before.
+    """
+    daily_df = daily_load(df, hrss, date)
+    return _pmc_state(pd.DatetimeIndex(daily_df[date]), daily_df['load'].to_numpy())
+
+def advance_pmc_state(state, df, hrss='HRSS', date='Date'):
+    """
+    Advance a PMC state over new activities, day by day up to the last new activity: the work only depends on
+    the number of new days. Activities before the state's last day are already counted and ignored. The activities
+    of the last day are applied again from the day before, so that activities uploaded later on that day count.
+
+    Args:
+        state: PMC state from pmc_state_from_history or load_pmc_state.
+        df: dataframe of the activities from the state's last day on, it must hold all the activities of that day.
+        hrss: HRSS column.
+        date: date column.
+
+    Returns:
+        dict: PMC state at the last day of the new activities (the input state if there is none).
+    """
+    last_date = pd.Timestamp(state['last_date'])
+    new = df[pd.to_datetime(df[date]).dt.normalize() >= last_date]
+    if new.empty:
+        return dict(state)
+
+    # Daily loads from the state's last day, 0 on the days without activity
+    loads = daily_load(new, hrss, date)
+    days = pd.date_range(last_date, loads[date].iloc[-1].normalize())
+    load = loads.set_index(loads[date].dt.normalize())['load'].reindex(days, fill_value=0)
+
+    return _pmc_state(days, load.to_numpy(), state['base_fitness'], state['base_fatigue'])
+
+def load_pmc_state(state_path=PMC_STATE_PATH):
+    """
+    Load the persisted PMC state.
+
+    Args:
+        state_path: path to the state .json file. Default is 'data/pmc_state.json'.
+
+    Returns:
+        dict: PMC state, None if it has not been saved yet.
+    """
+    if not os.path.exists(state_path):
+        return None
+    with open(state_path, 'r') as f:
+        return json.load(f)
+
+def save_pmc_state(state, state_path=PMC_STATE_PATH):
+    """
+    Save the PMC state.
+
+    Args:
+        state: PMC state.
+        state_path: path to the state .json file. Default is 'data/pmc_state.json'.
+
+    Returns:
+        None
     """
+    _atomic_write_json(state_path, state)
+
+
+######################################################## FITNESS ########################################
+
+def calculate_fitness(df, hrss='HRSS', date='Date'):
+    """
+    Add the Fitness column to a new daily dataframe based on the date and HRSS (stress score).
+
+    Args:
+        df: input dataframe.
+        hrss: HRSS column.
+        date: date column.
+
+    Returns:
+        pandas.DataFrame: new df with Date and Fitness columns.
+    """
+
     df[date] =  pd.to_datetime(df[date])
 
-    # Get min and max dates from the input dataframe
-    min_date = pd.to_datetime(df[date]).min()
-    max_date = pd.to_datetime(df[date]).max()
+    daily_df = performance_management_chart(df, hrss, date)[[date, 'Fitness', 'Fitness Diff']]
+
+    # Join the daily_df back onto the activities of each day
+    df_merged = join_daily(df, daily_df, date)
 
-    # Create a new dataframe with daily dates between min and max dates
-    daily_df = pd.DataFrame(pd.date_range(min_date, max_date), columns=[date])
+    return df_merged, daily_df
 
-    # Initialize the Fatigue column with NaN values
-    daily_df['Fatigue'] = pd.Series([float('nan')]*len(daily_df))
 
-    # Initialize previous_fatigue as 0
-    previous_fatigue = 0
+########################################################## FATIGUE ##############################################
 
-    # Loop through each row in the daily dataframe
-    for i, row in daily_df.iterrows():
-        # Get the date and HRSS for this row
-        row_date = pd.to_datetime(row[date]).date()
-        if row_date in pd.to_datetime(df[date]).dt.date.values:
-            row_hrss = df.loc[pd.to_datetime(df[date]).dt.date == row_date, hrss].values[0]
-        else:
-            row_hrss = 0
+def calculate_fatigue(df, hrss='HRSS', date='Date'):
+    """
+    Add the Fatigue column to an existing df based on the HRSS (stress score).
 
-        # Calculate the fatigue score for this row based on the previous fatigue and HRSS
-        fatigue = previous_fatigue + (row_hrss - previous_fatigue) * (1 - math.exp(-1/7))
+    Args:
+        df: input dataframe.
+        hrss: (int) HRSS column.
+        date: date column.
 
-        # Update the fatigue column for this row
-        daily_df.loc[i, 'Fatigue'] = round(fatigue, 1)
-        daily_df.loc[i, 'Fatigue Diff'] = round(fatigue - previous_fatigue, 1)
+    Returns:
+        pandas.DataFrame: new df with Fatigue column.
+    """
+    df[date] =  pd.to_datetime(df[date])
 
-        # Update previous_fitness for the next row
-        previous_fatigue = fatigue
+    daily_df = performance_management_chart(df, hrss, date)[[date, 'Fatigue', 'Fatigue Diff']]
 
-    # Merge the daily_df with the original df based on the date column
-    df_merged = pd.merge(df, daily_df, on=date, how='left')
+    # Join the daily_df back onto the activities of each day
+    df_merged = join_daily(df, daily_df, date)
 
     return df_merged, daily_df
 
@@ -557,20 +771,11 @@ def calculate_form(df, fitness='Fitness', fatigue='Fatigue', date='Date'):
     Returns:
         pandas.DataFrame: new df with Form column.
     """
-    
-    fatigue_df = calculate_fatigue(df)[1]
-    fitness_df = calculate_fitness(df)[1]
-
-    df_merged = pd.merge(fatigue_df, fitness_df, on=date)
-
-    # Assuming your input dataframe is named 'daily_df'
-    df_merged['previous_fitness'] = df_merged['Fitness'].shift(1)
-    df_merged['previous_fatigue'] = df_merged['Fatigue'].shift(1)
-    df_merged['Form'] = df_merged['previous_fitness'] - df_merged['previous_fatigue']
+    df[date] =  pd.to_datetime(df[date])
 
-    df_merged = df_merged[['Date', 'Form']]
+    df_merged = performance_management_chart(df, date=date)[[date, 'Form']]
 
-    # Merge the df_merged with the original df based on the date column
-    df_merged = pd.merge(df, df_merged, on=date, how='left')
+    # Join the daily Form back onto the activities of each day
+    df_merged = join_daily(df, df_merged, date)
 
     return df_merged
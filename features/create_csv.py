@@ -1,5 +1,11 @@
 import pandas as pd
+import numpy as np
 import os
+import json
+import gzip
+import zlib
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
 from tqdm import tqdm
 
 import gpxpy 
@@ -10,7 +16,10 @@ from garmin_fit_sdk import Decoder, Stream
 from garmin_fit_sdk import Decoder, Stream
 import fitparse
 
-from tcxreader.tcxreader import TCXReader, TCXTrackPoint
+import xml.etree.ElementTree as ET
+
+from features.activity_store import write_activity_columnar
+from features.utils import _atomic_write_json, _file_sha256
 
 ################################################################### UNZIP STRAVA BULK DATA EXPORTED ##################################################################
 def unzip_strava_export(dir_in):
@@ -31,187 +40,578 @@ def unzip_strava_export(dir_in):
     # Step 2: Unzip the zipped files
     strava_conv.unzip_activities()
 
+################################################################### ACTIVITY ID INDEX ##################################################################
+def _activity_key(filename):
+    """
+    Normalise a file name to the key used in the activity id index, e.g. 'activities/1234.fit.gz' -> '1234'.
+
+    Parameters:
+        filename (str): File name or path, with or without the .gz/.fit/.gpx/.tcx extensions.
+
+    Returns:
+        str: The file name without its directory and activity extensions.
+    """
+    key = os.path.basename(str(filename))
+    while os.path.splitext(key)[1].lower() in ('.gz', '.fit', '.gpx', '.tcx', '.csv'):
+        key = os.path.splitext(key)[0]
+    return key
+
+
+def build_activity_id_index(activities, filename_col='Nom du fichier', id_col="ID de l'activité"):
+    """
+    Build a filename -> activity id dictionary from the activities table, once for a whole ingestion.
+
+    Parameters:
+        activities (str or pandas.DataFrame): Path to the activities CSV file, or the already loaded DataFrame.
+        filename_col (str): Column holding the activity file names. Default is 'Nom du fichier'.
+        id_col (str): Column holding the activity ids. Default is "ID de l'activité".
+
+    Returns:
+        dict: Activity ids keyed on the normalised file name (see _activity_key). When several activities share
+              a file name the first one is kept, as with the previous row-by-row lookup.
+    """
+    if isinstance(activities, str):
+        activities = pd.read_csv(activities)
+    activities = activities.dropna(subset=[filename_col])
+
+    index = {}
+    for filename, activity_id in zip(activities[filename_col], activities[id_col]):
+        index.setdefault(_activity_key(filename), activity_id)
+    return index
+
+
+def _save_activity(df, csv_path):
+    """
+    Save the trackpoints of an activity as a .csv file and as its typed, compressed columnar copy.
+
+    Parameters:
+        df (pandas.DataFrame): Trackpoints of the activity.
+        csv_path (str): Path of the .csv file to write, the .parquet copy is written next to it.
+
+    Returns:
+        None
+    """
+    df.to_csv(csv_path, index=False)
+    write_activity_columnar(df, csv_path)
+
+
+################################################################### INGESTION MANIFEST ##################################################################
+MANIFEST_PATH = "data/ingest_manifest.json"
+
+# Version of each converter output, bump it when a converter changes so its files are converted again
+PARSER_VERSIONS = {'gpx': 1, 'fit': 1, 'tcx': 1}
+
+# Errors raised by the parsers on a corrupt or truncated file, reported as an 'error' status for that file only
+PARSE_ERRORS = (TypeError, ET.ParseError, gpxpy.gpx.GPXException, fitdecode.exceptions.FitError)
+
+
+def load_manifest(manifest_path=MANIFEST_PATH):
+    """
+    Load the ingestion manifest, recording for every converted source file its size, mtime, content hash,
+    output path and parser version.
+
+    Parameters:
+        manifest_path (str): Path to the manifest .json file. Default is 'data/ingest_manifest.json'.
+
+    Returns:
+        dict: Manifest entries keyed on the source file path, empty if the manifest does not exist yet.
+    """
+    if not os.path.exists(manifest_path):
+        return {}
+    with open(manifest_path, 'r') as f:
+        return json.load(f)
+
+
+def save_manifest(manifest, manifest_path=MANIFEST_PATH):
+    """
+    Save the ingestion manifest.
+
+    Parameters:
+        manifest (dict): Manifest entries keyed on the source file path.
+        manifest_path (str): Path to the manifest .json file. Default is 'data/ingest_manifest.json'.
+
+    Returns:
+        None
+    """
+    _atomic_write_json(manifest_path, manifest)
+
+
+def is_up_to_date(manifest, filepath, output_path, parser):
+    """
+    Check whether a source file was already converted, unchanged, by the current version of its parser.
+    The content is only hashed when the size is unchanged but the mtime differs (e.g. the file was copied again).
+
+    Parameters:
+        manifest (dict): Manifest entries keyed on the source file path.
+        filepath (str): Path to the source file.
+        output_path (str): Path to the converted .csv file.
+        parser (str): Parser name, one of the PARSER_VERSIONS keys.
+
+    Returns:
+        bool: True if the conversion can be skipped.
+    """
+    entry = manifest.get(os.path.normpath(filepath))
+    if (entry is None or entry['parser_version'] != PARSER_VERSIONS[parser]
+            or entry['output'] != os.path.normpath(output_path) or not os.path.exists(output_path)):
+        return False
+
+    stat = os.stat(filepath)
+    if entry['size'] != stat.st_size:
+        return False
+    if entry['mtime'] == stat.st_mtime:
+        return True
+    if _file_sha256(filepath) == entry['sha256']:
+        entry['mtime'] = stat.st_mtime
+        return True
+    return False
+
+
+def record_in_manifest(manifest, filepath, output_path, parser):
+    """
+    Record a converted source file in the manifest.
+
+    Parameters:
+        manifest (dict): Manifest entries keyed on the source file path, updated in place.
+        filepath (str): Path to the source file.
+        output_path (str): Path to the converted .csv file.
+        parser (str): Parser name, one of the PARSER_VERSIONS keys.
+
+    Returns:
+        None
+    """
+    stat = os.stat(filepath)
+    manifest[os.path.normpath(filepath)] = {'size': stat.st_size,
+                                            'mtime': stat.st_mtime,
+                                            'sha256': _file_sha256(filepath),
+                                            'output': os.path.normpath(output_path),
+                                            'parser': parser,
+                                            'parser_version': PARSER_VERSIONS[parser]}
+
+
 ################################################################### CONVERT .GPX FILES TO .CSV ##################################################################
-def read_gpx_files_indiv(directory):
+def _gpx_to_dataframe(source):
+    """
+    Read the trackpoints of the first track segment of a .gpx file.
+
+    Parameters:
+    -----------
+    source : str or file-like
+        Content of the .gpx file, or an open text stream.
+
+    Returns:
+    --------
+    pandas.DataFrame
+        Trackpoints with the 'latitude', 'longitude', 'elevation' and 'time' columns.
+    """
+    gpx = gpxpy.parse(source)
+    data = [{'latitude': p.latitude,
+             'longitude': p.longitude,
+             'elevation': p.elevation,
+             'time': p.time} for p in gpx.tracks[0].segments[0].points]
+    return pd.DataFrame(data)
+
+
+def read_gpx_files_indiv(directory, manifest_path=MANIFEST_PATH):
     """
     Read .gpx files from a directory and save them as .csv files in a subdirectory.
+    Files already converted and unchanged since, according to the ingestion manifest, are skipped.
 
     Parameters:
     -----------
     directory : str
         Path to the directory containing the .gpx files.
+    manifest_path : str, optional
+        Path to the ingestion manifest. None converts every file without using a manifest.
 
     Returns:
     --------
-    None
+    pandas.DataFrame
+        One row per .gpx file with the 'file', 'status' ('written', 'skipped' or 'error'), 'activity_id', 'rows' and
+        'error' columns.
     """
     output_dir = "data/activities_csv/"
     os.makedirs(output_dir, exist_ok=True)
-    # loop over all files in the directory
-    for file in tqdm(os.listdir(directory)):
-        if file.endswith('.gpx'):
-            # read the .gpx file using gpxpy library
-            filepath = os.path.join(directory, file)
-            with open(filepath, 'r') as gpx_file:
-                gpx = gpxpy.parse(gpx_file)
-                data = [{'latitude': p.latitude,
-                         'longitude': p.longitude,
-                         'elevation': p.elevation,
-                         'time': p.time} for p in gpx.tracks[0].segments[0].points]
-            df = pd.DataFrame(data)
-            # add an 'activity_id' column based on the filename
-            activity_id = os.path.splitext(file)[0]
-            df.insert(0, 'activity_id', activity_id)
-            # Save the DataFrame as a CSV file in the output directory
-            csv_file = os.path.splitext(file)[0] + '.csv'
-            csv_path = os.path.join(output_dir, csv_file)
-            df.to_csv(csv_path, index=False)
+    manifest = load_manifest(manifest_path) if manifest_path else {}
+
+    results = []
+    try:
+        # loop over all files in the directory
+        for file in tqdm(os.listdir(directory)):
+            if file.endswith('.gpx'):
+                filepath = os.path.join(directory, file)
+                csv_file = os.path.splitext(file)[0] + '.csv'
+                csv_path = os.path.join(output_dir, csv_file)
+                # add an 'activity_id' column based on the filename
+                activity_id = os.path.splitext(file)[0]
+                if is_up_to_date(manifest, filepath, csv_path, 'gpx'):
+                    results.append({'file': file, 'status': 'skipped', 'activity_id': activity_id, 'rows': 0, 'error': None})
+                    continue
+
+                # read the .gpx file using gpxpy library
+                try:
+                    with open(filepath, 'r') as gpx_file:
+                        df = _gpx_to_dataframe(gpx_file)
+                except PARSE_ERRORS as error:
+                    results.append({'file': file, 'status': 'error', 'activity_id': activity_id, 'rows': 0, 'error': f"{type(error).__name__}: {error}"})
+                    continue
+                df.insert(0, 'activity_id', activity_id)
+                # Save the DataFrame as a CSV file in the output directory
+                _save_activity(df, csv_path)
+                record_in_manifest(manifest, filepath, csv_path, 'gpx')
+                results.append({'file': file, 'status': 'written', 'activity_id': activity_id, 'rows': len(df), 'error': None})
+    finally:
+        # keep the files converted so far when a run is interrupted
+        if manifest_path:
+            save_manifest(manifest, manifest_path)
 
-    print('Done')
+    return pd.DataFrame(results, columns=['file', 'status', 'activity_id', 'rows', 'error'])
 
 ################################################################### CONVERT .FIT FILES TO .CSV ##################################################################
-def read_fit_files(directory):
+def _read_fit_records(source):
+    """
+    Decode the 'record' messages of a .fit file into a list of dictionaries.
+
+    Parameters:
+    -----------
+    source : str or file-like
+        Path to the .fit file, or an open binary stream.
+
+    Returns:
+    --------
+    list of dict
+        One dictionary per record message, keyed on the lower-cased field names.
+    """
+    data = []
+    with fitdecode.FitReader(source) as fit:
+        for frame in fit:
+            if isinstance(frame, fitdecode.FitDataMessage):
+                if frame.name == 'record':
+                    record_data = {}
+                    for field in frame:
+                        try:
+                            record_data[field.name.lower()] = field.value
+                        except TypeError:
+                            pass
+                    data.append(record_data)
+    return data
+
+
+def _convert_fit_file(task):
+    """
+    Decode a single .fit file and save it as a .csv file. Runs in a worker process when the ingestion is parallel.
+
+    Parameters:
+    -----------
+    task : tuple
+        (filepath, csv_path, activity_id) for the file to convert.
+
+    Returns:
+    --------
+    dict
+        Result summary for the file, with the 'file', 'status', 'activity_id', 'rows' and 'error' keys.
+    """
+    filepath, csv_path, activity_id = task
+    file = os.path.basename(filepath)
+    try:
+        df = pd.DataFrame(_read_fit_records(filepath))
+    except PARSE_ERRORS as error:
+        return {'file': file, 'status': 'error', 'activity_id': activity_id, 'rows': 0, 'error': f"{type(error).__name__}: {error}"}
+
+    # Add the activity id to the DataFrame
+    df.insert(0, 'activity_id', activity_id)
+
+    # Save the DataFrame as a CSV file and its columnar copy
+    _save_activity(df, csv_path)
+
+    status = 'written' if activity_id is not None else 'unmatched'
+    return {'file': file, 'status': status, 'activity_id': activity_id, 'rows': len(df), 'error': None}
+
+
+def read_fit_files(directory, n_workers=1, manifest_path=MANIFEST_PATH):
     """
     Read .fit files from a directory and save them as .csv files in the 'activities_csv' folder.
-    Ignore the files raising errors.
+    Files already converted and unchanged since, according to the ingestion manifest, are skipped, as are the files
+    not in the manifest that already have a .csv. Files raising errors are ignored and reported in the summary.
 
     Parameters:
     -----------
     directory : str
         Path to the directory containing the .fit files.
+    n_workers : int, optional
+        Number of worker processes decoding the files. 1 (default) decodes in the current process,
+        None uses one worker per CPU.
+    manifest_path : str, optional
+        Path to the ingestion manifest. None only skips the files that already have a .csv.
 
     Returns:
     --------
-    None
+    pandas.DataFrame
+        One row per .fit file with the 'file', 'status' ('written', 'unmatched', 'skipped' or 'error'),
+        'activity_id', 'rows' and 'error' columns. 'unmatched' files have no entry in activities.csv and are
+        saved with an empty activity id.
     """
-    # Load the activities CSV file
+    # Index the activity ids of the activities CSV file
     activities_csv_path = 'data/activities.csv'
-    df_activities = pd.read_csv(activities_csv_path)
+    activity_index = build_activity_id_index(activities_csv_path)
 
     # Create 'activities_csv' directory if it doesn't exist
     output_directory = "data/activities_csv/"
     if not os.path.exists(output_directory):
         os.makedirs(output_directory)
+    manifest = load_manifest(manifest_path) if manifest_path else {}
 
+    results = []
+    tasks = []
     # loop over all files in the directory
-    for i, file in tqdm(enumerate(os.listdir(directory))):
+    for file in os.listdir(directory):
         # check if the file is a .fit file
         if file.endswith('.fit'):
             # check if a corresponding CSV file exists
             csv_file = os.path.splitext(file)[0] + '.csv'
-            if os.path.exists(os.path.join(output_directory, csv_file)):
-                continue
-            
-            # read the .fit file using fitdecode
+            csv_path = os.path.join(output_directory, csv_file)
             filepath = os.path.join(directory, file)
-            try:
-                with fitdecode.FitReader(filepath) as fit:
-                    data = []
-                    for frame in fit:
-                        if isinstance(frame, fitdecode.FitDataMessage):
-                            if frame.name == 'record':
-                                record_data = {}
-                                for field in frame:
-                                    try:
-                                        record_data[field.name.lower()] = field.value
-                                    except TypeError:
-                                        pass
-                                data.append(record_data)
-                # Convert the data to a DataFrame
-                df = pd.DataFrame(data)
-
-                # Get the activity id from the activities CSV file
-                filename = os.path.splitext(file)[0]
-                df_activities = df_activities.dropna(subset=['Nom du fichier'])
-                match = df_activities.loc[df_activities['Nom du fichier'].str.contains(filename)]
-                if match.empty:
-                    activity_id = None
-                else:
-                    activity_id = match["ID de l'activité"].values[0]
-
-                # Add the activity id to the DataFrame
-                df.insert(0, 'activity_id', activity_id)
-
-                # Save the DataFrame as a CSV file
-                csv_path = os.path.join(output_directory, csv_file)
-                df.to_csv(csv_path, index=False)
-                
-            except TypeError:
-                print(f"{file} has an issue with TypeError, moving on to the next file")
-                continue
-            
-            except fitdecode.exceptions.FitHeaderError:
-                print(f"{file} has an issue with FitHeaderError, moving on to the next file")
+            if os.path.normpath(filepath) in manifest:
+                skip = is_up_to_date(manifest, filepath, csv_path, 'fit')
+            else:
+                skip = os.path.exists(csv_path)
+            if skip:
+                results.append({'file': file, 'status': 'skipped', 'activity_id': None, 'rows': 0, 'error': None})
                 continue
 
-    print('Done')
+            # Get the activity id from the activities index, unmatched files are flagged in the summary
+            activity_id = activity_index.get(_activity_key(file))
+
+            tasks.append((filepath, csv_path, activity_id))
+
+    # decode the files, in worker processes if requested, recording each converted file as soon as it is saved
+    converted = {os.path.basename(filepath): (filepath, csv_path) for filepath, csv_path, _ in tasks}
+    executor = None if n_workers == 1 else ProcessPoolExecutor(max_workers=n_workers)
+    try:
+        if executor is None:
+            converting = (_convert_fit_file(task) for task in tasks)
+        else:
+            converting = executor.map(_convert_fit_file, tasks, chunksize=8)
+        for result in tqdm(converting, total=len(tasks)):
+            results.append(result)
+            if manifest_path and result['status'] in ('written', 'unmatched'):
+                record_in_manifest(manifest, *converted[result['file']], 'fit')
+    finally:
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+        # keep the files converted so far when a run is interrupted
+        if manifest_path:
+            save_manifest(manifest, manifest_path)
+
+    return pd.DataFrame(results, columns=['file', 'status', 'activity_id', 'rows', 'error'])
 
 
 ################################################################### CONVERT .TCX FILES TO .CSV ##################################################################
-def remove_first_10_chars_from_tcx_files(directory_path):
-    """
-    Removes the first 10 characters from all .tcx files in the specified directory.
-    
-    Args:
-        directory_path (str): Path to the directory containing the .tcx files.
-    """
-    for filename in os.listdir(directory_path):
-        if filename.endswith('.tcx'):
-            file_path = os.path.join(directory_path, filename)
-            with open(file_path, 'r') as f:
-                content = f.read()
-            with open(file_path, 'w') as f:
-                f.write(content[10:])
+# Trackpoint children read by the TCX reader, with the column they fill
+TCX_FIELDS = {'LatitudeDegrees': 'latitude',
+              'LongitudeDegrees': 'longitude',
+              'AltitudeMeters': 'altitude_meters',
+              'DistanceMeters': 'distance_meters',
+              'Value': 'heart_rate_bpm',
+              'Cadence': 'cadence_rpm',
+              'Speed': 'speed_mps'}
+
 
+def _xml_chunks(source, offset=None, chunk_size=1 << 16):
+    """
+    Read an XML file by chunks, starting at the real XML start. Strava pads some .tcx files with leading characters
+    before the XML declaration, which are skipped here instead of rewriting the files.
 
-def convert_tcx_to_csv_with_activity_id(tcx_directory, activities_file, csv_directory):
+    :param source: Path to the XML file, or an open binary stream
+    :param offset: Number of leading bytes to skip. Default is None, which skips everything before the first '<'
+    :param chunk_size: Size of the chunks read
+    :return: Generator of byte chunks
+    """
+    stream = open(source, 'rb') if isinstance(source, (str, os.PathLike)) else source
+    try:
+        skip = offset
+        while True:
+            chunk = stream.read(chunk_size)
+            if not chunk:
+                return
+            if skip is None:
+                start = chunk.find(b'<')
+                if start == -1:
+                    continue
+                chunk = chunk[start:]
+                skip = 0
+            elif skip:
+                skipped = min(skip, len(chunk))
+                chunk = chunk[skipped:]
+                skip -= skipped
+            if chunk:
+                yield chunk
+    finally:
+        if stream is not source:
+            stream.close()
+
+
+def read_tcx_trackpoints(source, offset=None):
+    """
+    Read the trackpoints of a .tcx file in a single streaming pass: the XML is parsed incrementally and every
+    trackpoint is written into preallocated typed arrays as soon as it is complete, then removed from its track so
+    the parse tree does not grow with the file.
+
+    :param source: Path to the TCX file, or an open binary stream
+    :param offset: Number of leading garbage bytes before the XML. Default is None, which detects the XML start
+    :return: Dictionary of arrays keyed on 'time' (naive UTC datetime64[ns], NaT if missing) and the TCX_FIELDS
+             columns (float64, NaN if missing)
+    """
+    capacity = 4096
+    times = np.empty(capacity, dtype='datetime64[ns]')
+    values = {col: np.full(capacity, np.nan) for col in TCX_FIELDS.values()}
+    n = 0
+
+    parser = ET.XMLPullParser(events=('start', 'end'))
+    chunks = _xml_chunks(source, offset)
+    track = None
+    while chunks is not None:
+        chunk = next(chunks, None)
+        if chunk is None:
+            parser.close()
+            chunks = None
+        else:
+            parser.feed(chunk)
+
+        # times of the trackpoints completed by this chunk, converted together
+        pending_times = []
+        for event, elem in parser.read_events():
+            if event == 'start':
+                if elem.tag.endswith('}Track'):
+                    track = elem
+                continue
+            if not elem.tag.endswith('}Trackpoint'):
+                continue
+            if n + len(pending_times) == capacity:
+                # grow the arrays geometrically
+                capacity *= 2
+                times = np.resize(times, capacity)
+                for col, arr in values.items():
+                    grown = np.full(capacity, np.nan)
+                    grown[:n + len(pending_times)] = arr[:n + len(pending_times)]
+                    values[col] = grown
+
+            i = n + len(pending_times)
+            timestamp = None
+            for child in elem.iter():
+                tag = child.tag.rpartition('}')[2]
+                if tag == 'Time':
+                    timestamp = child.text
+                elif tag in TCX_FIELDS and child.text is not None:
+                    values[TCX_FIELDS[tag]][i] = float(child.text)
+            pending_times.append(timestamp)
+            # detach the parsed trackpoint from its track to keep the memory bounded
+            if track is not None:
+                del track[:]
+
+        if pending_times:
+            parsed = pd.to_datetime(pd.Series(pending_times, dtype=object), format='ISO8601', utc=True)
+            times[n:n + len(pending_times)] = parsed.dt.tz_convert(None).to_numpy(dtype='datetime64[ns]')
+            n += len(pending_times)
+
+    data = {'time': times[:n]}
+    data.update({col: arr[:n] for col, arr in values.items()})
+    return data
+
+
+def _tcx_to_dataframe(source, with_position=True, offset=None):
+    """
+    Read the trackpoints of a .tcx file. As with tcxreader, the trackpoints without GPS position at the start and at
+    the end of the exercise are dropped and the times are returned as naive UTC datetimes. Unlike tcxreader, an
+    exercise without any GPS position (indoor ride) keeps all its trackpoints.
+
+    :param source: Path to the TCX file, or an open binary stream
+    :param with_position: Whether to keep the latitude and longitude columns
+    :param offset: Number of leading garbage bytes before the XML. Default is None, which detects the XML start
+    :return: DataFrame with the time, (latitude, longitude,) altitude_meters, distance_meters, heart_rate_bpm,
+             cadence_rpm and speed_mps columns
+    """
+    data = read_tcx_trackpoints(source, offset)
+
+    # Extract data to DataFrame
+    df = pd.DataFrame({
+        "time": data['time'],
+        "latitude": data['latitude'],
+        "longitude": data['longitude'],
+        "altitude_meters": data['altitude_meters'],
+        "distance_meters": data['distance_meters'],
+        "heart_rate_bpm": pd.array(np.round(data['heart_rate_bpm']), dtype='Int64'),
+        "cadence_rpm": pd.array(np.round(data['cadence_rpm']), dtype='Int64'),
+        "speed_mps": data['speed_mps']
+    })
+
+    # Drop the trackpoints without GPS data at the start and at the end
+    has_gps = np.flatnonzero(df['latitude'].notna().to_numpy())
+    if len(has_gps):
+        df = df.iloc[has_gps[0]:has_gps[-1] + 1].reset_index(drop=True)
+
+    if not with_position:
+        df = df.drop(columns=["latitude", "longitude"])
+    return df
+
+
+def convert_tcx_to_csv_with_activity_id(tcx_directory, activities_file, csv_directory, manifest_path=MANIFEST_PATH):
     """
     Reads TCX files from a given directory, extracts data and appends the activity id, and saves the data as CSV file
-    for each activity in the directory.
+    for each activity in the directory. Files already converted and unchanged since, according to the ingestion
+    manifest, are skipped.
     
     :param tcx_directory: Directory containing TCX files
     :param activities_file: CSV file containing activity data
     :param csv_directory: Directory to save CSV files
+    :param manifest_path: Path to the ingestion manifest, None converts every file without using a manifest
+    :return: DataFrame with one row per TCX file and its 'file', 'status' ('written', 'unmatched', 'skipped' or
+             'error'), 'activity_id', 'rows' and 'error' columns. 'unmatched' files have no entry in the activities
+             file and are saved without id.
     """
-    
-    # Load activities file
-    df_activities = pd.read_csv(activities_file)
-    
-    # Iterate over TCX files in directory
-    for file_name in os.listdir(tcx_directory):
-        if file_name.endswith(".tcx"):
-            # Create file path
-            file_location = os.path.join(tcx_directory, file_name)
-            
-            # Read data from TCX file
-            tcx_reader = TCXReader()
-            data = tcx_reader.read(file_location)
-
-            # Extract data to DataFrame
-            df = pd.DataFrame({
-                "time": [tp.time for tp in data.trackpoints],
-                "latitude": [tp.latitude for tp in data.trackpoints],
-                "longitude": [tp.longitude for tp in data.trackpoints],
-                "altitude_meters": [tp.elevation for tp in data.trackpoints],
-                "distance_meters": [tp.distance for tp in data.trackpoints],
-                "heart_rate_bpm": [tp.hr_value for tp in data.trackpoints],
-                "cadence_rpm": [tp.cadence for tp in data.trackpoints],
-                "speed_mps": [tp.tpx_ext.get('Speed', None) for tp in data.trackpoints]
-            })
-
-            # Get activity id
-            filename = file_name.replace(".gz", "")
-            df_activities = df_activities.dropna(subset=['Nom du fichier'])
-            match = df_activities.loc[df_activities["Nom du fichier"].str.contains(filename)]
-            activity_id = match["ID de l'activité"].values[0]
 
-            # Append activity id to DataFrame
-            df["activity_id"] = activity_id
-
-            # Save DataFrame to CSV file
-            csv_filename = file_name.replace(".tcx", ".csv")
-            csv_location = os.path.join(csv_directory, csv_filename)
-            df.to_csv(csv_location, index=False)
+    # Index the activity ids of the activities file
+    activity_index = build_activity_id_index(activities_file)
+    manifest = load_manifest(manifest_path) if manifest_path else {}
+
+    results = []
+    try:
+        # Iterate over TCX files in directory
+        for file_name in os.listdir(tcx_directory):
+            if file_name.endswith(".tcx"):
+                # Create file path
+                file_location = os.path.join(tcx_directory, file_name)
+                csv_filename = file_name.replace(".tcx", ".csv")
+                csv_location = os.path.join(csv_directory, csv_filename)
+
+                # Get activity id
+                activity_id = activity_index.get(_activity_key(file_name))
+
+                if is_up_to_date(manifest, file_location, csv_location, 'tcx'):
+                    results.append({'file': file_name, 'status': 'skipped', 'activity_id': activity_id, 'rows': 0, 'error': None})
+                    continue
+
+                # Read data from TCX file
+                try:
+                    df = _tcx_to_dataframe(file_location)
+                except PARSE_ERRORS as error:
+                    results.append({'file': file_name, 'status': 'error', 'activity_id': activity_id, 'rows': 0, 'error': f"{type(error).__name__}: {error}"})
+                    continue
+
+                # Append activity id to DataFrame
+                df["activity_id"] = activity_id
+
+                # Save DataFrame to CSV file
+                _save_activity(df, csv_location)
+                record_in_manifest(manifest, file_location, csv_location, 'tcx')
+
+                status = 'written' if activity_id is not None else 'unmatched'
+                results.append({'file': file_name, 'status': status, 'activity_id': activity_id, 'rows': len(df), 'error': None})
+    finally:
+        # keep the files converted so far when a run is interrupted
+        if manifest_path:
+            save_manifest(manifest, manifest_path)
+
+    return pd.DataFrame(results, columns=['file', 'status', 'activity_id', 'rows', 'error'])
 
 def strava_test_tcx_csv(tcx_directory, activities_file, csv_directory):
     """
@@ -221,11 +621,14 @@ def strava_test_tcx_csv(tcx_directory, activities_file, csv_directory):
     :param tcx_directory: Directory containing TCX files
     :param activities_file: CSV file containing activity data
     :param csv_directory: Directory to save CSV files
+    :return: DataFrame with one row per TCX file and its 'file', 'status' ('written' or 'unmatched'), 'activity_id'
+             and 'rows' columns. 'unmatched' files have no entry in the activities file and are saved without id.
     """
     
-    # Load activities file
-    df_activities = pd.read_csv(activities_file)
+    # Index the activity ids of the activities file, the TCX files are named after the activity name
+    activity_index = build_activity_id_index(activities_file, filename_col='name', id_col='id')
     
+    results = []
     # Iterate over TCX files in directory
     for file_name in os.listdir(tcx_directory):
         if file_name.endswith(".tcx"):
@@ -233,23 +636,10 @@ def strava_test_tcx_csv(tcx_directory, activities_file, csv_directory):
             file_location = os.path.join(tcx_directory, file_name)
             
             # Read data from TCX file
-            tcx_reader = TCXReader()
-            data = tcx_reader.read(file_location)
-
-            # Extract data to DataFrame
-            df = pd.DataFrame({
-                "time": [tp.time for tp in data.trackpoints],
-                "altitude_meters": [tp.elevation for tp in data.trackpoints],
-                "distance_meters": [tp.distance for tp in data.trackpoints],
-                "heart_rate_bpm": [tp.hr_value for tp in data.trackpoints],
-                "cadence_rpm": [tp.cadence for tp in data.trackpoints],
-                "speed_mps": [tp.tpx_ext.get('Speed', None) for tp in data.trackpoints]
-            })
+            df = _tcx_to_dataframe(file_location, with_position=False)
 
             # Get activity id
-            df_activities['name_tcx'] = df_activities['name'] + '.tcx'
-            match = df_activities.loc[df_activities["name_tcx"].str.contains(file_name)]
-            activity_id = match["id"].values[0]
+            activity_id = activity_index.get(_activity_key(file_name))
 
             # Append activity id to DataFrame
             df["activity_id"] = activity_id
@@ -257,4 +647,117 @@ def strava_test_tcx_csv(tcx_directory, activities_file, csv_directory):
             # Save DataFrame to CSV file
             csv_filename = file_name.replace(".tcx", ".csv")
             csv_location = os.path.join(csv_directory, csv_filename)
-            df.to_csv(csv_location, index=False)
\ No newline at end of file
+            _save_activity(df, csv_location)
+
+            status = 'written' if activity_id is not None else 'unmatched'
+            results.append({'file': file_name, 'status': status, 'activity_id': activity_id, 'rows': len(df)})
+
+    return pd.DataFrame(results, columns=['file', 'status', 'activity_id', 'rows'])
+
+
+################################################################### INGEST STRAVA EXPORT ZIP ##################################################################
+# Errors raised on a corrupt archive member: parse errors, bad CRC, broken or truncated gzip stream, GPX not in UTF-8
+EXPORT_MEMBER_ERRORS = PARSE_ERRORS + (zipfile.BadZipFile, gzip.BadGzipFile, zlib.error, EOFError, UnicodeDecodeError)
+
+
+def _open_export_member(archive, info):
+    """
+    Open a member of the Strava export archive as a decompressed binary stream, inflating .gz members on the fly.
+
+    :param archive: Open zipfile.ZipFile of the export
+    :param info: ZipInfo of the member
+    :return: Binary file-like object
+    """
+    stream = archive.open(info)
+    if info.filename.endswith('.gz'):
+        stream = gzip.GzipFile(fileobj=stream)
+    return stream
+
+
+def _member_up_to_date(manifest, key, info, output_path, parser):
+    """
+    Check whether an archive member was already converted, unchanged, by the current version of its parser.
+    The CRC-32 stored in the archive directory stands for the content hash, so nothing is decompressed to check.
+    """
+    entry = manifest.get(key)
+    return (entry is not None and entry['parser_version'] == PARSER_VERSIONS[parser]
+            and entry['size'] == info.file_size and entry['crc32'] == info.CRC
+            and entry['output'] == os.path.normpath(output_path) and os.path.exists(output_path))
+
+
+def ingest_strava_export_zip(zip_path, csv_directory="data/activities_csv/", manifest_path=MANIFEST_PATH):
+    """
+    Convert the activities of a Strava bulk export straight from its .zip archive: the .fit, .gpx and .tcx members
+    (gzipped or not) are decompressed as streams and fed to the parsers, without extracting anything to disk.
+    The activity ids come from the activities.csv of the archive, a ValueError is raised if it has none.
+
+    :param zip_path: Path to the Strava export .zip file
+    :param csv_directory: Directory to save CSV files. Default is 'data/activities_csv/'
+    :param manifest_path: Path to the ingestion manifest, None converts every member without using a manifest
+    :return: DataFrame with one row per activity member and its 'file', 'status' ('written', 'unmatched', 'skipped'
+             or 'error'), 'activity_id', 'rows' and 'error' columns. A corrupt member is reported as 'error' and the
+             other members are still converted
+    """
+    os.makedirs(csv_directory, exist_ok=True)
+    manifest = load_manifest(manifest_path) if manifest_path else {}
+
+    results = []
+    try:
+        with zipfile.ZipFile(zip_path) as archive:
+            # Index the activity ids of the activities CSV file of the archive
+            activities_member = next((name for name in archive.namelist() if os.path.basename(name) == 'activities.csv'), None)
+            if activities_member is None:
+                raise ValueError(f"{zip_path} has no activities.csv, it is not a Strava bulk export archive")
+            with archive.open(activities_member) as activities_file:
+                activity_index = build_activity_id_index(pd.read_csv(activities_file))
+
+            members = [info for info in archive.infolist()
+                       if info.filename.lower().endswith(('.fit', '.fit.gz', '.gpx', '.gpx.gz', '.tcx', '.tcx.gz'))]
+            for info in tqdm(members):
+                file = os.path.basename(info.filename)
+                parser = file.lower().replace('.gz', '').rsplit('.', 1)[-1]
+                key = _activity_key(file)
+                csv_path = os.path.join(csv_directory, key + '.csv')
+                manifest_key = os.path.normpath(zip_path) + '::' + info.filename
+
+                if parser == 'gpx':
+                    # the GPX converter names the activity after the file
+                    activity_id = key
+                else:
+                    activity_id = activity_index.get(key)
+
+                if _member_up_to_date(manifest, manifest_key, info, csv_path, parser):
+                    results.append({'file': file, 'status': 'skipped', 'activity_id': activity_id, 'rows': 0, 'error': None})
+                    continue
+
+                try:
+                    with _open_export_member(archive, info) as stream:
+                        if parser == 'fit':
+                            df = pd.DataFrame(_read_fit_records(stream))
+                        elif parser == 'gpx':
+                            df = _gpx_to_dataframe(stream.read().decode('utf-8'))
+                        else:
+                            df = _tcx_to_dataframe(stream)
+                except EXPORT_MEMBER_ERRORS as error:
+                    results.append({'file': file, 'status': 'error', 'activity_id': activity_id, 'rows': 0, 'error': f"{type(error).__name__}: {error}"})
+                    continue
+
+                if parser == 'tcx':
+                    df["activity_id"] = activity_id
+                else:
+                    df.insert(0, 'activity_id', activity_id)
+                _save_activity(df, csv_path)
+
+                manifest[manifest_key] = {'size': info.file_size,
+                                          'crc32': info.CRC,
+                                          'output': os.path.normpath(csv_path),
+                                          'parser': parser,
+                                          'parser_version': PARSER_VERSIONS[parser]}
+                status = 'written' if activity_id is not None else 'unmatched'
+                results.append({'file': file, 'status': status, 'activity_id': activity_id, 'rows': len(df), 'error': None})
+    finally:
+        # keep the members converted so far when a run is interrupted
+        if manifest_path:
+            save_manifest(manifest, manifest_path)
+
+    return pd.DataFrame(results, columns=['file', 'status', 'activity_id', 'rows', 'error'])
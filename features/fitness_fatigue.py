@@ -1,9 +1,6 @@
+import os
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
-import seaborn as sns
-
-import plotly.graph_objs as go
 
 from features.utils import *
 from features.athlete_profile import *
@@ -32,12 +29,9 @@ def calculate_fitness_fatigue_form(data="data/zone_data_subdiv.csv"):
     zone_data = trimp(zone_data)
     #add Stress Score
     zone_data = HRSS(zone_data)
-    #add fitness
-    zone_data = calculate_fitness(zone_data)[0]
-    #add fatigue
-    zone_data = calculate_fatigue(zone_data)[0]
-    #add form
-    zone_data = calculate_form(zone_data)
+    #add fitness, fatigue and form, computed once
+    zone_data['Date'] = pd.to_datetime(zone_data['Date'])
+    zone_data = join_daily(zone_data, performance_management_chart(zone_data))
 
     return zone_data
 
@@ -51,6 +45,7 @@ def fitness_fatigue_form_graph(data="data/zone_data_subdiv.csv", time_offset: in
     Returns:
     - fig (plotly.graph_objs._figure.Figure): A plotly figure object containing the Fatigue, Fitness, and Form scores plotted over the last 'time_offset' months.
     """
+    import plotly.graph_objs as go
 
     #add metrics
     zone_data = calculate_fitness_fatigue_form(data)
@@ -104,7 +99,124 @@ def fitness_fatigue_form_graph(data="data/zone_data_subdiv.csv", time_offset: in
     # Show the plot
     return fig
 
-def predict_fitness_fatigue_form(duration, distance, avg_hr, df="data/zone_data_subdiv.csv", ftp=405, resting_hr=65, max_hr=190, lthr=172):
+def workout_hrss(duration, avg_hr, resting_hr=65, max_hr=190, lthr=172):
+    """
+    Heart Rate Stress Score of planned workouts from their duration and average heart rate, works on scalars
+    and NumPy arrays alike.
+    Args:
+    - duration (float or numpy.ndarray): Workout duration in minutes.
+    - avg_hr (float or numpy.ndarray): Average heart rate during the workout.
+    - resting_hr (float): Athlete resting heart rate. Default is 65.
+    - max_hr (float): Athlete max heart rate. Default is 190.
+    - lthr (float): Athlete Lactate Threshold Heart Rate. Default is 172.
+
+    Returns:
+    - float or numpy.ndarray: HRSS of each workout.
+    """
+    # Calculate Heart Rate Reserve (HRR)
+    hrr = (avg_hr - resting_hr) / (max_hr - resting_hr)
+
+    # Calculate Training Impulse (TRIMP)
+    trimp = duration * hrr * 0.64 * np.exp(1.92 * hrr)
+
+    # Calculate Hourly TRIMP at Lactate Threshold
+    hrr_lthr = (lthr - resting_hr) / (max_hr - resting_hr)
+    hour_trimp_lthr = 60*hrr_lthr*0.64*np.exp(1.92*hrr_lthr)
+
+    return (trimp / hour_trimp_lthr) * 100
+
+def simulate_training_plans(durations, avg_hrs, day_offsets, state=None, data="data/zone_data_subdiv.csv", resting_hr=65, max_hr=190, lthr=172, state_path=PMC_STATE_PATH, horizon=None):
+    """
+    Project the Fitness, Fatigue and Form trajectories of many training plans at once, starting from the PMC state.
+    Each plan is a row of workouts, every input array has the (n_plans, n_workouts) shape, or (n_plans,) for
+    plans of a single workout. Plans with fewer workouts are padded with NaN durations.
+    Args:
+    - durations (numpy.ndarray): Workout durations in minutes, NaN for no workout.
+    - avg_hrs (numpy.ndarray): Average heart rates of the workouts.
+    - day_offsets (numpy.ndarray): Day of each workout, 1 being the day after the state's last day. Several
+      workouts on the same day add up.
+    - state (dict): PMC state to start from. Default is None (the persisted state, updated with data).
+    - data (str): The path to the CSV file containing the data. Default value is "data/zone_data_subdiv.csv".
+    - resting_hr (float): Athlete resting heart rate. Default is 65.
+    - max_hr (float): Athlete max heart rate. Default is 190.
+    - lthr (float): Athlete Lactate Threshold Heart Rate. Default is 172.
+    - state_path (str): The path to the PMC state file. Default value is "data/pmc_state.json".
+    - horizon (int): Number of days to project. Default is None (up to the last workout).
+
+    Returns:
+    - dict: 'dates' (pandas.DatetimeIndex of the projected days) and the 'fitness', 'fatigue' and 'form'
+      (n_plans, n_days) arrays, unrounded. Form is the previous day's Fitness minus Fatigue.
+    """
+    if state is None:
+        state = update_pmc_state(data, state_path)
+
+    durations = np.asarray(durations, dtype=float)
+    if durations.ndim == 1:
+        durations = durations[:, None]
+    avg_hrs = np.broadcast_to(np.asarray(avg_hrs, dtype=float).reshape(len(durations), -1), durations.shape)
+    day_offsets = np.broadcast_to(np.asarray(day_offsets, dtype=int).reshape(len(durations), -1), durations.shape)
+    if horizon is None:
+        horizon = int(day_offsets.max())
+
+    # Daily load of every plan, the workouts after the horizon are dropped
+    hrss = np.nan_to_num(workout_hrss(durations, avg_hrs, resting_hr, max_hr, lthr))
+    kept = (day_offsets >= 1) & (day_offsets <= horizon)
+    plan = np.broadcast_to(np.arange(len(durations))[:, None], durations.shape)
+    load = np.zeros((len(durations), horizon))
+    np.add.at(load, (plan[kept], day_offsets[kept] - 1), hrss[kept])
+
+    fitness = exponential_load(load, FITNESS_DAYS, state['fitness'])
+    fatigue = exponential_load(load, FATIGUE_DAYS, state['fatigue'])
+    previous_form = np.full((len(durations), 1), state['fitness'] - state['fatigue'])
+    form = np.hstack([previous_form, (fitness - fatigue)[:, :-1]])
+
+    dates = pd.date_range(pd.Timestamp(state['last_date']) + pd.Timedelta(days=1), periods=horizon)
+    return {'dates': dates, 'fitness': fitness, 'fatigue': fatigue, 'form': form}
+
+def update_pmc_state(data="data/zone_data_subdiv.csv", state_path=PMC_STATE_PATH):
+    """
+    Bring the persisted PMC state up to date with the activities of the specified CSV file, only the activities
+    from the state's last day on are processed. The state is built from the whole history the first time, and again
+    when it was saved for another file or when the activities before its last day changed since.
+    Args:
+    - data (str): The path to the CSV file containing the data. Default value is "data/zone_data_subdiv.csv".
+    - state_path (str): The path to the PMC state file. Default value is "data/pmc_state.json".
+
+    Returns:
+    - dict: The updated PMC state, with the 'last_date', 'fitness', 'fatigue', 'base_fitness', 'base_fatigue',
+      'source' and 'history_hash' keys.
+    """
+    history = pd.read_csv(data, index_col="Unnamed: 0")
+    source = os.path.abspath(data)
+    state = load_pmc_state(state_path)
+
+    # A state of another file or of an edited history is rebuilt
+    if state is not None and (state.get('source') != source
+                              or state.get('history_hash') != pmc_history_hash(history, state['last_date'])):
+        state = None
+
+    # Only the activities from the state's last day on need their stress score, the ones of that day are applied again
+    zone_data = history
+    if state is not None:
+        zone_data = history[pd.to_datetime(history['Date']).dt.normalize() >= pd.Timestamp(state['last_date'])]
+        if zone_data.empty:
+            # the activities of the state's last day were removed
+            state, zone_data = None, history
+    zone_data = zone_data.copy()
+
+    zone_data = calculate_new_relative_effort(zone_data)
+    zone_data = training_load_measure(zone_data, 405)
+    zone_data = HRR(zone_data, 65, 190)
+    zone_data = trimp(zone_data)
+    zone_data = HRSS(zone_data)
+
+    state = pmc_state_from_history(zone_data) if state is None else advance_pmc_state(state, zone_data)
+    state.update({'source': source, 'history_hash': pmc_history_hash(history, state['last_date'])})
+    save_pmc_state(state, state_path)
+
+    return state
+
+def predict_fitness_fatigue_form(duration, distance, avg_hr, df="data/zone_data_subdiv.csv", ftp=405, resting_hr=65, max_hr=190, lthr=172, state_path=PMC_STATE_PATH):
     """
     Calculate fitness, fatigue, and form based on activity duration, distance, and average heart rate.
 
@@ -116,28 +228,18 @@ def predict_fitness_fatigue_form(duration, distance, avg_hr, df="data/zone_data_
         resting_hr (float): Athlete resting heart rate. Default is 65.
         max_hr (float): Athlete max heart rate. Default is 190.
         lthr (float): Athlete Lactate Threshold Heart Rate. Default is 172.
+        state_path (str): Persisted PMC state, updated with the new activities of df. Default is "data/pmc_state.json".
 
     Returns:
         Tuple[float, float, float]: Fitness, fatigue, and form scores.
     """
-    zone_data = calculate_fitness_fatigue_form(df)
-    
-    # Calculate Heart Rate Reserve (HRR)
-    hrr = (avg_hr - resting_hr) / (max_hr - resting_hr)
-    
-    # Calculate Training Impulse (TRIMP)
-    trimp = duration * hrr * 0.64 * np.exp(1.92 * hrr)
-    
-    # Calculate Hourly TRIMP at Lactate Threshold
-    hrr_lthr = (lthr - resting_hr) / (max_hr - resting_hr)
-    hour_trimp_lthr = 60*hrr_lthr*0.64*np.exp(1.92*hrr_lthr)
+    state = update_pmc_state(df, state_path)
     
     # Calculate Heart Rate Stress Score (HRSS)
-    hrss = (trimp / hour_trimp_lthr) * 100
-
+    hrss = workout_hrss(duration, avg_hr, resting_hr, max_hr, lthr)
 
-    previous_fatigue = zone_data.iloc[-1]['Fatigue']
-    previous_fitness = zone_data.iloc[-1]['Fitness']
+    previous_fatigue = round(state['fatigue'], 1)
+    previous_fitness = round(state['fitness'], 1)
     
     # Calculate Fitness, Fatigue, and Form
     fitness = round(previous_fitness + (hrss - previous_fitness) * (1 - math.exp(-1/42)),2)
@@ -1,25 +1,4 @@
-import matplotlib.pyplot as plt
 import pandas as pd
-import seaborn as sns
-import numpy as np
-import datetime
-from datetime import timedelta
-
-import plotly.express as px
-import plotly.graph_objects as go
-import plotly.subplots as sp
-from plotly.graph_objects import Layout
-
-from reportlab.pdfgen import canvas
-from reportlab.lib.pagesizes import A4
-from reportlab.lib.utils import ImageReader
-from reportlab.lib.colors import HexColor
-from reportlab.lib.styles import ParagraphStyle
-from reportlab.lib.units import inch
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer
-from reportlab.lib.units import cm
-import plotly.io as pio
-from reportlab.lib.units import inch
 
 import warnings
 warnings.simplefilter("ignore", UserWarning)
@@ -27,6 +6,7 @@ warnings.simplefilter("ignore", UserWarning)
 from features.utils import *
 from features.athlete_profile import *
 from features.visuals import *
+from features.power_curve import per_second, mean_maximal, best_average
 
 
 def generate_activity_pdf(date="2023-02-18", saving_name ='activity_metrics.pdf'):
@@ -40,9 +20,17 @@ def generate_activity_pdf(date="2023-02-18", saving_name ='activity_metrics.pdf'
     Returns:
     - df_activity_visual (pandas.DataFrame): The original DataFrame with new columns for the time spent in each speed zone.
     """
+    # reportlab and the plotly image export are only needed here, not when the features package is imported
+    from reportlab.pdfgen import canvas
+    from reportlab.lib.pagesizes import A4
+    from reportlab.lib.utils import ImageReader
+    from reportlab.lib.units import inch, cm
+    import plotly.io as pio
+
     #load data
-    df_activity_visual = activity_dive_in_dataset('data/zone_data_6.csv', 'data/athlete_profile_dataset.csv', date)[0]
-    data = activity_dive_in_dataset('data/zone_data_6.csv', 'data/athlete_profile_dataset.csv', date)[1]
+    df_activity_visual, data = activity_dive_in_dataset('data/zone_data_6.csv', 'data/athlete_profile_dataset.csv', date)
+    # zone histograms of every channel at once, from the loaded samples whose speed is already in km/h
+    histograms = activity_zone_histograms(data, dict(ZONE_CHANNELS, speed=(speed_zone_table, 'enhanced_speed', 1)))
 
 
     w, h = A4
@@ -84,14 +72,11 @@ def generate_activity_pdf(date="2023-02-18", saving_name ='activity_metrics.pdf'
     #normalized power kg
     norm_power_kg = round((df_activity_visual['Puissance moyenne pondérée']/70)[0],2)
 
-    # Convert the timestamp column to a datetime object and set it as the index
+    # Convert the timestamp column to a datetime object
     data['timestamp'] = pd.to_datetime(data['timestamp'])
-    #rolling data
-    data_rolling = data.copy()
-    data_rolling.set_index('timestamp', inplace=True)
-    # Resample the data to 1-minute intervals
-    data_rolling = data_rolling.resample('1T').mean()
-    power_20min = round(data_rolling['power'].rolling('20min').mean().max(),0)
+    # 1 Hz series over the moving time, the best averages and the power curve come from their cumulative sums
+    power_1s = per_second(data['timestamp'], data['power'])
+    power_20min = round(best_average(power_1s, 1200), 0)
 
     ####################################### PRINT METRICS ######################################
     # Calculate total width available for metrics
@@ -154,8 +139,9 @@ def generate_activity_pdf(date="2023-02-18", saving_name ='activity_metrics.pdf'
     trimp_per_hour = round(trimp / ((df_activity_visual['Durée de déplacement']/60)[0]), 2)
 
     # Calculate the rolling mean heart rate for 20 and 60 minute windows
-    hr_20min = data_rolling['heart_rate'].rolling('20min').mean().max()
-    hr_60min = data_rolling['heart_rate'].rolling('60min').mean().max()
+    hr_1s = per_second(data['timestamp'], data['heart_rate'])
+    hr_20min = best_average(hr_1s, 1200)
+    hr_60min = best_average(hr_1s, 3600)
 
     # Calculate width per metric
     metric_width4 = total_width / 4
@@ -195,7 +181,7 @@ def generate_activity_pdf(date="2023-02-18", saving_name ='activity_metrics.pdf'
     c.drawString(30+metric_width4*3, 405, str(round(hr_60min,0)))
 
     ################################### SPEED ###############################################
-    speed_fig = plot_speed_zones(df_activity_visual)
+    speed_fig = plot_speed_zones(df_activity_visual, histograms=histograms)
     # Save plot as PNG file
     pio.write_image(speed_fig, 'visuals/speed_plot.png', width=1200, height=500)
 
@@ -212,7 +198,7 @@ def generate_activity_pdf(date="2023-02-18", saving_name ='activity_metrics.pdf'
     c.drawImage('visuals/speed_plot.png', x=60, y=50, width=7*inch, height=3.08*inch)
 
     # Assuming the data is in a DataFrame called 'data' with a column 'enhanced_speed'
-    speed_20min = data_rolling['enhanced_speed'].rolling('20min').mean().max()
+    speed_20min = best_average(per_second(data['timestamp'], data['enhanced_speed']), 1200)
     # Calculate standard deviation of speed
     std_speed = data['enhanced_speed'].std()
     #average speed
@@ -236,7 +222,7 @@ def generate_activity_pdf(date="2023-02-18", saving_name ='activity_metrics.pdf'
     c.showPage()
 
     ########################################## POWER ##########################################
-    power_fig = plot_power_zones(df_activity_visual)
+    power_fig = plot_power_zones(df_activity_visual, histograms=histograms)
     # Save plot as PNG file
     pio.write_image(power_fig, 'visuals/power_plot.png', width=1200, height=500)
 
@@ -252,8 +238,6 @@ def generate_activity_pdf(date="2023-02-18", saving_name ='activity_metrics.pdf'
     # Draw image on canvas
     c.drawImage('visuals/power_plot.png', x=60, y=530, width=7*inch, height=3.08*inch)
 
-    # Assuming the data is in a DataFrame called 'data' with a column 'enhanced_speed'
-    power_20min = round(data_rolling['power'].rolling('20min').mean().max(),0)
     #average speed
     power_avg =round(df_activity_visual['Puissance moyenne pondérée'][0], 1)
     #variability index
@@ -288,7 +272,7 @@ def generate_activity_pdf(date="2023-02-18", saving_name ='activity_metrics.pdf'
     c.drawString(30+metric_width3, 455, str(norm_power_kg)+ 'W/kg')
 
     ############################################################### POWER CURVE #########################################################################
-    fig_power_curve = plot_power_curve(df_activity_visual, data)
+    fig_power_curve = plot_power_curve(df_activity_visual, data, curve=mean_maximal(power_1s))
     # Save plot as PNG file
     pio.write_image(fig_power_curve, 'visuals/power_curve.png', width=1200, height=500)
 
@@ -308,7 +292,7 @@ def generate_activity_pdf(date="2023-02-18", saving_name ='activity_metrics.pdf'
     # Start a new page
     c.showPage()
 
-    cadence_fig = plot_cadence_zones(df_activity_visual)
+    cadence_fig = plot_cadence_zones(df_activity_visual, histograms=histograms)
     # Save plot as PNG file
     pio.write_image(cadence_fig, 'visuals/cadence_plot.png', width=1200, height=700)
     
@@ -325,7 +309,7 @@ def generate_activity_pdf(date="2023-02-18", saving_name ='activity_metrics.pdf'
     c.drawImage('visuals/cadence_plot.png', x=10, y=530, width=8*inch, height=3.08*inch)
 
     ########################################################## GRADE ##################################################################################
-    grade_fig = plot_grade_zones(df_activity_visual)
+    grade_fig = plot_grade_zones(df_activity_visual, histograms=histograms)
     # Save plot as PNG file
     pio.write_image(grade_fig, 'visuals/grade_plot.png', width=1200, height=700)
 
@@ -435,7 +419,7 @@ def generate_activity_pdf(date="2023-02-18", saving_name ='activity_metrics.pdf'
 
 
     ############################################################### ELEVATION ##########################################################################
-    elevation_fig = plot_elevation_zones(df_activity_visual)
+    elevation_fig = plot_elevation_zones(df_activity_visual, histograms=histograms)
     # Save plot as PNG file
     pio.write_image(elevation_fig, 'visuals/elevation_plot.png', width=1200, height=500)
 
@@ -0,0 +1,145 @@
+import numpy as np
+import pandas as pd
+
+# Durations (s) of the power curve table and axis ticks, always part of the duration grid
+POWER_CURVE_DURATIONS = [1, 2, 3, 5, 10, 20, 30, 60, 120, 300, 600, 1200, 1800, 3600, 7200]
+# Number of log-spaced durations per decade of the default duration grid
+DURATIONS_PER_DECADE = 48
+
+
+################################################################# 1 HZ SERIES ##########################################################
+def per_second(timestamps, values):
+    """
+    1 Hz series of an activity channel: the samples of each second are averaged, as resample('1s').mean() does, and
+    the seconds without a sample (pauses, recording gaps) and the NaN values are left out, so the series runs over
+    the moving time.
+
+    Args:
+        timestamps: sample timestamps, as datetimes or date strings.
+        values: channel samples, e.g. power in W.
+
+    Returns:
+        numpy.ndarray: average value of each recorded second, in time order.
+    """
+    seconds = pd.to_datetime(pd.Series(timestamps)).dt.floor('s').to_numpy(dtype='datetime64[s]').astype('int64')
+    values = np.asarray(values, dtype=float)
+    valid = ~np.isnan(values) & (seconds != np.iinfo('int64').min)
+    if not valid.any():
+        return np.empty(0)
+
+    seconds = seconds[valid] - seconds[valid].min()
+    sums = np.bincount(seconds, weights=values[valid])
+    counts = np.bincount(seconds)
+    recorded = counts > 0
+    return sums[recorded] / counts[recorded]
+
+
+############################################################# MEAN MAXIMAL POWER ########################################################
+def duration_grid(n_seconds, per_decade=DURATIONS_PER_DECADE, durations=POWER_CURVE_DURATIONS):
+    """
+    Log-spaced durations from 1 s up to the ride length, dense enough for a smooth curve, with the given durations
+    and the ride length itself.
+
+    Args:
+        n_seconds: ride length in seconds (length of the 1 Hz series).
+        per_decade: number of durations per decade. Default is 48.
+        durations: durations always included when not longer than the ride. Default is POWER_CURVE_DURATIONS.
+
+    Returns:
+        numpy.ndarray: sorted unique integer durations in seconds.
+    """
+    if n_seconds < 1:
+        return np.empty(0, dtype='int64')
+    grid = np.logspace(0, np.log10(n_seconds), int(np.ceil(per_decade * np.log10(n_seconds))) + 1)
+    grid = np.concatenate([np.round(grid), durations, [n_seconds]]).astype('int64')
+    return np.unique(grid[(grid >= 1) & (grid <= n_seconds)])
+
+
+def mean_maximal(values, durations=None):
+    """
+    Best average of a 1 Hz series over every duration of a grid (mean-maximal power for a power series). The series
+    is summed once, then the best average over d seconds is the largest difference of the cumulative sums d seconds
+    apart, one vectorized pass per duration reusing the same buffer, so the memory stays proportional to the ride.
+
+    The default log-spaced grid makes the whole curve O(n log n). The exact curve of every duration from 1 s to the
+    ride length, durations=np.arange(1, n + 1), is O(n^2): keep it for short rides.
+
+    Args:
+        values: 1 Hz series, e.g. from per_second.
+        durations: durations in seconds. Default is None (duration_grid of the series). Durations longer than the
+                   series are left out.
+
+    Returns:
+        pandas.Series: best average for each duration, indexed by the duration in seconds.
+    """
+    values = np.asarray(values, dtype=float)
+    n = len(values)
+    durations = duration_grid(n) if durations is None else np.unique(np.asarray(durations, dtype='int64'))
+    durations = durations[(durations >= 1) & (durations <= n)]
+
+    cumulative = np.concatenate([[0.0], np.cumsum(values)])
+    buffer = np.empty(n)
+    best = np.empty(len(durations))
+    for i, d in enumerate(durations):
+        window_sums = np.subtract(cumulative[d:], cumulative[:-d], out=buffer[:n - d + 1])
+        best[i] = window_sums.max() / d
+
+    return pd.Series(best, index=pd.Index(durations, name='duration'), name='mean_maximal')
+
+
+def mean_maximal_power(df_data, durations=None):
+    """
+    Mean-maximal power curve of an activity.
+
+    Args:
+        df_data: activity samples with the 'timestamp' and 'power' columns.
+        durations: durations in seconds. Default is None (log-spaced grid up to the ride length, see duration_grid).
+
+    Returns:
+        pandas.Series: best average power (W) for each duration, indexed by the duration in seconds.
+    """
+    return mean_maximal(per_second(df_data['timestamp'], df_data['power']), durations)
+
+
+def best_average(values, duration):
+    """
+    Best average of a 1 Hz series over one duration, e.g. the best 20 min power. When the series is shorter than the
+    duration, it is the average of the whole series.
+
+    Args:
+        values: 1 Hz series, e.g. from per_second.
+        duration: duration in seconds.
+
+    Returns:
+        float: best average, NaN for an empty series.
+    """
+    values = np.asarray(values, dtype=float)
+    if len(values) == 0:
+        return np.nan
+    return float(mean_maximal(values, [min(int(duration), len(values))]).iloc[0])
+
+
+################################################################### FTP #################################################################
+def estimate_ftp(curve, method='20min'):
+    """
+    Estimate the functional threshold power from a mean-maximal power curve.
+
+    Args:
+        curve (pandas.Series): best average power indexed by the duration in seconds, from mean_maximal_power. It can
+                               hold the best of many activities, e.g. pd.concat(curves, axis=1).max(axis=1).
+        method (str): '20min' (default) takes 95% of the best 20 min power. 'critical_power' fits the work done over
+                      the 3 to 20 min durations of the curve as CP * duration + W' and returns the critical power CP.
+
+    Returns:
+        float: estimated FTP in W, NaN when the curve does not reach the durations the method needs.
+    """
+    if method == '20min':
+        return float(0.95 * curve.loc[1200]) if 1200 in curve.index else np.nan
+    if method == 'critical_power':
+        efforts = curve[(curve.index >= 180) & (curve.index <= 1200)]
+        if len(efforts) < 2:
+            return np.nan
+        durations = efforts.index.to_numpy(dtype=float)
+        critical_power, _ = np.polyfit(durations, efforts.to_numpy() * durations, 1)
+        return float(critical_power)
+    raise ValueError(f"Unknown FTP estimation method '{method}', use '20min' or 'critical_power'")
@@ -0,0 +1,146 @@
+import os
+import json
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+from scipy.optimize import least_squares
+
+from features.athlete_profile import relative_effort_features, RELATIVE_EFFORT_COEFFICIENTS
+from features.utils import _atomic_write_json
+
+# Fitted coefficients of every athlete, read by calculate_new_relative_effort
+COEFFICIENTS_PATH = "data/relative_effort_coefficients.json"
+# Format version of the coefficients file
+COEFFICIENTS_VERSION = 1
+
+
+##################################################### FIT RELATIVE EFFORT ######################################################
+def relative_effort_design(df, n_zones=7, effort="Mesure d'effort", duration='Durée de déplacement', max_hr=190):
+    """
+    Design matrix and target of the relative effort fit, keeping the activities with all their zone columns and a
+    Strava relative effort.
+
+    Args:
+    - df (pandas.DataFrame): activities with the time_z*/avgHR_z* columns, e.g. from calculate_time_in_zones_RE.
+    - n_zones (int): number of zones of the model. Default is 7.
+    - effort (str): Strava relative effort column. Default is "Mesure d'effort".
+    - duration (str): moving time column. Default is 'Durée de déplacement'.
+    - max_hr (float): heart rate normalising the zone averages. Default is 190.
+
+    Returns:
+    - tuple(numpy.ndarray, numpy.ndarray): (activities x zones) weighted durations and relative efforts.
+    """
+    zones = range(1, n_zones + 1)
+    X = relative_effort_features(df[[f'time_z{zone}' for zone in zones]].to_numpy(dtype=float),
+                                 df[[f'avgHR_z{zone}' for zone in zones]].to_numpy(dtype=float),
+                                 df[duration].to_numpy(dtype=float), max_hr)
+    y = pd.to_numeric(df[effort], errors='coerce').to_numpy(dtype=float)
+
+    valid = np.isfinite(X).all(axis=1) & np.isfinite(y)
+    return X[valid], y[valid]
+
+
+def fit_relative_effort(df, n_zones=7, x0=None, effort="Mesure d'effort", duration='Durée de déplacement', max_hr=190):
+    """
+    Fit the coefficients of all the zones jointly on the activities of one athlete. The model is linear in the
+    coefficients, so the residual is X @ coefficients - effort and its Jacobian is X.
+
+    Args:
+    - df (pandas.DataFrame): activities with the time_z*/avgHR_z* columns and the Strava relative effort.
+    - n_zones (int): number of zones of the model. Default is 7.
+    - x0 (array-like): initial coefficients. Default is None (RELATIVE_EFFORT_COEFFICIENTS for 7 zones, 1 otherwise).
+    - effort (str): Strava relative effort column. Default is "Mesure d'effort".
+    - duration (str): moving time column. Default is 'Durée de déplacement'.
+    - max_hr (float): heart rate normalising the zone averages. Default is 190.
+
+    Returns:
+    - dict: 'coefficients' (one per zone), 'rmse', 'n_activities', 'max_hr' and 'fitted_at'.
+    """
+    X, y = relative_effort_design(df, n_zones, effort, duration, max_hr)
+    if len(y) < n_zones:
+        raise ValueError(f"{len(y)} activities with a relative effort, at least {n_zones} are needed to fit {n_zones} zones")
+    if x0 is None:
+        x0 = RELATIVE_EFFORT_COEFFICIENTS if n_zones == len(RELATIVE_EFFORT_COEFFICIENTS) else np.ones(n_zones)
+
+    result = least_squares(lambda coefficients: X @ coefficients - y, x0=np.asarray(x0, dtype=float), jac=lambda coefficients: X)
+
+    return {'coefficients': result.x.tolist(),
+            'rmse': float(np.sqrt(np.mean(result.fun ** 2))),
+            'n_activities': int(len(y)),
+            'max_hr': max_hr,
+            'fitted_at': datetime.now().isoformat(timespec='seconds')}
+
+
+def _fit_athlete(task):
+    """
+    Fit of one athlete in a worker process, errors are returned instead of raised.
+    """
+    athlete, df, kwargs = task
+    try:
+        return athlete, fit_relative_effort(df, **kwargs)
+    except (ValueError, KeyError) as e:
+        return athlete, {'error': str(e)}
+
+
+def fit_relative_effort_athletes(athletes, n_workers=1, **kwargs):
+    """
+    Fit the relative effort coefficients of many athletes, in worker processes if requested.
+
+    Args:
+    - athletes (dict): activities DataFrame of each athlete, keyed on the athlete name.
+    - n_workers (int): number of worker processes. 1 (default) fits in the current process, None uses one worker per CPU.
+    - **kwargs: arguments of fit_relative_effort (n_zones, x0, effort, duration, max_hr).
+
+    Returns:
+    - dict: fit of each athlete, or {'error': message} for the athletes that could not be fitted.
+    """
+    tasks = [(athlete, df, kwargs) for athlete, df in athletes.items()]
+    if n_workers == 1:
+        return dict(_fit_athlete(task) for task in tasks)
+    with ProcessPoolExecutor(max_workers=n_workers) as executor:
+        return dict(executor.map(_fit_athlete, tasks))
+
+
+##################################################### COEFFICIENTS FILE ######################################################
+def save_coefficients(fits, path=COEFFICIENTS_PATH):
+    """
+    Add fitted coefficients to the coefficients file, replacing the previous fit of the same athletes. Fits with
+    an error are not saved.
+
+    Args:
+    - fits (dict): fit of each athlete, from fit_relative_effort_athletes or {athlete: fit_relative_effort(...)}.
+    - path (str): path to the coefficients .json file. Default is 'data/relative_effort_coefficients.json'.
+
+    Returns:
+    - None
+    """
+    content = {'version': COEFFICIENTS_VERSION, 'athletes': {}}
+    if os.path.exists(path):
+        with open(path, 'r') as f:
+            content['athletes'] = json.load(f).get('athletes', {})
+    content['athletes'].update({athlete: fit for athlete, fit in fits.items() if 'error' not in fit})
+
+    _atomic_write_json(path, content)
+
+
+def load_coefficients(athlete='default', path=COEFFICIENTS_PATH):
+    """
+    Load the fitted relative effort coefficients of an athlete.
+
+    Args:
+    - athlete (str): athlete name. Default is 'default'.
+    - path (str): path to the coefficients .json file. Default is 'data/relative_effort_coefficients.json'.
+
+    Returns:
+    - list: one coefficient per zone, None if the file or the athlete does not exist.
+    """
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r') as f:
+        content = json.load(f)
+    if content.get('version') != COEFFICIENTS_VERSION:
+        raise ValueError(f"{path} has version {content.get('version')}, version {COEFFICIENTS_VERSION} is expected")
+    fit = content['athletes'].get(athlete)
+    return None if fit is None else fit['coefficients']
@@ -0,0 +1,512 @@
+import os
+import struct
+import datetime
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+from scipy.signal import lfilter
+
+from features.athlete_profile import calculate_hr_zones_RE, time_in_hr_zones, relative_effort
+
+# French month abbreviations of the Strava export dates
+FRENCH_MONTHS = ['janv.', 'févr.', 'mars', 'avr.', 'mai', 'juin', 'juil.', 'août', 'sept.', 'oct.', 'nov.', 'déc.']
+
+# Header of the French Strava export activities.csv, loadData selects its columns by position
+STRAVA_EXPORT_COLUMNS = [
+    "ID de l'activité", "Date de l'activité", "Nom de l'activité", "Type d'activité", "Description de l'activité",
+    "Temps écoulé", "Distance", "Fréquence cardiaque maximum", "Mesure d'effort", "Trajet domicile-travail",
+    "Note privée sur l'activité", "Équipement utilisé pour l'activité", "Nom du fichier", "Poids de l'athlète",
+    "Poids du vélo", "Temps écoulé", "Durée de déplacement", "Distance", "Vitesse max.", "Vitesse moyenne",
+    "Dénivelé positif", "Dénivelé négatif", "Altitude min.", "Altitude max.", "Pente max.", "Pente moyenne",
+    "Pente positive moyenne", "Pente négative moyenne", "Cadence max.", "Cadence moyenne",
+    "Fréquence cardiaque maximum", "Fréquence cardiaque moyenne", "Puissance max.", "Puissance moyenne", "Calories",
+    "Température max.", "Température moyenne", "Mesure d'effort", "Travail total", "Nombre de descentes",
+    "Temps en montée", "Temps en descente", "Autre temps", "Effort perçu", "Type", "Heure de début",
+    "Puissance moyenne pondérée", "Nombre d'échantillons de puissance", "Préférer l'effort perçu",
+    "Effort relatif perçu", "Trajet domicile-travail", "Poids total soulevé", "Depuis le téléversement",
+    "Distance ajustée à la pente", "Heure de l'observation météo", "Conditions météo", "Température météo",
+    "Température apparente", "Point de rosée", "Humidité", "Pression atmosphérique", "Vitesse du vent",
+    "Rafales de vent", "Direction du vent", "Intensité des précipitations", "Heure du lever du soleil",
+    "Heure du coucher du soleil", "Phase de la lune", "Vélo", "Équipement", "Probabilité de précipitations",
+    "Type de précipitations", "Couverture nuageuse", "Visibilité météo", "Indice UV", "Ozone", "Nombre de sauts",
+    "Difficulté totale", "Fluidité moyenne", "Signalée"]
+
+# Rider and bike used to turn power into speed
+RIDER_MASS = 70
+BIKE_MASS = 9
+CDA = 0.32
+CRR = 0.004
+AIR_DENSITY = 1.2
+
+# Start of the FIT timestamps (1989-12-31 00:00:00 UTC)
+FIT_EPOCH = pd.Timestamp('1989-12-31', tz='UTC')
+
+
+######################################################## RETROENGINEERING GENERATOR ##################################################
+def generate_tcx(distance, hr, start_time, duration):
+    """
+    Generate the .tcx file of a ride with a trackpoint every 100 m and a heart rate going up by steps along the ride,
+    as used in retroengineering.ipynb to produce tcx_files_generated/.
+
+    Args:
+        distance (int): Distance of the ride in meters.
+        hr (int): Heart rate written as the lap average and maximum.
+        start_time (datetime.datetime): Start of the ride.
+        duration (datetime.timedelta): Duration of the ride.
+
+    Returns:
+        str: Content of the .tcx file.
+    """
+    duration_seconds = duration.total_seconds()
+
+    # Create trackpoints
+    trackpoints = []
+    for i in range(0, distance + 100, 100):
+        time_delta = datetime.timedelta(seconds=(duration_seconds * i) // distance)
+        time = start_time + time_delta
+
+        if i < distance * 0.1:
+            curr_hr = 110
+        elif i < distance * 0.3:
+            curr_hr = 140
+        elif i < distance * 0.5:
+            curr_hr = 160
+        elif i < distance * 0.7:
+            curr_hr = 180
+        else:
+            curr_hr = 200
+
+        trackpoints.append(f"""
+                <Trackpoint>
+                    <Time>{time.isoformat()}Z</Time>
+                    <Position>
+                        <LatitudeDegrees>43.7015550</LatitudeDegrees>
+                        <LongitudeDegrees>5.6726370</LongitudeDegrees>
+                    </Position>
+                    <HeartRateBpm>
+                        <Value>{curr_hr}</Value>
+                    </HeartRateBpm>
+                    <DistanceMeters>{i}</DistanceMeters>
+                </Trackpoint>
+        """)
+
+    return _tcx_document(start_time, duration_seconds, distance, hr, hr, ''.join(trackpoints))
+
+
+def _tcx_document(start_time, duration_seconds, distance, avg_hr, max_hr, trackpoints):
+    """
+    Wrap trackpoints into a single lap .tcx document.
+    """
+    start = pd.Timestamp(start_time).strftime('%Y-%m-%dT%H:%M:%SZ')
+    return f"""<?xml version='1.0' encoding='utf-8'?>
+<TrainingCenterDatabase xmlns:ns2="http://www.garmin.com/xmlschemas/UserProfile/v2" xmlns:ns3="http://www.garmin.com/xmlschemas/ActivityExtension/v2" xmlns:ns4="http://www.garmin.com/xmlschemas/ProfileExtension/v1" xmlns:ns5="http://www.garmin.com/xmlschemas/ActivityGoals/v1" xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" xmlns="http://www.garmin.com/xmlschemas/TrainingCenterDatabase/v2" xsi:schemaLocation="http://www.garmin.com/xmlschemas/TrainingCenterDatabase/v2 http://www.garmin.com/xmlschemas/TrainingCenterDatabasev2.xsd">
+  <Activities>
+    <Activity Sport="Biking">
+      <Id>{start}</Id>
+      <Lap StartTime="{start}">
+        <TotalTimeSeconds>{duration_seconds:.0f}</TotalTimeSeconds>
+        <DistanceMeters>{distance}</DistanceMeters>
+        <MaximumSpeed>0.0</MaximumSpeed>
+        <Calories>0</Calories>
+        <AverageHeartRateBpm>
+          <Value>{avg_hr}</Value>
+        </AverageHeartRateBpm>
+        <MaximumHeartRateBpm>
+          <Value>{max_hr}</Value>
+        </MaximumHeartRateBpm>
+        <Intensity>Active</Intensity>
+        <TriggerMethod>Manual</TriggerMethod>
+        <Track>{trackpoints}
+        </Track>
+      </Lap>
+    </Activity>
+  </Activities>
+</TrainingCenterDatabase>
+"""
+
+
+######################################################## SYNTHETIC RIDES ##################################################
+def _speed_from_power(power, grade):
+    """
+    Steady state speed (m/s) of the rider for each power (W) and grade (%), solving
+    power = 0.5 rho CdA v^3 + m g (Crr + grade) v by bisection on all the samples at once.
+    """
+    a = 0.5 * AIR_DENSITY * CDA
+    b = (RIDER_MASS + BIKE_MASS) * 9.81 * (CRR + grade / 100)
+    low = np.zeros(len(power))
+    high = np.full(len(power), 30.0)
+    for _ in range(30):
+        mid = (low + high) / 2
+        too_fast = a * mid ** 3 + b * mid > power
+        high = np.where(too_fast, mid, high)
+        low = np.where(too_fast, low, mid)
+    return (low + high) / 2
+
+
+def synthetic_ride(start_time, duration, seed=0, ftp=250, max_hr=190, resting_hr=60, intensity=None,
+                   latitude=43.701555, longitude=5.672637):
+    """
+    Simulate a 1 Hz bike ride: power intervals over a rolling terrain ending near the start elevation, speed from the
+    power and the grade, heart rate following the power with a lag and a drift, cadence, altitude and a GPS track,
+    with a few stops.
+
+    Args:
+        start_time (datetime.datetime): Start of the ride, in UTC.
+        duration (int): Duration of the ride in seconds.
+        seed (int or list): Seed of the random generator, the same seed gives the same ride. Default is 0.
+        ftp (float): Functional Threshold Power of the rider. Default is 250.
+        max_hr (int): Max heart rate of the rider. Default is 190.
+        resting_hr (int): Resting heart rate of the rider. Default is 60.
+        intensity (float): Average power as a share of the FTP. Default is None (random between 0.55 and 0.85).
+        latitude (float): Latitude of the start. Default is 43.701555.
+        longitude (float): Longitude of the start. Default is 5.672637.
+
+    Returns:
+        pandas.DataFrame: One row per second with the columns of the .csv files converted from .fit files:
+                          'timestamp', 'position_lat', 'position_long' (semicircles), 'distance' (m), 'enhanced_speed'
+                          (m/s), 'altitude', 'enhanced_altitude' (m), 'heart_rate', 'cadence', 'power', 'grade' (%),
+                          'temperature', plus the cumulated 'ascent' and 'descent' (m).
+    """
+    rng = np.random.default_rng(seed)
+    n = int(duration)
+    start_time = pd.Timestamp(start_time)
+    start_time = start_time.tz_localize('UTC') if start_time.tzinfo is None else start_time.tz_convert('UTC')
+    if intensity is None:
+        intensity = rng.uniform(0.55, 0.85)
+
+    # Rolling terrain: mean-reverting grade
+    grade = lfilter([0.5], [1, -0.99], rng.normal(size=n))
+
+    # Power: blocks of constant effort, pushed up on the climbs, with short term noise
+    n_blocks = max(1, n // 300)
+    block_ends = np.sort(rng.choice(np.arange(1, n), size=min(n_blocks, n - 1), replace=False)) if n > 1 else []
+    block_levels = intensity * np.exp(rng.normal(0, 0.15, len(block_ends) + 1))
+    effort = ftp * np.repeat(block_levels, np.diff(np.concatenate([[0], block_ends, [n]])))
+    effort += lfilter([0.2], [1, -0.8], rng.normal(0, 0.1 * ftp, n))
+    coasting_draw = rng.random(n)
+
+    # A few stops (traffic lights, breaks) where the rider stands still but the recording goes on
+    stopped = np.zeros(n, dtype=bool)
+    for start in rng.integers(0, n, rng.integers(0, 6)):
+        stopped[start:start + rng.integers(10, 180)] = True
+
+    # Descents are ridden faster than climbs, so a grade centred in time loses altitude along the ride: the grade is
+    # shifted by its distance weighted mean until the ride ends near its start elevation
+    for _ in range(4):
+        grade = np.clip(grade, -12, 12)
+        power = effort + ftp * 0.03 * np.clip(grade, 0, None)
+        power[(grade < -2) & (coasting_draw < 0.7)] *= 0.1
+        power = np.clip(np.where(stopped, 0, power), 0, 3 * ftp)
+
+        # Speed with the inertia of the bike
+        speed = lfilter([0.1], [1, -0.9], _speed_from_power(power, grade), zi=[0.9 * 5.0])[0]
+        speed[stopped] = 0
+        grade = grade - np.sum(speed * grade) / max(np.sum(speed), 1e-9)
+
+    # Distance, altitude and grade
+    distance = np.cumsum(speed)
+    altitude = rng.uniform(50, 800) + np.cumsum(speed * grade / 100)
+    altitude -= min(altitude.min(), 0)
+    climb = np.diff(altitude, prepend=altitude[0])
+
+    # Heart rate: lagged response to the power, drifting up along the ride
+    effort = lfilter([1 / 30], [1, -(1 - 1 / 30)], power / ftp, zi=[(1 - 1 / 30) * 0.3])[0]
+    heart_rate = resting_hr + (max_hr - resting_hr) * (0.35 + 0.5 * effort) + 8 * np.arange(n) / max(n, 1)
+    heart_rate = np.clip(np.round(heart_rate + rng.normal(0, 1, n)), resting_hr, max_hr)
+
+    # Cadence: 0 when not pedalling
+    cadence = 88 + 10 * (power / ftp - intensity) + rng.normal(0, 3, n)
+    cadence = np.where(power > 20, np.clip(np.round(cadence), 40, 125), 0)
+
+    # GPS track: heading slowly turning
+    heading = rng.uniform(0, 2 * np.pi) + np.cumsum(rng.normal(0, 0.02, n))
+    lat = latitude + np.cumsum(speed * np.cos(heading)) / 111320
+    lon = longitude + np.cumsum(speed * np.sin(heading)) / (111320 * np.cos(np.radians(latitude)))
+
+    return pd.DataFrame({
+        'timestamp': pd.date_range(start_time, periods=n, freq='s'),
+        'position_lat': np.round(lat * 2 ** 31 / 180).astype('int64'),
+        'position_long': np.round(lon * 2 ** 31 / 180).astype('int64'),
+        'distance': np.round(distance, 2),
+        'enhanced_speed': np.round(speed, 3),
+        'altitude': np.round(altitude, 1),
+        'enhanced_altitude': np.round(altitude, 1),
+        'heart_rate': heart_rate.astype('int64'),
+        'cadence': cadence.astype('int64'),
+        'power': np.round(power).astype('int64'),
+        'grade': np.round(grade, 1),
+        'temperature': np.full(n, int(rng.integers(5, 30))),
+        'ascent': np.round(np.cumsum(np.clip(climb, 0, None))).astype('int64'),
+        'descent': np.round(np.cumsum(np.clip(-climb, 0, None))).astype('int64'),
+    })
+
+
+def french_date(timestamp):
+    """
+    Format a date as in the French Strava export, e.g. '5 avr. 2021 à 12:00:00'.
+    """
+    return f"{timestamp.day} {FRENCH_MONTHS[timestamp.month - 1]} {timestamp.year} à {timestamp.strftime('%H:%M:%S')}"
+
+
+def ride_summary(ride, activity_id, filename, ftp=250, max_hr=190, weight=RIDER_MASS):
+    """
+    Row of the French Strava export activities.csv for a synthetic ride. The 'Mesure d'effort' is the relative effort
+    model of features.athlete_profile with its default coefficients, so fitted coefficients can be checked against it.
+
+    Args:
+        ride (pandas.DataFrame): Ride from synthetic_ride.
+        activity_id (int): Activity id.
+        filename (str): Value of the 'Nom du fichier' column, e.g. 'activities/1234.fit'.
+        ftp (float): Functional Threshold Power of the rider. Default is 250.
+        max_hr (int): Max heart rate of the rider. Default is 190.
+        weight (float): Weight of the rider. Default is RIDER_MASS.
+
+    Returns:
+        list: One value per STRAVA_EXPORT_COLUMNS column, NaN for the columns not simulated.
+    """
+    row = [np.nan] * len(STRAVA_EXPORT_COLUMNS)
+    start = ride['timestamp'].iloc[0]
+    elapsed = len(ride)
+    moving = ride['enhanced_speed'] > 0.5
+    moving_time = int(moving.sum())
+    distance = float(ride['distance'].iloc[-1])
+    power = ride['power'].to_numpy(dtype=float)
+    rolling_power = pd.Series(power).rolling(30, min_periods=1).mean().to_numpy()
+    normalized_power = float(np.mean(rolling_power ** 4) ** 0.25)
+
+    hr_zones = time_in_hr_zones(ride['heart_rate'], calculate_hr_zones_RE(max_hr))
+    effort = relative_effort(hr_zones['perc'].to_numpy()[None, :], hr_zones['avg_HR'].to_numpy()[None, :],
+                             np.array([moving_time / 60]))[0]
+
+    values = {0: activity_id, 1: french_date(start), 2: f"Sortie vélo {activity_id}", 3: 'Vélo',
+              5: elapsed, 6: round(distance / 1000, 2), 7: float(ride['heart_rate'].max()), 8: round(effort),
+              9: False, 12: filename, 13: weight, 14: BIKE_MASS, 15: elapsed, 16: moving_time, 17: distance,
+              18: float(ride['enhanced_speed'].max()), 19: distance / max(moving_time, 1),
+              20: float(ride['ascent'].iloc[-1]), 21: float(ride['descent'].iloc[-1]),
+              22: float(ride['altitude'].min()), 23: float(ride['altitude'].max()),
+              24: float(ride['grade'].max()), 25: float(ride['grade'].mean()),
+              28: float(ride['cadence'].max()), 29: float(ride['cadence'][ride['cadence'] > 0].mean()),
+              30: float(ride['heart_rate'].max()), 31: float(ride['heart_rate'].mean()),
+              32: float(power.max()), 33: float(power.mean()), 34: round(power.sum() / 1000),
+              35: float(ride['temperature'].max()), 36: float(ride['temperature'].mean()), 37: round(effort),
+              38: round(power.sum()), 46: round(normalized_power), 47: elapsed, 50: False}
+    for position, value in values.items():
+        row[position] = value
+    return row
+
+
+######################################################## FILE WRITERS ##################################################
+def write_activity_csv(ride, path):
+    """
+    Save a synthetic ride as a converted activity .csv file, as in data/activities_csv/.
+    """
+    ride.to_csv(path, index=False)
+
+
+def write_tcx(ride, path):
+    """
+    Save a synthetic ride as a 1 Hz .tcx file, with the speed and the power in the ActivityExtension TPX element.
+    """
+    times = ride['timestamp'].dt.strftime('%Y-%m-%dT%H:%M:%SZ')
+    lat = ride['position_lat'] * 180 / 2 ** 31
+    lon = ride['position_long'] * 180 / 2 ** 31
+    trackpoints = ''.join(
+        f"""
+          <Trackpoint>
+            <Time>{t}</Time>
+            <Position>
+              <LatitudeDegrees>{la:.7f}</LatitudeDegrees>
+              <LongitudeDegrees>{lo:.7f}</LongitudeDegrees>
+            </Position>
+            <AltitudeMeters>{alt}</AltitudeMeters>
+            <DistanceMeters>{dist}</DistanceMeters>
+            <HeartRateBpm>
+              <Value>{hr}</Value>
+            </HeartRateBpm>
+            <Cadence>{cad}</Cadence>
+            <Extensions>
+              <ns3:TPX>
+                <ns3:Speed>{speed}</ns3:Speed>
+                <ns3:Watts>{watts}</ns3:Watts>
+              </ns3:TPX>
+            </Extensions>
+          </Trackpoint>"""
+        for t, la, lo, alt, dist, hr, cad, speed, watts in zip(
+            times, lat, lon, ride['altitude'], ride['distance'], ride['heart_rate'], ride['cadence'],
+            ride['enhanced_speed'], ride['power']))
+
+    with open(path, 'w') as f:
+        f.write(_tcx_document(ride['timestamp'].iloc[0], len(ride), ride['distance'].iloc[-1],
+                              round(ride['heart_rate'].mean()), ride['heart_rate'].max(), trackpoints))
+
+
+def write_gpx(ride, path):
+    """
+    Save a synthetic ride as a 1 Hz .gpx file, with the heart rate, cadence and power in Garmin extensions.
+    """
+    times = ride['timestamp'].dt.strftime('%Y-%m-%dT%H:%M:%SZ')
+    lat = ride['position_lat'] * 180 / 2 ** 31
+    lon = ride['position_long'] * 180 / 2 ** 31
+    points = ''.join(
+        f"""
+   <trkpt lat="{la:.7f}" lon="{lo:.7f}">
+    <ele>{alt}</ele>
+    <time>{t}</time>
+    <extensions>
+     <power>{watts}</power>
+     <gpxtpx:TrackPointExtension>
+      <gpxtpx:hr>{hr}</gpxtpx:hr>
+      <gpxtpx:cad>{cad}</gpxtpx:cad>
+     </gpxtpx:TrackPointExtension>
+    </extensions>
+   </trkpt>"""
+        for t, la, lo, alt, hr, cad, watts in zip(
+            times, lat, lon, ride['altitude'], ride['heart_rate'], ride['cadence'], ride['power']))
+
+    with open(path, 'w') as f:
+        f.write(f"""<?xml version="1.0" encoding="UTF-8"?>
+<gpx creator="synthetic" version="1.1" xmlns="http://www.topografix.com/GPX/1/1" xmlns:gpxtpx="http://www.garmin.com/xmlschemas/TrackPointExtension/v1">
+ <metadata>
+  <time>{times.iloc[0]}</time>
+ </metadata>
+ <trk>
+  <name>Synthetic ride</name>
+  <type>1</type>
+  <trkseg>{points}
+  </trkseg>
+ </trk>
+</gpx>
+""")
+
+
+# FIT base types: (code, struct format)
+_FIT_TYPES = {'enum': (0x00, 'B'), 'uint8': (0x02, 'B'), 'sint8': (0x01, 'b'), 'sint16': (0x83, 'h'),
+              'uint16': (0x84, 'H'), 'sint32': (0x85, 'i'), 'uint32': (0x86, 'I')}
+
+# Record message fields: (field number, name, base type, scale, offset)
+_FIT_RECORD_FIELDS = [(253, 'timestamp', 'uint32', 1, 0), (0, 'position_lat', 'sint32', 1, 0),
+                      (1, 'position_long', 'sint32', 1, 0), (2, 'altitude', 'uint16', 5, 500),
+                      (3, 'heart_rate', 'uint8', 1, 0), (4, 'cadence', 'uint8', 1, 0), (5, 'distance', 'uint32', 100, 0),
+                      (6, 'enhanced_speed', 'uint16', 1000, 0), (7, 'power', 'uint16', 1, 0),
+                      (9, 'grade', 'sint16', 100, 0), (13, 'temperature', 'sint8', 1, 0)]
+
+_FIT_CRC_TABLE = [0x0000, 0xCC01, 0xD801, 0x1400, 0xF001, 0x3C00, 0x2800, 0xE401,
+                  0xA001, 0x6C00, 0x7800, 0xB401, 0x5000, 0x9C01, 0x8801, 0x4400]
+
+
+def _fit_crc(data, crc=0):
+    """
+    CRC-16 of the FIT protocol.
+    """
+    for byte in data:
+        tmp = _FIT_CRC_TABLE[crc & 0xF]
+        crc = ((crc >> 4) & 0x0FFF) ^ tmp ^ _FIT_CRC_TABLE[byte & 0xF]
+        tmp = _FIT_CRC_TABLE[crc & 0xF]
+        crc = ((crc >> 4) & 0x0FFF) ^ tmp ^ _FIT_CRC_TABLE[(byte >> 4) & 0xF]
+    return crc
+
+
+def _fit_definition(local_type, global_number, fields):
+    """
+    Definition message of a FIT local message type, little endian.
+    """
+    message = struct.pack('<BBBHB', 0x40 | local_type, 0, 0, global_number, len(fields))
+    for number, type_name in fields:
+        code, fmt = _FIT_TYPES[type_name]
+        message += struct.pack('<BBB', number, struct.calcsize(fmt), code)
+    return message
+
+
+def write_fit(ride, path):
+    """
+    Save a synthetic ride as a .fit activity file: a file_id message then one record message per second. The record
+    messages are packed with a NumPy structured array; the ascent and descent, which are not record fields, are not
+    written.
+    """
+    fit_time = ((ride['timestamp'] - FIT_EPOCH).dt.total_seconds()).astype('int64').to_numpy()
+
+    # file_id: activity file from a development manufacturer
+    data = _fit_definition(0, 0, [(0, 'enum'), (1, 'uint16'), (4, 'uint32')])
+    data += struct.pack('<BBHI', 0, 4, 255, int(fit_time[0]))
+
+    # record messages
+    data += _fit_definition(1, 20, [(number, type_name) for number, _, type_name, _, _ in _FIT_RECORD_FIELDS])
+    dtype = np.dtype([('header', 'u1')] + [(name, '<' + np.dtype(_FIT_TYPES[type_name][1]).str[1:])
+                                           for _, name, type_name, _, _ in _FIT_RECORD_FIELDS])
+    records = np.zeros(len(ride), dtype=dtype)
+    records['header'] = 1
+    records['timestamp'] = fit_time
+    for _, name, type_name, scale, offset in _FIT_RECORD_FIELDS[1:]:
+        records[name] = np.round((ride[name].to_numpy(dtype=float) + offset) * scale)
+    data += records.tobytes()
+
+    header = struct.pack('<BBHI4s', 14, 0x20, 2132, len(data), b'.FIT')
+    header += struct.pack('<H', _fit_crc(header))
+    content = header + data
+    with open(path, 'wb') as f:
+        f.write(content + struct.pack('<H', _fit_crc(content)))
+
+
+_WRITERS = {'csv': write_activity_csv, 'fit': write_fit, 'gpx': write_gpx, 'tcx': write_tcx}
+
+
+######################################################## SYNTHETIC CORPUS ##################################################
+def _generate_activity(task):
+    """
+    Simulate one activity of the corpus and write its files. Module level so that it can run in worker processes.
+    """
+    directory, activity_id, start_time, duration, formats, seed, ftp, max_hr = task
+    ride = synthetic_ride(start_time, duration, seed=seed, ftp=ftp, max_hr=max_hr)
+    for fmt in formats:
+        folder = 'activities_csv' if fmt == 'csv' else 'activities'
+        _WRITERS[fmt](ride, os.path.join(directory, folder, f"{activity_id}.{fmt}"))
+    return ride_summary(ride, activity_id, f"activities/{activity_id}.{formats[0]}", ftp, max_hr)
+
+
+def generate_corpus(directory="data_synthetic/", n_activities=100, formats=('csv',), seed=0, min_hours=1,
+                    max_hours=6, start=datetime.datetime(2021, 4, 5, 12, 0, 0), ftp=250, max_hr=190, n_workers=1):
+    """
+    Generate a reproducible synthetic activity history laid out as the data/ directory: the activities.csv export
+    and one file per activity and format in activities/ (.fit, .gpx, .tcx) and activities_csv/ (.csv).
+
+    Args:
+        directory (str): Output directory. Default is 'data_synthetic/'.
+        n_activities (int): Number of activities. Default is 100.
+        formats (tuple): Formats written for every activity among 'csv', 'fit', 'gpx' and 'tcx'. The first one is
+                         used in the 'Nom du fichier' column. Default is ('csv',).
+        seed (int): Seed of the corpus, the same seed and sizes give the same files. Default is 0.
+        min_hours (float): Shortest ride duration in hours. Default is 1.
+        max_hours (float): Longest ride duration in hours. Default is 6.
+        start (datetime.datetime): Start of the first activity. Default is 2021-04-05 12:00.
+        ftp (float): Functional Threshold Power of the rider. Default is 250.
+        max_hr (int): Max heart rate of the rider. Default is 190.
+        n_workers (int): Number of worker processes. 1 (default) generates in the current process,
+                         None uses one worker per CPU.
+
+    Returns:
+        pandas.DataFrame: Content of the written activities.csv (with pandas' de-duplicated column names).
+    """
+    rng = np.random.default_rng(seed)
+    for folder in ['activities', 'activities_csv']:
+        os.makedirs(os.path.join(directory, folder), exist_ok=True)
+
+    # Schedule: mostly a ride a day or two, sometimes two rides the same day
+    day_offsets = np.cumsum(rng.choice([0, 1, 1, 1, 2, 3], size=n_activities))
+    start_hours = rng.uniform(-5, 6, n_activities)
+    durations = np.round(rng.uniform(min_hours, max_hours, n_activities) * 3600).astype(int)
+    ids = 1_000_000_000 + np.arange(n_activities) * 7 + rng.integers(0, 7, n_activities)
+
+    tasks = [(directory, int(ids[i]),
+              start + datetime.timedelta(days=int(day_offsets[i]), hours=float(start_hours[i])),
+              int(durations[i]), tuple(formats), [seed, i], ftp, max_hr) for i in range(n_activities)]
+
+    if n_workers == 1:
+        rows = [_generate_activity(task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=n_workers) as executor:
+            rows = list(executor.map(_generate_activity, tasks, chunksize=4))
+
+    activities_file = os.path.join(directory, 'activities.csv')
+    pd.DataFrame(rows).to_csv(activities_file, header=STRAVA_EXPORT_COLUMNS, index=False)
+    return pd.read_csv(activities_file)
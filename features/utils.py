@@ -1,15 +1,13 @@
+import os
+import json
+import hashlib
+import numpy as np
 import pandas as pd
+from dataclasses import dataclass
 from pathlib import Path
 from os import listdir
 from os.path import isfile, join
-from benedict import benedict as bdict
-from ipyleaflet import Map, Polyline
 from datetime import datetime, timedelta, time
-import dateutil.parser as dparser
-import shutil
-from sklearn import preprocessing
-from matplotlib.axes._axes import _log as matplotlib_axes_logger
-matplotlib_axes_logger.setLevel('ERROR')
 
 # Mutual functions across notebooks
 filepath = "data/"
@@ -17,35 +15,94 @@ fileOutputPath = filepath + "output/"
 activityPath = filepath + "activities/"
 activitycsvPath = filepath + "activities_csv/"
 activityOutputPath = fileOutputPath + "activities/"
+loadDataCachePath = filepath + "cache/rides.pkl"
+# Version of the cleaned rides table, bump it when _build_ride_data changes so the on-disk cache is rebuilt
+_CACHE_VERSION = 1
+
+
+################################################## FILES ###############################################
+def _file_sha256(path):
+    """
+    SHA-256 of a file content, read by chunks.
+    """
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+def _atomic_write_json(path, content):
+    """
+    Write a .json file through a temporary file replaced in one step, so an interrupted run cannot leave it
+    truncated.
+
+    Args:
+        path: path to the .json file, its directory is created if needed.
+        content: JSON serializable content.
+
+    Returns:
+        None
+    """
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(content, f, indent=1, sort_keys=True)
+    os.replace(tmp_path, path)
 
 
 ################################################## PREPROCESS DATA AND LOAD ###############################################
+# Month numbers of the French month abbreviations of the Strava export dates, e.g. '5 avr. 2021 à 12:00:00'
+frenchMonths = {'janv.': '01', 'févr.': '02', 'mars': '03', 'avr.': '04', 'mai': '05', 'juin': '06',
+                'juil.': '07', 'août': '08', 'sept.': '09', 'oct.': '10', 'nov.': '11', 'déc.': '12'}
+frenchDatePattern = (r"^\s*(?P<day>\d{1,2})\s+(?P<month>" + '|'.join(m.replace('.', r'\.') for m in frenchMonths)
+                     + r")\s+(?P<year>\d{4})\s+à\s+(?P<time>\d{1,2}:\d{2}:\d{2})\s*$")
+
+def _parse_french_dates(values):
+    """
+    Parse French Strava export dates in a single vectorized pass.
+
+    Args:
+        values: series of dates such as '5 avr. 2021 à 12:00:00'.
+
+    Returns:
+        (dates, times): series of the dates (NaT when unparsed) and of the times (NaT when unparsed).
+    """
+    parts = values.astype('string').str.extract(frenchDatePattern)
+    dates = pd.to_datetime(parts['day'] + '/' + parts['month'].map(frenchMonths) + '/' + parts['year'],
+                           format='%d/%m/%Y', errors='coerce')
+    times = pd.to_datetime(parts['time'], format='%H:%M:%S', errors='coerce')
+    return dates, times
+
+def find_unparsed_dates(data, column="Date de l'activité"):
+    """
+    Rows whose date is not a valid French Strava export date, e.g. to fix them in the export.
+
+    Args:
+        data: activities data frame.
+        column: date column. Default is "Date de l'activité".
+
+    Returns:
+        data frame of the rows that preprocess_date_column leaves without Date or Time.
+    """
+    dates, times = _parse_french_dates(data[column])
+    return data[dates.isna() | times.isna()]
+
 def preprocess_date_column(data):
-    # Extract the date and time in two columns
-    data[['Date', 'Time']] = data['Date de l\'activité'].str.split('à', expand=True)
-    
-    # Replace the month abbreviations with numbers
-    data['Date'] = data['Date'].str.replace('janv.', '01', regex=True)
-    data['Date'] = data['Date'].str.replace('févr.', '02', regex=True)
-    data['Date'] = data['Date'].str.replace('mars', '03', regex=True)
-    data['Date'] = data['Date'].str.replace('avr.', '04', regex=True)
-    data['Date'] = data['Date'].str.replace('mai', '05', regex=True)
-    data['Date'] = data['Date'].str.replace('juin', '06', regex=True)
-    data['Date'] = data['Date'].str.replace('juil.', '07', regex=True)
-    data['Date'] = data['Date'].str.replace('août', '08', regex=True)
-    data['Date'] = data['Date'].str.replace('sept.', '09', regex=True)
-    data['Date'] = data['Date'].str.replace('oct.', '10', regex=True)
-    data['Date'] = data['Date'].str.replace('nov.', '11', regex=True)
-    data['Date'] = data['Date'].str.replace('déc.', '12', regex=True)
-
-    # Convert date and time to datetime and time format respectively
-    data['Date'] = data['Date'].apply(lambda x: dparser.parse(x, fuzzy=True, dayfirst=True))
-    data['Time'] = pd.to_datetime(data['Time'], format=' %H:%M:%S').dt.time
+    # Extract the date and the time, the month abbreviations are translated in the same pass
+    dates, times = _parse_french_dates(data['Date de l\'activité'])
+    data['Date'] = dates
+    data['Time'] = times.dt.time
+
+    # Report the rows that could not be parsed instead of guessing them
+    unparsed = dates.isna() | times.isna()
+    if unparsed.any():
+        examples = list(data.loc[unparsed, "Date de l'activité"].head(5))
+        print(f"{unparsed.sum()} activity dates could not be parsed (see find_unparsed_dates): {examples}")
     
     return data
 
-def loadData():
-    df = pd.read_csv(filepath + 'activities.csv')
+def _build_ride_data(source):
+    df = pd.read_csv(source)
     data = df[df.columns[[0, 1, 2, 3, 4, 5, 8, 11, 12, 13, 14, 16, 17, 18, 19,
                           20, 21, 22, 23, 24, 25, 28, 29, 30, 31, 33, 34, 36, 46, 47,
                           59, 61, 72, 74]]]
@@ -75,6 +132,64 @@ def loadData():
 
     return rideData
 
+# Ride tables already loaded by this process, keyed on the source path, mtime and size
+_ride_data_memo = {}
+
+def loadData(source=None, cache_path=None, use_cache=True):
+    """
+    Load the rides of the Strava export activities.csv, cleaned and typed. The cleaned table is kept in memory and in
+    an on-disk cache, rebuilt only when the source file, the cleaning code (_CACHE_VERSION) or pandas change: an
+    unchanged mtime and size reuse the cache at once, a changed mtime with the same content hash only refreshes the
+    cache key.
+
+    Args:
+        source: path of the activities file. Default is None ('data/activities.csv').
+        cache_path: path of the on-disk cache. Default is None ('data/cache/rides.pkl').
+        use_cache: False rebuilds the table from the source without reading or writing any cache. Default is True.
+
+    Returns:
+        rideData: data frame of the rides, a copy that can be modified freely.
+    """
+    source = source or filepath + 'activities.csv'
+    cache_path = cache_path or loadDataCachePath
+    if not use_cache:
+        return _build_ride_data(source)
+
+    stat = os.stat(source)
+    key = (os.path.abspath(source), stat.st_mtime_ns, stat.st_size)
+    if key in _ride_data_memo:
+        return _ride_data_memo[key].copy()
+
+    # A cache written by another version of the cleaning code or of pandas, or that cannot be read, is rebuilt
+    versions = (_CACHE_VERSION, pd.__version__)
+    try:
+        cached = pd.read_pickle(cache_path) if os.path.exists(cache_path) else None
+        if cached is not None and (cached['versions'], cached['source'], cached['size']) != (versions, key[0], stat.st_size):
+            cached = None
+    except Exception:
+        cached = None
+
+    # A new mtime only invalidates the cache if the content changed
+    sha256 = None
+    if cached is not None and cached['mtime_ns'] != stat.st_mtime_ns:
+        sha256 = _file_sha256(source)
+        if sha256 != cached['sha256']:
+            cached = None
+
+    if cached is None or sha256 is not None:
+        rideData = _build_ride_data(source) if cached is None else cached['data']
+        os.makedirs(os.path.dirname(cache_path) or '.', exist_ok=True)
+        tmp_path = cache_path + '.tmp'
+        pd.to_pickle({'versions': versions, 'source': key[0], 'mtime_ns': stat.st_mtime_ns, 'size': stat.st_size,
+                      'sha256': sha256 or _file_sha256(source), 'data': rideData}, tmp_path)
+        os.replace(tmp_path, cache_path)
+    else:
+        rideData = cached['data']
+
+    _ride_data_memo.clear()
+    _ride_data_memo[key] = rideData
+    return rideData.copy()
+
 ################################################## DATA SUBSET ########################################################
 
 def create_sub_df(df):
@@ -102,6 +217,114 @@ def create_sub_df(df):
 
      return sub_df
 
+############################################################### ZONE TABLES #############################################################
+@dataclass(frozen=True, eq=False)
+class ZoneTable:
+    """
+    Immutable zone table of an activity channel (speed, power, cadence, grade, elevation), built once from a zone
+    dict such as {'Z1': (0, 10), 'Z2': (10, 15)}. Every zone is the half-open interval [lower, upper), zones are sorted
+    and must not overlap; a value below every zone, in a gap between two zones, above every zone or NaN is in no zone.
+
+    Attributes:
+        labels (tuple): zone labels, e.g. ('Z1', 'Z2', ...).
+        bounds (tuple): (lower, upper) bounds of each zone, as given, for display.
+        lower (numpy.ndarray): read-only sorted lower bounds.
+        upper (numpy.ndarray): read-only upper bounds.
+        unit (str): unit of the bounds, e.g. 'km/h'.
+    """
+    labels: tuple
+    bounds: tuple
+    lower: np.ndarray
+    upper: np.ndarray
+    unit: str = ''
+
+    @classmethod
+    def from_dict(cls, zones, unit=''):
+        """
+        Build a zone table from a {label: (lower, upper)} dict, in any order.
+        """
+        items = sorted(zones.items(), key=lambda item: item[1][0])
+        lower = np.array([bounds[0] for _, bounds in items], dtype=float)
+        upper = np.array([bounds[1] for _, bounds in items], dtype=float)
+        if (upper < lower).any() or (lower[1:] < upper[:-1]).any():
+            raise ValueError(f"zones must not overlap: {dict(items)}")
+        lower.flags.writeable = False
+        upper.flags.writeable = False
+        return cls(tuple(label for label, _ in items), tuple(tuple(bounds) for _, bounds in items), lower, upper, unit)
+
+    def __len__(self):
+        return len(self.labels)
+
+    @property
+    def edges(self):
+        """
+        Bin edges of contiguous zones: the lower bound of every zone then the upper bound of the last one.
+        """
+        return np.append(self.lower, self.upper[-1])
+
+    @property
+    def ranges(self):
+        """
+        Display range of each zone, e.g. '10-15'.
+        """
+        return tuple(f"{lower}-{upper}" for lower, upper in self.bounds)
+
+    def assign(self, values):
+        """
+        Zone of each value by binary search on the lower bounds.
+
+        Args:
+            values: array-like of channel values.
+
+        Returns:
+            numpy.ndarray: index of the zone of each value in labels, -1 for the values in no zone.
+        """
+        values = np.asarray(values, dtype=float)
+        zones = np.searchsorted(self.lower, values, side='right') - 1
+        inside = (zones >= 0) & (values < self.upper[np.maximum(zones, 0)])
+        return np.where(inside, zones, -1)
+
+    def time_in_zones(self, values, weights=None):
+        """
+        Sum of the sample weights in each zone.
+
+        Args:
+            values: array-like of channel values.
+            weights: weight of each sample, e.g. from sample_weights. Default is None (every sample counts 1).
+
+        Returns:
+            numpy.ndarray: total weight of each zone, in the order of labels.
+        """
+        zones = self.assign(values)
+        weights = np.ones(len(zones)) if weights is None else np.asarray(weights, dtype=float)
+        inside = zones >= 0
+        return np.bincount(zones[inside], weights=weights[inside], minlength=len(self))
+
+    def to_frame(self):
+        """
+        Zone table as a DataFrame with the 'zone', 'lower' and 'upper' columns.
+        """
+        return pd.DataFrame({'zone': list(self.labels),
+                             'lower': [lower for lower, _ in self.bounds],
+                             'upper': [upper for _, upper in self.bounds]})
+
+def zone_table(zones, unit=''):
+    """
+    Zone table of a zone dict, of a zones DataFrame with the 'zone', 'lower' and 'upper' columns, or the table itself.
+
+    Args:
+        zones: ZoneTable, {label: (lower, upper)} dict or DataFrame.
+        unit: unit of the bounds when a table is built. Default is ''.
+
+    Returns:
+        ZoneTable
+    """
+    if isinstance(zones, ZoneTable):
+        return zones
+    if isinstance(zones, pd.DataFrame):
+        zones = {zone: (lower, upper) for zone, lower, upper in zones[['zone', 'lower', 'upper']].itertuples(index=False)}
+    return ZoneTable.from_dict(zones, unit)
+
 ############################################################### LAURENT SPEED ZONES #############################################################
 speed = {
         "Z1": (0, 10),
@@ -123,10 +346,10 @@ speed = {
         "Z17": (60, 75)
 }
 
+speed_zone_table = ZoneTable.from_dict(speed, unit='km/h')
+
 # create a DataFrame with the zone names, lower and upper bounds
-speed_zones_df = pd.DataFrame(speed.items(), columns=['zone', 'bounds'])
-speed_zones_df[['lower', 'upper']] = pd.DataFrame(speed_zones_df['bounds'].tolist(), index=speed_zones_df.index)
-speed_zones_df = speed_zones_df.drop('bounds', axis=1)
+speed_zones_df = speed_zone_table.to_frame()
 
 
 ############################################################### LAURENT POWER ZONES #############################################################
@@ -152,10 +375,10 @@ power = {
         "Z19": (800, 1500)
 }
 
+power_zone_table = ZoneTable.from_dict(power, unit='W')
+
 # create a DataFrame with the zone names, lower and upper bounds
-power_zones_df = pd.DataFrame(power.items(), columns=['zone', 'bounds'])
-power_zones_df[['lower', 'upper']] = pd.DataFrame(power_zones_df['bounds'].tolist(), index=power_zones_df.index)
-power_zones_df = power_zones_df.drop('bounds', axis=1)
+power_zones_df = power_zone_table.to_frame()
 
 ############################################################ CADENCE ZONES #######################################################################
 
@@ -187,10 +410,10 @@ cadence = {
         "Z25": (125, 150)
 }
 
+cadence_zone_table = ZoneTable.from_dict(cadence, unit='rpm')
+
 # create a DataFrame with the zone names, lower and upper bounds
-cadence_zones_df = pd.DataFrame(cadence.items(), columns=['zone', 'bounds'])
-cadence_zones_df[['lower', 'upper']] = pd.DataFrame(cadence_zones_df['bounds'].tolist(), index=cadence_zones_df.index)
-cadence_zones_df = cadence_zones_df.drop('bounds', axis=1)
+cadence_zones_df = cadence_zone_table.to_frame()
 
 ################################################# GRADE ZONE ################################
 
@@ -227,10 +450,10 @@ grade = {
         "Z30": (20, 25)
 }
 
+grade_zone_table = ZoneTable.from_dict(grade, unit='%')
+
 # create a DataFrame with the zone names, lower and upper bounds
-grade_zones_df = pd.DataFrame(grade.items(), columns=['zone', 'bounds'])
-grade_zones_df[['lower', 'upper']] = pd.DataFrame(grade_zones_df['bounds'].tolist(), index=grade_zones_df.index)
-grade_zones_df = grade_zones_df.drop('bounds', axis=1)
+grade_zones_df = grade_zone_table.to_frame()
 
 ############################################ ELEVATION ZONE #############################
 
@@ -254,8 +477,8 @@ elevation = {
         "Z17": (4000, 5000)
 }
 
+elevation_zone_table = ZoneTable.from_dict(elevation, unit='m')
+
 # create a DataFrame with the zone names, lower and upper bounds
-elevation_zones_df = pd.DataFrame(elevation.items(), columns=['zone', 'bounds'])
-elevation_zones_df[['lower', 'upper']] = pd.DataFrame(elevation_zones_df['bounds'].tolist(), index=elevation_zones_df.index)
-elevation_zones_df = elevation_zones_df.drop('bounds', axis=1)
+elevation_zones_df = elevation_zone_table.to_frame()
 elevation_zones_df
\ No newline at end of file
@@ -1,20 +1,16 @@
-import matplotlib.pyplot as plt
 import pandas as pd
-import seaborn as sns
 import numpy as np
 import datetime
+from concurrent.futures import ProcessPoolExecutor
 from datetime import timedelta
 
-import plotly.express as px
-import plotly.graph_objects as go
-import plotly.subplots as sp
-from plotly.graph_objects import Layout
-
 import warnings
 warnings.simplefilter("ignore", UserWarning)
 
 from features.utils import *
 from features.athlete_profile import *
+from features.activity_store import load_activity
+from features.power_curve import mean_maximal_power, POWER_CURVE_DURATIONS
 
 ############################################################# LOAD DATA ########################################################################
 
@@ -63,16 +59,13 @@ def activity_dive_in_dataset(zone_df, athlete_df, date):
                 activity_num = row['nom']
                 activity_file = f"data/activities_csv/{activity_num}.csv"
                 
-            csv_data = pd.read_csv(activity_file)
+            csv_data = load_activity(activity_file)
             csv_data['enhanced_speed'] = csv_data['enhanced_speed']*3.6
         
         return df_activity_visual, csv_data
 
 ########################################################## MAP ################################################################################
 
-import pandas as pd
-import plotly.express as px
-
 # Define a function to convert fixed-point coordinates to latitude and longitude in degrees
 def fixed_to_degrees(value):
     degrees = float(value) / ((2**32) / 360)
@@ -87,6 +80,7 @@ def plot_map(data_file):
     Returns:
         None
     """
+    import plotly.express as px
 
     # Read in the data from the CSV file
     data_source = data_file
@@ -144,6 +138,8 @@ def plot_hr_zones(df_activity_visual, max_HR=190):
     Returns:
         visuals
     """
+    import plotly.graph_objects as go
+    import plotly.subplots as sp
 
     #Calculate zones based on max HR
     RE_hr_data = calculate_hr_zones_elevate(max_HR)
@@ -218,73 +214,179 @@ def plot_hr_zones(df_activity_visual, max_HR=190):
     return fig
 
 
+################################################################ CHANNEL ZONES ###########################################################
+
+# Zone table, activity .csv column and scale of the values of each channel of the zone histograms
+ZONE_CHANNELS = {
+    'speed': (speed_zone_table, 'enhanced_speed', 3.6),
+    'power': (power_zone_table, 'power', 1),
+    'cadence': (cadence_zone_table, 'cadence', 1),
+    'elevation': (elevation_zone_table, 'altitude', 1),
+    'grade': (grade_zone_table, 'grade', 1),
+}
+
+def activity_zone_histograms(csv_data, channels=ZONE_CHANNELS, weighting='samples', max_gap=10):
+    """
+    Time spent in the zones of every channel of one activity, binning each channel with its zone table and summing
+    the weights of all the channels with a single bincount.
+
+    Args:
+    - csv_data (pandas.DataFrame): samples of the activity, with a 'timestamp' column and the channel columns. A
+      missing channel column counts as a channel without samples.
+    - channels (dict): (zone table, column, scale) of each channel, see ZONE_CHANNELS. Default is ZONE_CHANNELS.
+    - weighting (str): 'samples' (default) counts every sample once, 'time' weights each sample by the time elapsed
+      until the next one (see sample_weights).
+    - max_gap (float): Maximum weight of a sample in seconds with the 'time' weighting. Default is 10.
+
+    Returns:
+    - pandas.DataFrame: one row per channel and zone with the 'channel', 'zone', 'lower', 'upper', 'range', 'time'
+      (sum of the weights) and 'share' (share of the total weight, rounded to 4 decimals) columns.
+    """
+    weights = sample_weights(csv_data['timestamp'], max_gap) if weighting == 'time' else np.ones(len(csv_data))
+    tables = [zone_table(zones) for zones, _, _ in channels.values()]
+    offsets = np.cumsum([0] + [len(zones) for zones in tables])
+
+    # zone of every sample of every channel, numbered across the channels
+    bins = np.full((len(channels), len(csv_data)), -1)
+    for i, (zones, (_, column, scale)) in enumerate(zip(tables, channels.values())):
+        if column in csv_data.columns:
+            assigned = zones.assign(csv_data[column].to_numpy(dtype=float) * scale)
+            bins[i] = np.where(assigned >= 0, assigned + offsets[i], -1)
+    inside = bins >= 0
+    time_in_zone = np.bincount(bins[inside], weights=np.broadcast_to(weights, bins.shape)[inside], minlength=offsets[-1])
+
+    total_time = weights.sum()
+    return pd.DataFrame({
+        'channel': [channel for channel, zones in zip(channels, tables) for _ in zones.labels],
+        'zone': [zone for zones in tables for zone in zones.labels],
+        'lower': [lower for zones in tables for lower, _ in zones.bounds],
+        'upper': [upper for zones in tables for _, upper in zones.bounds],
+        'range': [zone_range for zones in tables for zone_range in zones.ranges],
+        'time': time_in_zone,
+        'share': np.round(time_in_zone / total_time, 4) if total_time > 0 else np.zeros(offsets[-1]),
+    })
+
+def _activity_zone_histograms(task):
+    """
+    Zone histograms of the activity of a row, loading its samples once. Module level so that it can run in worker
+    processes.
+    """
+    row, channels, weighting, max_gap = task
+
+    # Extract activity id from the file name column
+    if "Nom du fichier" in row:
+        activity_num = str(row["Nom du fichier"]).split("/")[-1].split(".")[0]
+    else:
+        activity_num = row['nom']
+    columns = ['timestamp'] + [column for _, column, _ in channels.values()]
+    csv_data = load_activity(f"data/activities_csv/{activity_num}.csv", columns=columns)
+    return activity_zone_histograms(csv_data, channels, weighting, max_gap)
+
+def zone_histograms(df, channels=ZONE_CHANNELS, weighting='samples', max_gap=10, n_workers=1):
+    """
+    Time spent in the zones of every channel for each activity, each activity file being read once for all the
+    channels.
+
+    Args:
+    - df (pandas.DataFrame): A DataFrame containing information about the activities.
+    - channels (dict): (zone table, column, scale) of each channel, see ZONE_CHANNELS. Default is ZONE_CHANNELS.
+    - weighting (str): 'samples' (default) counts every sample once, 'time' weights each sample by the time elapsed
+      until the next one (see sample_weights).
+    - max_gap (float): Maximum weight of a sample in seconds with the 'time' weighting. Default is 10.
+    - n_workers (int): Number of worker processes. 1 (default) computes in the current process, None uses one worker
+      per CPU.
+
+    Returns:
+    - pandas.DataFrame: the activity_zone_histograms rows of every activity, with an 'activity' column holding the
+      index of its row in df.
+    """
+    # Only the column locating the activity file is sent to the workers
+    file_col = "Nom du fichier" if "Nom du fichier" in df.columns else 'nom'
+    tasks = [({file_col: name}, channels, weighting, max_gap) for name in df[file_col]]
+
+    if n_workers == 1:
+        histograms = [_activity_zone_histograms(task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=n_workers) as executor:
+            histograms = list(executor.map(_activity_zone_histograms, tasks, chunksize=8))
+
+    if not histograms:
+        return pd.DataFrame(columns=['channel', 'zone', 'lower', 'upper', 'range', 'time', 'share', 'activity'])
+    sizes = [len(histogram) for histogram in histograms]
+    return pd.concat(histograms, ignore_index=True).assign(activity=np.repeat(df.index.to_numpy(), sizes))
+
+def _calculate_time_in_channel_zones(df, zones, column, weighting='samples', max_gap=10, scale=1):
+    """
+    Calculate the share of time spent in each zone of one channel for each activity and add the results as time_z*
+    columns, see zone_histograms.
+
+    Returns:
+    - df (pandas.DataFrame): The original DataFrame with new columns for the time spent in each zone.
+    """
+    histograms = zone_histograms(df, {column: (zones, column, scale)}, weighting, max_gap)
+    labels = zone_table(zones).labels
+    shares = histograms.pivot(index='activity', columns='zone', values='share').reindex(index=df.index, columns=list(labels))
+
+    # Add new columns with time spent in each zone to df
+    df[[f"time_{zone.lower()}" for zone in labels]] = shares.to_numpy()
+    return df
+
+def _channel_histogram(df, channel, zones, histograms=None):
+    """
+    Zone histogram of one channel of the first activity of df, taken from histograms when given (e.g. computed once
+    for all the plots of a report by zone_histograms or activity_zone_histograms) and computed otherwise.
+    """
+    if histograms is None:
+        _, column, scale = ZONE_CHANNELS[channel]
+        histograms = zone_histograms(df.iloc[:1], {channel: (zones, column, scale)})
+    if 'activity' in histograms.columns:
+        histograms = histograms[histograms['activity'] == histograms['activity'].iloc[0]]
+    return histograms[histograms['channel'] == channel].reset_index(drop=True)
+
+
 ################################################################## SPEED ZONES ###########################################################
 
-def calculate_time_in_speed_zones(df_activity_visual, speed_zones=speed):
+def calculate_time_in_speed_zones(df_activity_visual, speed_zones=speed_zone_table, weighting='samples', max_gap=10):
     """
     Calculate the time spent in each power zone for each activity and add the results as columns.
     
     Args:
     - df_activity_visual (pandas.DataFrame): A DataFrame containing information about the activity.
-    - speed_zones (list): list of speed_speed_zones
+    - speed_zones (ZoneTable, dict or pandas.DataFrame): speed zones in km/h, see zone_table. Default is speed_zone_table.
+    - weighting (str): 'samples' (default) counts every sample once, 'time' weights each sample by the time elapsed
+      until the next one (see sample_weights).
+    - max_gap (float): Maximum weight of a sample in seconds with the 'time' weighting. Default is 10.
     
     Returns:
     - df_activity_visual (pandas.DataFrame): The original DataFrame with new columns for the time spent in each speed zone.
     """
     df_activity_visual = df_activity_visual.drop(['time_z1', 'avgHR_z1', 'time_z2', 'avgHR_z2', 'time_z3', 'avgHR_z3', 'time_z4', 'avgHR_z4', 'time_z5', 'avgHR_z5', 'time_z6', 'avgHR_z6'], axis=1)
-    
-    # Loop through the rows in df and calculate time spent in each zone for the corresponding activity
-    for index, row in df_activity_visual.iterrows():
-        
-        # Extract activity id from the file name column
-        if "Nom du fichier" in row:
-            activity_num = str(row["Nom du fichier"]).split("/")[-1].split(".")[0]
-            # Load the activity data
-            activity_file = f"data/activities_csv/{activity_num}.csv"
-        else:
-            activity_num = row['nom']
-            activity_file = f"data/activities_csv/{activity_num}.csv"
-            
-        csv_data = pd.read_csv(activity_file)
-        csv_data['enhanced_speed'] = csv_data['enhanced_speed']*3.6
-        
-        # Calculate the time spent in each zone
-        time_in_zone = {zone: 0 for zone in speed_zones}
-        for _, row in csv_data.iterrows():
-            speed = row["enhanced_speed"]
-            for zone, (lower, upper) in speed_zones.items():
-                if lower <= speed < upper:
-                    time_in_zone[zone] += 1
-        
-        # Calculate the percentage of time spent in each zone
-        total_time = len(csv_data)
-        percent_time_in_zone = {zone: round(time / total_time, 4) for zone, time in time_in_zone.items()}
-        
-        # Add new columns with time spent in each zone to df_activity_visual
-        for zone, percent_time in percent_time_in_zone.items():
-            column_name = f"time_{zone.lower()}"
-            df_activity_visual.loc[index, column_name] = percent_time
-    
-    return df_activity_visual
+    return _calculate_time_in_channel_zones(df_activity_visual, speed_zones, 'enhanced_speed', weighting, max_gap, scale=3.6)
 
 
-def plot_speed_zones(df, speed_zones_list=speed, speed_zones_df=speed_zones_df):
+def plot_speed_zones(df, speed_zones_list=speed_zone_table, speed_zones_df=None, histograms=None):
     """
     Plots a bar chart of the time spent in each speed zone, with a table of the time spent and percentage of time spent
     in each zone.
 
     Args:
-        speed_zones (pd.DataFrame): DataFrame containing speed zone data, including zone name, lower and upper bounds.
-        speed_zones_df (pd.DataFrame): DataFrame containing speed zone data, including zone name, lower and upper bounds.
+        df (pd.DataFrame): DataFrame with the activity data.
+        speed_zones_list (ZoneTable, dict or pd.DataFrame): speed zones, see zone_table. Default is speed_zone_table.
+        speed_zones_df (pd.DataFrame): speed zones with the zone, lower and upper columns, used instead of speed_zones_list when given.
+        histograms (pd.DataFrame): zone histograms of the activity from activity_zone_histograms or zone_histograms,
+            computed from the activity file when not given.
 
     Returns:
         visuals
     """
+    import plotly.graph_objects as go
+    import plotly.subplots as sp
+    zones = zone_table(speed_zones_list if speed_zones_df is None else speed_zones_df)
 
-    speed_zones = calculate_time_in_speed_zones(df)
+    speed_zones = _channel_histogram(df, 'speed', zones, histograms)
 
     # Multiply the zone times by the duration to get the total time in each zone
-    zone_times = [speed_zones['Durée de déplacement'].iloc[0] *speed_zones['time_z{}'.format(i)].iloc[0] for i in range(1, 18)]
+    zone_times = list(df['Durée de déplacement'].iloc[0] * speed_zones['share'])
 
     # Create a list of formatted time strings
     time_strings = []
@@ -295,7 +397,7 @@ def plot_speed_zones(df, speed_zones_list=speed, speed_zones_df=speed_zones_df):
     time_strings
 
     #Create a list of zone labels for hover text
-    zone_names = [f"Z{i+1}: {zone['lower']}-{zone['upper']} bpm" for i, zone in speed_zones_df.iterrows()]
+    zone_names = [f"{zone}: {zone_range} bpm" for zone, zone_range in zip(speed_zones['zone'], speed_zones['range'])]
 
     # Create a bar plot of the time spent in each speed zone using plotly
     fig1 = go.Figure(data=[go.Bar(
@@ -309,10 +411,10 @@ def plot_speed_zones(df, speed_zones_list=speed, speed_zones_df=speed_zones_df):
     fig1.update_layout(title='Time spent in each speed zone', xaxis_title='', yaxis_title='', height=600)
 
     # Create table with time and percentage for each speed zone
-    zone_labels = ['Zone ' + str(i) for i in range(1, 18)]
-    zone_from =  [f"{zone['lower']}" for _, zone in speed_zones_df.iterrows()]
-    zone_to =  [f"{zone['upper']}" for _, zone in speed_zones_df.iterrows()]
-    zone_percentages = [speed_zones['time_z{}'.format(i)].iloc[0] * 100 for i in range(1, 18)]
+    zone_labels = ['Zone ' + str(i) for i in range(1, len(speed_zones) + 1)]
+    zone_from =  [f"{lower:g}" for lower in speed_zones['lower']]
+    zone_to =  [f"{upper:g}" for upper in speed_zones['upper']]
+    zone_percentages = list(speed_zones['share'] * 100)
     zone_percentages_str = [f"{p:.1f}%" for p in zone_percentages]
     table_data = {
         'Zone': zone_labels,
@@ -351,69 +453,45 @@ def plot_speed_zones(df, speed_zones_list=speed, speed_zones_df=speed_zones_df):
 
 ############################################################ POWER ###############################################################
 
-def calculate_time_in_power_watt_zones(df_activity_visual, power_zones=power):
+def calculate_time_in_power_watt_zones(df_activity_visual, power_zones=power_zone_table, weighting='samples', max_gap=10):
     """
     Calculate the time spent in each power zone for each activity and add the results as columns.
     
     Args:
     - df_activity_visual (pandas.DataFrame): A DataFrame containing information about the activity.
-    -power_power_zones (list): list of power power_zones
+    - power_zones (ZoneTable, dict or pandas.DataFrame): power zones in W, see zone_table. Default is power_zone_table.
+    - weighting (str): 'samples' (default) counts every sample once, 'time' weights each sample by the time elapsed
+      until the next one (see sample_weights).
+    - max_gap (float): Maximum weight of a sample in seconds with the 'time' weighting. Default is 10.
     
     Returns:
     - df_activity_visual (pandas.DataFrame): The original DataFrame with new columns for the time spent in each power zone.
     """
+    return _calculate_time_in_channel_zones(df_activity_visual, power_zones, 'power', weighting, max_gap)
 
-    
-    # Loop through the rows in df and calculate time spent in each zone for the corresponding activity
-    for index, row in df_activity_visual.iterrows():
-        
-        # Extract activity id from the file name column
-        if "Nom du fichier" in row:
-            activity_num = str(row["Nom du fichier"]).split("/")[-1].split(".")[0]
-            # Load the activity data
-            activity_file = f"data/activities_csv/{activity_num}.csv"
-        else:
-            activity_num = row['nom']
-            activity_file = f"data/activities_csv/{activity_num}.csv"
-            
-        csv_data = pd.read_csv(activity_file)
-        
-        # Calculate the time spent in each zone
-        time_in_zone = {zone: 0 for zone in power_zones}
-        for _, row in csv_data.iterrows():
-            power = row["power"]
-            for zone, (lower, upper) in power_zones.items():
-                if lower <= power < upper:
-                    time_in_zone[zone] += 1
-        
-        # Calculate the percentage of time spent in each zone
-        total_time = len(csv_data)
-        percent_time_in_zone = {zone: round(time / total_time, 4) for zone, time in time_in_zone.items()}
-        
-        # Add new columns with time spent in each zone to df_activity_visual
-        for zone, percent_time in percent_time_in_zone.items():
-            column_name = f"time_{zone.lower()}"
-            df_activity_visual.loc[index, column_name] = percent_time
-    
-    return df_activity_visual
 
-
-def plot_power_zones(df, power_zones_list=power, power_zones_df=power_zones_df):
+def plot_power_zones(df, power_zones_list=power_zone_table, power_zones_df=None, histograms=None):
     """
     Plots a bar chart of the time spent in each power zone, with a table of the time spent and percentage of time spent
     in each zone.
 
     Args:
-        power_zones (pd.DataFrame): DataFrame with the activity data and the calculated time spent in each zone.
-        power_zones_df (pd.DataFrame): DataFrame containing power zone data, including zone name, lower and upper bounds.
+        df (pd.DataFrame): DataFrame with the activity data.
+        power_zones_list (ZoneTable, dict or pd.DataFrame): power zones, see zone_table. Default is power_zone_table.
+        power_zones_df (pd.DataFrame): power zones with the zone, lower and upper columns, used instead of power_zones_list when given.
+        histograms (pd.DataFrame): zone histograms of the activity from activity_zone_histograms or zone_histograms,
+            computed from the activity file when not given.
 
     Returns:
         visuals
     """
-    power_zones = calculate_time_in_power_watt_zones(df)
+    import plotly.graph_objects as go
+    import plotly.subplots as sp
+    zones = zone_table(power_zones_list if power_zones_df is None else power_zones_df)
+    power_zones = _channel_histogram(df, 'power', zones, histograms)
 
     # Multiply the zone times by the duration to get the total time in each zone
-    zone_times = [power_zones['Durée de déplacement'].iloc[0] *power_zones['time_z{}'.format(i)].iloc[0] for i in range(1, 20)]
+    zone_times = list(df['Durée de déplacement'].iloc[0] * power_zones['share'])
 
     # Create a list of formatted time strings
     time_strings = []
@@ -424,7 +502,7 @@ def plot_power_zones(df, power_zones_list=power, power_zones_df=power_zones_df):
     time_strings
 
     #Create a list of zone labels for hover text
-    zone_names = [f"Z{i+1}: {zone['lower']}-{zone['upper']} bpm" for i, zone in power_zones_df.iterrows()]
+    zone_names = [f"{zone}: {zone_range} bpm" for zone, zone_range in zip(power_zones['zone'], power_zones['range'])]
 
     # Create a bar plot of the time spent in each power zone using plotly
     fig1 = go.Figure(data=[go.Bar(
@@ -438,10 +516,10 @@ def plot_power_zones(df, power_zones_list=power, power_zones_df=power_zones_df):
     fig1.update_layout(title='Time spent in each power zone', xaxis_title='', yaxis_title='', height=600)
 
     # Create table with time and percentage for each power zone
-    zone_labels = ['Zone ' + str(i) for i in range(1, 20)]
-    zone_from =  [f"{zone['lower']}" for _, zone in power_zones_df.iterrows()]
-    zone_to =  [f"{zone['upper']}" for _, zone in power_zones_df.iterrows()]
-    zone_percentages = [power_zones['time_z{}'.format(i)].iloc[0] * 100 for i in range(1, 20)]
+    zone_labels = ['Zone ' + str(i) for i in range(1, len(power_zones) + 1)]
+    zone_from =  [f"{lower:g}" for lower in power_zones['lower']]
+    zone_to =  [f"{upper:g}" for upper in power_zones['upper']]
+    zone_percentages = list(power_zones['share'] * 100)
     zone_percentages_str = [f"{p:.1f}%" for p in zone_percentages]
     table_data = {
         'Zone': zone_labels,
@@ -478,7 +556,7 @@ def plot_power_zones(df, power_zones_list=power, power_zones_df=power_zones_df):
 
     return fig
 
-def plot_power_curve(df_activity_visual, df_data):
+def plot_power_curve(df_activity_visual, df_data, curve=None):
     """
     Plots the Power Curve for a given ride.
 
@@ -487,32 +565,22 @@ def plot_power_curve(df_activity_visual, df_data):
     df_activity_visual: pandas DataFrame
         DataFrame with the activity details including 'Durée de déplacement' column in minutes.
     df_data: pandas DataFrame
-        DataFrame with the activity data including 'timestamp' and 'activity_id' columns.
+        DataFrame with the activity data including 'timestamp' and 'power' columns.
+    curve: pandas Series
+        Mean-maximal power curve of the activity from mean_maximal_power, computed from df_data when not given.
 
     Returns:
     --------
     None: plots a line graph of the Power Curve with a table.
     """
+    import plotly.express as px
 
-    # Step 2: Convert the ride duration from minutes to seconds
-    ride_duration = df_activity_visual['Durée de déplacement'] * 60
-
-    # Step 3: Calculate the rolling average power for each time period
-    df_data['timestamp'] = pd.to_datetime(df_data['timestamp'])
-    data_rolling = df_data.copy()
-    data_rolling.set_index('timestamp', inplace=True)
+    # Best average power of every duration of a log-spaced grid up to the ride length
+    if curve is None:
+        curve = mean_maximal_power(df_data)
 
-    # Resample the data to 1-second intervals
-    data_rolling = data_rolling.resample('1S').mean()
-
-    rolling_periods = [1, 2, 3, 5, 10, 20, 30, 60, 120, 300, 600, 1200, 1800, 3600, 7200]
-    rolling_power = {p: data_rolling['power'].rolling(window=p, min_periods=1).mean() for p in rolling_periods}
-
-    # Step 4: Find the maximum rolling average power for each time period
-    max_rolling_power = [rp.max() for rp in rolling_power.values()]
-
-    # Step 5: Plot the results in a line graph
-    fig = px.line(x=rolling_periods, y=max_rolling_power, log_x=True, labels={
+    # Plot the results in a line graph
+    fig = px.line(x=curve.index, y=curve.to_numpy(), log_x=True, labels={
                   'x': 'Time (seconds)', 'y': 'Power (watts)'})
     
     # set the line color to light grey
@@ -520,7 +588,7 @@ def plot_power_curve(df_activity_visual, df_data):
 
     # Format x-axis with time
     fig.update_xaxes(
-        tickvals=[1, 2, 3, 5, 10, 20, 30, 60, 120, 300, 600, 1200, 3600, 7200],
+        tickvals=POWER_CURVE_DURATIONS,
         ticktext=['00:01', '00:02', '00:03', '00:05', '00:10', '00:20', '00:30', '01:00', '02:00', '05:00', '10:00', '20:00', '30:00', '1:00:00', '2:00:00'],
         tickangle=0,
         dtick=1
@@ -536,70 +604,46 @@ def plot_power_curve(df_activity_visual, df_data):
 
 ####################################################################### CADENCE ##############################################################
 
-def calculate_time_in_cadence_zones(df_activity_visual, cadence_zones=cadence):
+def calculate_time_in_cadence_zones(df_activity_visual, cadence_zones=cadence_zone_table, weighting='samples', max_gap=10):
     """
     Calculate the time spent in each cadence zone for each activity and add the results as columns.
     
     Args:
     - df_activity_visual (pandas.DataFrame): A DataFrame containing information about the activity.
-    -cadence_zones (list): list of cadence zones
+    - cadence_zones (ZoneTable, dict or pandas.DataFrame): cadence zones, see zone_table. Default is cadence_zone_table.
+    - weighting (str): 'samples' (default) counts every sample once, 'time' weights each sample by the time elapsed
+      until the next one (see sample_weights).
+    - max_gap (float): Maximum weight of a sample in seconds with the 'time' weighting. Default is 10.
     
     Returns:
     - df_activity_visual (pandas.DataFrame): The original DataFrame with new columns for the time spent in each cadence zone.
     """
+    return _calculate_time_in_channel_zones(df_activity_visual, cadence_zones, 'cadence', weighting, max_gap)
 
-    
-    # Loop through the rows in df and calculate time spent in each zone for the corresponding activity
-    for index, row in df_activity_visual.iterrows():
-        
-        # Extract activity id from the file name column
-        if "Nom du fichier" in row:
-            activity_num = str(row["Nom du fichier"]).split("/")[-1].split(".")[0]
-            # Load the activity data
-            activity_file = f"data/activities_csv/{activity_num}.csv"
-        else:
-            activity_num = row['nom']
-            activity_file = f"data/activities_csv/{activity_num}.csv"
-            
-        csv_data = pd.read_csv(activity_file)
-        
-        # Calculate the time spent in each zone
-        time_in_zone = {zone: 0 for zone in cadence_zones}
-        for _, row in csv_data.iterrows():
-            cadence = row["cadence"]
-            for zone, (lower, upper) in cadence_zones.items():
-                if lower <= cadence < upper:
-                    time_in_zone[zone] += 1
-        
-        # Calculate the percentage of time spent in each zone
-        total_time = len(csv_data)
-        percent_time_in_zone = {zone: round(time / total_time, 4) for zone, time in time_in_zone.items()}
-        
-        # Add new columns with time spent in each zone to df_activity_visual
-        for zone, percent_time in percent_time_in_zone.items():
-            column_name = f"time_{zone.lower()}"
-            df_activity_visual.loc[index, column_name] = percent_time
-    
-    return df_activity_visual
 
-
-def plot_cadence_zones(df_activity_visual, cadence_zones=cadence, cadence_zones_df=cadence_zones_df):
+def plot_cadence_zones(df_activity_visual, cadence_zones=cadence_zone_table, cadence_zones_df=None, histograms=None):
     """
     Plots a bar chart of the time spent in each cadence zone, with a table of the time spent and percentage of time spent
     in each zone.
 
     Args:
-        cadence_zones (pd.DataFrame): DataFrame with the activity data and the calculated time spent in each zone.
-        cadence_zones_df (pd.DataFrame): DataFrame containing cadence zone data, including zone name, lower and upper bounds.
+        df_activity_visual (pd.DataFrame): DataFrame with the activity data.
+        cadence_zones (ZoneTable, dict or pd.DataFrame): cadence zones, see zone_table. Default is cadence_zone_table.
+        cadence_zones_df (pd.DataFrame): cadence zones with the zone, lower and upper columns, used instead of cadence_zones when given.
+        histograms (pd.DataFrame): zone histograms of the activity from activity_zone_histograms or zone_histograms,
+            computed from the activity file when not given.
 
     Returns:
         visuals
     """
+    import plotly.graph_objects as go
+    import plotly.subplots as sp
+    zones = zone_table(cadence_zones if cadence_zones_df is None else cadence_zones_df)
     #Create time in cadence zones df 
-    cadence_zones = calculate_time_in_cadence_zones(df_activity_visual, cadence_zones)
+    cadence_zones = _channel_histogram(df_activity_visual, 'cadence', zones, histograms)
 
     # Multiply the zone times by the duration to get the total time in each zone
-    zone_times = [cadence_zones['Durée de déplacement'].iloc[0] *cadence_zones['time_z{}'.format(i)].iloc[0] for i in range(1, 26)]
+    zone_times = list(df_activity_visual['Durée de déplacement'].iloc[0] * cadence_zones['share'])
 
     # Create a list of formatted time strings
     time_strings = []
@@ -610,7 +654,7 @@ def plot_cadence_zones(df_activity_visual, cadence_zones=cadence, cadence_zones_
     time_strings
 
     #Create a list of zone labels for hover text
-    zone_names = [f"Z{i+1}: {zone['lower']}-{zone['upper']} bpm" for i, zone in cadence_zones_df.iterrows()]
+    zone_names = [f"{zone}: {zone_range} bpm" for zone, zone_range in zip(cadence_zones['zone'], cadence_zones['range'])]
 
     # Create a bar plot of the time spent in each cadence zone using plotly
     fig1 = go.Figure(data=[go.Bar(
@@ -624,10 +668,10 @@ def plot_cadence_zones(df_activity_visual, cadence_zones=cadence, cadence_zones_
     fig1.update_layout(title='Time spent in each cadence zone', xaxis_title='', yaxis_title='', height=600)
 
     # Create table with time and percentage for each cadence zone
-    zone_labels = ['Zone ' + str(i) for i in range(1, 26)]
-    zone_from =  [f"{zone['lower']}" for _, zone in cadence_zones_df.iterrows()]
-    zone_to =  [f"{zone['upper']}" for _, zone in cadence_zones_df.iterrows()]
-    zone_percentages = [cadence_zones['time_z{}'.format(i)].iloc[0] * 100 for i in range(1, 26)]
+    zone_labels = ['Zone ' + str(i) for i in range(1, len(cadence_zones) + 1)]
+    zone_from =  [f"{lower:g}" for lower in cadence_zones['lower']]
+    zone_to =  [f"{upper:g}" for upper in cadence_zones['upper']]
+    zone_percentages = list(cadence_zones['share'] * 100)
     zone_percentages_str = [f"{p:.1f}%" for p in zone_percentages]
     table_data = {
         'Zone': zone_labels,
@@ -665,69 +709,45 @@ def plot_cadence_zones(df_activity_visual, cadence_zones=cadence, cadence_zones_
     return fig
 
 ############################################################ ELEVATION ################################################################
-def calculate_time_in_elevation_zones(df, elevation_zones=elevation):
+def calculate_time_in_elevation_zones(df, elevation_zones=elevation_zone_table, weighting='samples', max_gap=10):
     """
     Calculate the time spent in each elevation zone for each activity and add the results as columns.
     
     Args:
     - df (pandas.DataFrame): A DataFrame containing information about the activity.
-    -elevation_zones (list): list of elevation zones
+    - elevation_zones (ZoneTable, dict or pandas.DataFrame): elevation zones, see zone_table. Default is elevation_zone_table.
+    - weighting (str): 'samples' (default) counts every sample once, 'time' weights each sample by the time elapsed
+      until the next one (see sample_weights).
+    - max_gap (float): Maximum weight of a sample in seconds with the 'time' weighting. Default is 10.
     
     Returns:
     - df (pandas.DataFrame): The original DataFrame with new columns for the time spent in each elevation zone.
     """
+    return _calculate_time_in_channel_zones(df, elevation_zones, 'altitude', weighting, max_gap)
 
-    
-    # Loop through the rows in df and calculate time spent in each zone for the corresponding activity
-    for index, row in df.iterrows():
-        
-        # Extract activity id from the file name column
-        if "Nom du fichier" in row:
-            activity_num = str(row["Nom du fichier"]).split("/")[-1].split(".")[0]
-            # Load the activity data
-            activity_file = f"data/activities_csv/{activity_num}.csv"
-        else:
-            activity_num = row['nom']
-            activity_file = f"data/activities_csv/{activity_num}.csv"
-            
-        csv_data = pd.read_csv(activity_file)
-        
-        # Calculate the time spent in each zone
-        time_in_zone = {zone: 0 for zone in elevation_zones}
-        for _, row in csv_data.iterrows():
-            elevation = row["altitude"]
-            for zone, (lower, upper) in elevation_zones.items():
-                if lower <= elevation < upper:
-                    time_in_zone[zone] += 1
-        
-        # Calculate the percentage of time spent in each zone
-        total_time = len(csv_data)
-        percent_time_in_zone = {zone: round(time / total_time, 4) for zone, time in time_in_zone.items()}
-        
-        # Add new columns with time spent in each zone to df
-        for zone, percent_time in percent_time_in_zone.items():
-            column_name = f"time_{zone.lower()}"
-            df.loc[index, column_name] = percent_time
-    
-    return df
-
-def plot_elevation_zones(df, elevation_zones=elevation, elevation_zones_df=elevation_zones_df):
+def plot_elevation_zones(df, elevation_zones=elevation_zone_table, elevation_zones_df=None, histograms=None):
     """
     Plots a bar chart of the time spent in each elevation zone, with a table of the time spent and percentage of time spent
     in each zone.
 
     Args:
-        elevation_zones (pd.DataFrame): DataFrame with the activity data and the calculated time spent in each zone.
-        elevation_zones_df (pd.DataFrame): DataFrame containing elevation zone data, including zone name, lower and upper bounds.
+        df (pd.DataFrame): DataFrame with the activity data.
+        elevation_zones (ZoneTable, dict or pd.DataFrame): elevation zones, see zone_table. Default is elevation_zone_table.
+        elevation_zones_df (pd.DataFrame): elevation zones with the zone, lower and upper columns, used instead of elevation_zones when given.
+        histograms (pd.DataFrame): zone histograms of the activity from activity_zone_histograms or zone_histograms,
+            computed from the activity file when not given.
 
     Returns:
         visuals
     """
+    import plotly.graph_objects as go
+    import plotly.subplots as sp
+    zones = zone_table(elevation_zones if elevation_zones_df is None else elevation_zones_df)
     #Create time in elevation zones df 
-    elevation_zones = calculate_time_in_elevation_zones(df, elevation_zones)
+    elevation_zones = _channel_histogram(df, 'elevation', zones, histograms)
 
     # Multiply the zone times by the duration to get the total time in each zone
-    zone_times = [elevation_zones['Durée de déplacement'].iloc[0] *elevation_zones['time_z{}'.format(i)].iloc[0] for i in range(1, 18)]
+    zone_times = list(df['Durée de déplacement'].iloc[0] * elevation_zones['share'])
 
     # Create a list of formatted time strings
     time_strings = []
@@ -738,7 +758,7 @@ def plot_elevation_zones(df, elevation_zones=elevation, elevation_zones_df=eleva
     time_strings
 
     #Create a list of zone labels for hover text
-    zone_names = [f"Z{i+1}: {zone['lower']}-{zone['upper']} m" for i, zone in elevation_zones_df.iterrows()]
+    zone_names = [f"{zone}: {zone_range} m" for zone, zone_range in zip(elevation_zones['zone'], elevation_zones['range'])]
 
     # Create a bar plot of the time spent in each elevation zone using plotly
     fig1 = go.Figure(data=[go.Bar(
@@ -752,10 +772,10 @@ def plot_elevation_zones(df, elevation_zones=elevation, elevation_zones_df=eleva
     fig1.update_layout(title='Time spent in each elevation zone', xaxis_title='', yaxis_title='', height=600)
 
     # Create table with time and percentage for each elevation zone
-    zone_labels = ['Zone ' + str(i) for i in range(1, 18)]
-    zone_from =  [f"{zone['lower']}" for _, zone in elevation_zones_df.iterrows()]
-    zone_to =  [f"{zone['upper']}" for _, zone in elevation_zones_df.iterrows()]
-    zone_percentages = [elevation_zones['time_z{}'.format(i)].iloc[0] * 100 for i in range(1, 18)]
+    zone_labels = ['Zone ' + str(i) for i in range(1, len(elevation_zones) + 1)]
+    zone_from =  [f"{lower:g}" for lower in elevation_zones['lower']]
+    zone_to =  [f"{upper:g}" for upper in elevation_zones['upper']]
+    zone_percentages = list(elevation_zones['share'] * 100)
     zone_percentages_str = [f"{p:.1f}%" for p in zone_percentages]
     table_data = {
         'Zone': zone_labels,
@@ -802,6 +822,7 @@ def plot_elevation_profile(df):
     Returns:
     None: Displays the plot in the console.
     """
+    import plotly.graph_objects as go
     df_elevation = df.sort_values('distance')
     # convert timestamp to datetime object
     df_elevation['timestamp'] = pd.to_datetime(df_elevation['timestamp'])
@@ -838,70 +859,46 @@ def plot_elevation_profile(df):
 
 ############################################################ GRADE ################################################################
 
-def calculate_time_in_grade_zones(df, grade_zones=grade):
+def calculate_time_in_grade_zones(df, grade_zones=grade_zone_table, weighting='samples', max_gap=10):
     """
     Calculate the time spent in each grade zone for each activity and add the results as columns.
     
     Args:
     - df (pandas.DataFrame): A DataFrame containing information about the activity.
-    -grade_zones (list): list of grade zones
+    - grade_zones (ZoneTable, dict or pandas.DataFrame): grade zones, see zone_table. Default is grade_zone_table.
+    - weighting (str): 'samples' (default) counts every sample once, 'time' weights each sample by the time elapsed
+      until the next one (see sample_weights).
+    - max_gap (float): Maximum weight of a sample in seconds with the 'time' weighting. Default is 10.
     
     Returns:
     - df (pandas.DataFrame): The original DataFrame with new columns for the time spent in each grade zone.
     """
-
-    
-    # Loop through the rows in df and calculate time spent in each zone for the corresponding activity
-    for index, row in df.iterrows():
-        
-        # Extract activity id from the file name column
-        if "Nom du fichier" in row:
-            activity_num = str(row["Nom du fichier"]).split("/")[-1].split(".")[0]
-            # Load the activity data
-            activity_file = f"data/activities_csv/{activity_num}.csv"
-        else:
-            activity_num = row['nom']
-            activity_file = f"data/activities_csv/{activity_num}.csv"
-            
-        csv_data = pd.read_csv(activity_file)
-        
-        # Calculate the time spent in each zone
-        time_in_zone = {zone: 0 for zone in grade_zones}
-        for _, row in csv_data.iterrows():
-            grade = row["grade"]
-            for zone, (lower, upper) in grade_zones.items():
-                if lower <= grade < upper:
-                    time_in_zone[zone] += 1
-        
-        # Calculate the percentage of time spent in each zone
-        total_time = len(csv_data)
-        percent_time_in_zone = {zone: round(time / total_time, 4) for zone, time in time_in_zone.items()}
-        
-        # Add new columns with time spent in each zone to df
-        for zone, percent_time in percent_time_in_zone.items():
-            column_name = f"time_{zone.lower()}"
-            df.loc[index, column_name] = percent_time
-    
-    return df
+    return _calculate_time_in_channel_zones(df, grade_zones, 'grade', weighting, max_gap)
 
 
-def plot_grade_zones(df, grade_zones=grade, grade_zones_df=grade_zones_df):
+def plot_grade_zones(df, grade_zones=grade_zone_table, grade_zones_df=None, histograms=None):
     """
     Plots a bar chart of the time spent in each grade zone, with a table of the time spent and percentage of time spent
     in each zone.
 
     Args:
-        grade_zones (pd.DataFrame): DataFrame with the activity data and the calculated time spent in each zone.
-        grade_zones_df (pd.DataFrame): DataFrame containing grade zone data, including zone name, lower and upper bounds.
+        df (pd.DataFrame): DataFrame with the activity data.
+        grade_zones (ZoneTable, dict or pd.DataFrame): grade zones, see zone_table. Default is grade_zone_table.
+        grade_zones_df (pd.DataFrame): grade zones with the zone, lower and upper columns, used instead of grade_zones when given.
+        histograms (pd.DataFrame): zone histograms of the activity from activity_zone_histograms or zone_histograms,
+            computed from the activity file when not given.
 
     Returns:
         visuals
     """
+    import plotly.graph_objects as go
+    import plotly.subplots as sp
+    zones = zone_table(grade_zones if grade_zones_df is None else grade_zones_df)
     #Create time in grade zones df 
-    grade_zones = calculate_time_in_grade_zones(df, grade_zones)
+    grade_zones = _channel_histogram(df, 'grade', zones, histograms)
 
     # Multiply the zone times by the duration to get the total time in each zone
-    zone_times = [grade_zones['Durée de déplacement'].iloc[0] *grade_zones['time_z{}'.format(i)].iloc[0] for i in range(1, 31)]
+    zone_times = list(df['Durée de déplacement'].iloc[0] * grade_zones['share'])
 
     # Create a list of formatted time strings
     time_strings = []
@@ -912,7 +909,7 @@ def plot_grade_zones(df, grade_zones=grade, grade_zones_df=grade_zones_df):
     time_strings
 
     #Create a list of zone labels for hover text
-    zone_names = [f"Z{i+1}: {zone['lower']}-{zone['upper']} %" for i, zone in grade_zones_df.iterrows()]
+    zone_names = [f"{zone}: {zone_range} %" for zone, zone_range in zip(grade_zones['zone'], grade_zones['range'])]
 
     # Create a bar plot of the time spent in each grade zone using plotly
     fig1 = go.Figure(data=[go.Bar(
@@ -926,10 +923,10 @@ def plot_grade_zones(df, grade_zones=grade, grade_zones_df=grade_zones_df):
     fig1.update_layout(title='Time spent in each grade zone', xaxis_title='', yaxis_title='', height=600)
 
     # Create table with time and percentage for each grade zone
-    zone_labels = ['Zone ' + str(i) for i in range(1, 31)]
-    zone_from =  [f"{zone['lower']}" for _, zone in grade_zones_df.iterrows()]
-    zone_to =  [f"{zone['upper']}" for _, zone in grade_zones_df.iterrows()]
-    zone_percentages = [grade_zones['time_z{}'.format(i)].iloc[0] * 100 for i in range(1, 31)]
+    zone_labels = ['Zone ' + str(i) for i in range(1, len(grade_zones) + 1)]
+    zone_from =  [f"{lower:g}" for lower in grade_zones['lower']]
+    zone_to =  [f"{upper:g}" for upper in grade_zones['upper']]
+    zone_percentages = list(grade_zones['share'] * 100)
     zone_percentages_str = [f"{p:.1f}%" for p in zone_percentages]
     table_data = {
         'Zone': zone_labels,